@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import crud
+import tenants
+import writer
+from connection import POOL_SIZE
+from metrics import DB_CALL_DURATION, DB_QUEUE_WAIT
+from passwords import hash_password_async
+from records import USERS
+from snapshot import on_snapshot
+
+"""Async front end for crud.py used by the FastAPI endpoints"""
+# DB_MODE picks how blocking crud calls are run from async endpoints:
+#   "async" - on a dedicated DB executor with one thread per pooled
+#             connection, so DB work never competes with the shared
+#             request threadpool and never waits on the pool
+#   "sync"  - on the default request threadpool, the same as plain def
+#             endpoints; kept so the two modes can be benchmarked
+DB_MODES = ("async", "sync")
+DB_MODE = os.environ.get("DB_MODE", "async")
+DB_EXECUTOR_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", POOL_SIZE))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def set_db_mode(mode: str):
+    global DB_MODE
+    if mode not in DB_MODES:
+        raise ValueError(f"DB_MODE must be one of {DB_MODES}")
+    DB_MODE = mode
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS,
+                                       thread_name_prefix="db")
+    return _executor
+
+
+def shutdown_executor():
+    """
+    Waits for queued DB work to finish. Blocks; the app lifespan runs it in
+    a worker thread.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _timed(func: Callable, queued: float, *args, **kwargs) -> Any:
+    started = time.perf_counter()
+    DB_QUEUE_WAIT.observe(started - queued)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        DB_CALL_DURATION.observe(time.perf_counter() - started,
+                                 func.__name__)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking crud function without blocking the event loop."""
+    queued = time.perf_counter()
+    if DB_MODE == "sync":
+        return await run_in_threadpool(_timed, func, queued, *args, **kwargs)
+    # Carry the request's context (e.g. validation_scope) into the worker
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), partial(context.run, _timed, func, queued, *args,
+                                **kwargs))
+
+
+def _async(func: Callable) -> Callable:
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def _queued(func: Callable) -> Callable:
+    """
+    Like _async, but for frequent small writes: they go through the single
+    writer lane, which commits concurrent writes together (see writer.py).
+    Raises writer.WriteQueueFull when too many writes are waiting.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not writer.WRITE_LANE:
+            return await run_db(func, *args, **kwargs)
+        return await asyncio.wrap_future(
+            writer.get_write_lane().submit(func, *args, **kwargs))
+    return wrapper
+
+
+async def create_user(name: str, email: str, password: str, role: str):
+    # Reject bad input before spending a hash on it
+    error = USERS.validate({"name": name, "email": email, "role": role})
+    if error:
+        return {"error": error}
+    # Hash in the password pool first so no DB thread waits on the KDF
+    password_hash = await hash_password_async(password)
+    return await run_db(crud.create_user, name, email, None, role,
+                        password_hash)
+
+
+async def update_user(user_id: int, name: str = None, email: str = None,
+                      role: str = None, password: str = None):
+    values = {key: value for key, value in
+              (("name", name), ("email", email), ("role", role))
+              if value is not None}
+    if not values and not password:
+        return {"error": "No fields to update"}
+    error = USERS.validate(values)
+    if error:
+        return {"error": error}
+    password_hash = await hash_password_async(password) if password \
+        else None
+    return await run_db(crud.update_user, user_id, name, email, role,
+                        password_hash=password_hash)
+
+
+bulk_create_users = _async(crud.bulk_create_users)
+get_user_by_id = _async(crud.get_user_by_id)
+get_all_users = _async(crud.get_all_users)
+delete_user = _async(crud.delete_user)
+get_login = _async(crud.get_login)
+replace_password_hash = _async(crud.replace_password_hash)
+
+create_student = _async(crud.create_student)
+bulk_create_students = _async(crud.bulk_create_students)
+get_student_by_id = _async(crud.get_student_by_id)
+get_students_by_teacher = _async(crud.get_students_by_teacher)
+get_students_by_parent = _async(crud.get_students_by_parent)
+get_all_students = _async(crud.get_all_students)
+update_student = _queued(crud.update_student)
+delete_student = _async(crud.delete_student)
+
+create_homework = _async(crud.create_homework)
+get_homework_by_id = _async(crud.get_homework_by_id)
+update_homework = _queued(crud.update_homework)
+delete_homework = _async(crud.delete_homework)
+get_homework_covering = _async(crud.get_homework_covering)
+get_homework_overlapping = _async(crud.get_homework_overlapping)
+get_homework_within = _async(crud.get_homework_within)
+
+create_assignment = _async(crud.create_assignment)
+assign_to_roster = _async(crud.assign_to_roster)
+get_assignment = _async(crud.get_assignment)
+get_student_homework = _async(crud.get_student_homework)
+get_assigned_students = _async(crud.get_assigned_students)
+get_homework_completion = _async(on_snapshot(crud.get_homework_completion))
+update_assignment = _queued(crud.update_assignment)
+delete_assignment = _async(crud.delete_assignment)
+get_student_coverage = _async(crud.get_student_coverage)
+get_classroom_coverage = _async(on_snapshot(crud.get_classroom_coverage))
+get_teacher_summary = _async(crud.get_teacher_summary)
+get_status_summary = _async(crud.get_status_summary)
+
+create_task = _async(crud.create_task)
+get_task_by_id = _async(crud.get_task_by_id)
+update_task = _queued(crud.update_task)
+delete_task = _async(crud.delete_task)
+set_status = _queued(crud.set_status)
+
+search = _async(crud.search)
+
+get_entity_versions = _async(crud.get_entity_versions)
+get_changes = _async(crud.get_changes)
+
+# Admin queries across every school's database
+create_school = _async(tenants.create_school)
+get_school_totals = _async(tenants.get_school_totals)
+find_users_by_email = _async(tenants.find_users_by_email)
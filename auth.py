@@ -0,0 +1,101 @@
+import os
+import secrets
+from typing import Any, Dict, Optional
+
+import async_crud as db
+from cache import LRUCache
+from passwords import HashingBusy, fingerprint, hash_password_async, \
+    is_hashed, needs_rehash, verify_password_async
+from tenants import current_tenant
+
+"""Sign-in and short-lived sessions"""
+# A successful sign-in remembers a keyed digest of the password next to the
+# stored hash it matched, so signing in again within VERIFIED_TTL costs an
+# HMAC instead of a scrypt run. Keying on the stored hash means a password
+# change makes the old entry unreachable without explicit invalidation.
+# Sessions are opaque random tokens kept in memory for SESSION_TTL, each
+# bound to the school it was opened for.
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 3600))
+VERIFIED_TTL = int(os.environ.get("VERIFIED_TTL", 300))
+
+SESSIONS = LRUCache(maxsize=100000, ttl=SESSION_TTL)
+VERIFIED = LRUCache(maxsize=100000, ttl=VERIFIED_TTL)
+
+# Per-process key for VERIFIED digests; never leaves memory
+_SECRET = secrets.token_bytes(32)
+# Checked against when an email is unknown, so a failed sign-in takes about
+# as long whether or not the account exists
+_dummy_hash: Optional[str] = None
+
+
+async def _check_unknown(password: str):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async(secrets.token_hex(16))
+    await verify_password_async(password, _dummy_hash)
+
+
+async def login(email: str, password: str) -> Optional[Dict[str, Any]]:
+    """
+    Verifies an email and password and opens a session.
+    Args:
+        email (str): User's email.
+        password (str): User's password.
+    Returns:
+        Optional[Dict[str, Any]]: Session token, lifetime and user details,
+            or None if the credentials are wrong.
+    Raises:
+        HashingBusy: Too many sign-ins are already being checked.
+    """
+    user = await db.get_login(email)
+    if user is None:
+        await _check_unknown(password)
+        return None
+    stored = user.pop("password")
+    school = current_tenant()
+    key = (school, user["id"], stored)
+    digest = fingerprint(_SECRET, stored, password)
+    if not is_hashed(stored) or VERIFIED.get(key) != digest:
+        if not await verify_password_async(password, stored):
+            return None
+        if needs_rehash(stored):
+            # Plaintext or outdated cost parameters: store a fresh hash
+            try:
+                new = await hash_password_async(password)
+            except HashingBusy:
+                # Upgrading can wait for the next sign-in
+                new = None
+            if new and await db.replace_password_hash(user["id"], stored,
+                                                      new):
+                key = (school, user["id"], new)
+                digest = fingerprint(_SECRET, new, password)
+        if is_hashed(key[2]):
+            VERIFIED.set(key, digest)
+
+    token = secrets.token_urlsafe(32)
+    SESSIONS.set(token, (school, user["id"]))
+    return {"token": token, "expires_in": SESSION_TTL, "user": user}
+
+
+async def get_session(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the signed-in user for a session token, or None if the token
+    is unknown, expired, was opened for another school, or the user has
+    been deleted.
+    """
+    session = SESSIONS.get(token)
+    if session is None:
+        return None
+    school, user_id = session
+    if school != current_tenant():
+        return None
+    # Served from the Users entity cache on the hot path
+    user = await db.get_user_by_id(user_id)
+    if "error" in user:
+        SESSIONS.invalidate(token)
+        return None
+    return user
+
+
+def logout(token: str):
+    SESSIONS.invalidate(token)
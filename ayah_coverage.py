@@ -0,0 +1,133 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from connection import MAX_SQL_PARAMS
+from quran import TOTAL_AYAHS, ordinal_to_ayah
+
+"""Memorization coverage as bitmaps over global ayah ordinals"""
+# Bit (ordinal - 1) is set when that ayah is covered. Bitmaps are handled as
+# Python ints, which makes union, intersection and popcount single C-level
+# operations, and stored as fixed-size little-endian BLOBs (780 bytes).
+BITMAP_BYTES = (TOTAL_AYAHS + 7) // 8
+FULL_MASK = (1 << TOTAL_AYAHS) - 1
+
+
+def range_mask(ordinal_start: int, ordinal_end: int) -> int:
+    """Bitmap with every ayah from ordinal_start to ordinal_end set."""
+    return ((1 << (ordinal_end - ordinal_start + 1)) - 1) << (ordinal_start
+                                                             - 1)
+
+
+def to_blob(mask: int) -> bytes:
+    return mask.to_bytes(BITMAP_BYTES, "little")
+
+
+def from_blob(blob: Optional[bytes]) -> int:
+    return int.from_bytes(blob, "little") if blob else 0
+
+
+def union(masks: Iterable[int]) -> int:
+    res = 0
+    for mask in masks:
+        res |= mask
+    return res
+
+
+def intersection(masks: Iterable[int]) -> int:
+    res = FULL_MASK
+    for mask in masks:
+        res &= mask
+    return res
+
+
+def popcount(mask: int) -> int:
+    return mask.bit_count()
+
+
+def remaining(mask: int) -> int:
+    """Ayahs not covered yet."""
+    return FULL_MASK & ~mask
+
+
+def to_ranges(mask: int) -> List[Dict[str, int]]:
+    """Describes a bitmap as a list of contiguous verse ranges."""
+    bits = format(mask, f"0{TOTAL_AYAHS}b")[::-1]
+    res = []
+    for run in re.finditer("1+", bits):
+        chapter_start, verse_start = ordinal_to_ayah(run.start() + 1)
+        chapter_end, verse_end = ordinal_to_ayah(run.end())
+        res.append({"chapter_start": chapter_start,
+                    "verse_start": verse_start, "chapter_end": chapter_end,
+                    "verse_end": verse_end})
+    return res
+
+
+def _save(cursor, masks: Dict[int, int]):
+    cursor.executemany(
+        """INSERT INTO StudentCoverage (student_id, bitmap, ayah_count)
+        VALUES (?, ?, ?)
+        ON CONFLICT (student_id) DO UPDATE SET bitmap = excluded.bitmap,
+        ayah_count = excluded.ayah_count""",
+        [(student_id, to_blob(mask), popcount(mask))
+         for student_id, mask in masks.items()])
+
+
+def add_homework(cursor, homework_id: int,
+                 student_ids: Optional[List[int]] = None):
+    """
+    Incrementally ORs a completed homework's range into the coverage of the
+    students it is assigned to (or only the given ones). Does nothing if
+    the homework is not completed.
+    """
+    sql = """SELECT a.student_id, c.bitmap, h.ordinal_start, h.ordinal_end
+    FROM Assignments a
+    JOIN Homework h ON h.id = a.homework_id
+    LEFT JOIN StudentCoverage c ON c.student_id = a.student_id
+    WHERE a.homework_id = ? AND h.status = 'completed'
+    AND h.ordinal_start IS NOT NULL"""
+    if student_ids is not None:
+        sql += f" AND a.student_id IN ({', '.join('?' * len(student_ids))})"
+    cursor.execute(sql, [homework_id] + list(student_ids or []))
+    masks = {}
+    for student_id, blob, start, end in cursor.fetchall():
+        masks[student_id] = (masks.get(student_id, from_blob(blob))
+                             | range_mask(start, end))
+    if masks:
+        _save(cursor, masks)
+
+
+def rebuild(cursor, student_ids: Optional[Iterable[int]] = None):
+    """
+    Recomputes coverage from scratch for the given students, or for every
+    student. Needed whenever a range can drop out of a student's coverage,
+    e.g. a homework goes back to pending or an assignment is deleted.
+    """
+    sql = """SELECT s.id, h.ordinal_start, h.ordinal_end
+    FROM Students s
+    LEFT JOIN Assignments a ON a.student_id = s.id
+    LEFT JOIN Homework h ON h.id = a.homework_id
+    AND h.status = 'completed' AND h.ordinal_start IS NOT NULL"""
+    if student_ids is None:
+        chunks: List[Tuple] = [()]
+    else:
+        ids = sorted(set(student_ids))
+        chunks = [tuple(ids[i:i + MAX_SQL_PARAMS])
+                  for i in range(0, len(ids), MAX_SQL_PARAMS)]
+    for chunk in chunks:
+        where = f" WHERE s.id IN ({', '.join('?' * len(chunk))})" \
+            if chunk else ""
+        cursor.execute(sql + where, chunk)
+        masks = {}
+        for student_id, start, end in cursor.fetchall():
+            mask = masks.get(student_id, 0)
+            if start is not None:
+                mask |= range_mask(start, end)
+            masks[student_id] = mask
+        if chunk:
+            # Students that no longer exist lose their coverage row
+            gone = set(chunk) - set(masks)
+            cursor.executemany("DELETE FROM StudentCoverage "
+                               "WHERE student_id = ?",
+                               [(student_id,) for student_id in gone])
+        if masks:
+            _save(cursor, masks)
@@ -0,0 +1 @@
+"""Synthetic data generation and benchmarks for crud.py and main.py"""
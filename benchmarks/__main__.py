@@ -0,0 +1,104 @@
+import argparse
+import os
+import sqlite3
+
+from connection import set_db_path
+
+from benchmarks.datagen import generate, table_sizes
+from benchmarks.report import build_report, compare, print_results, \
+    write_report
+
+"""
+Usage:
+    python -m benchmarks generate --scale 10000
+    python -m benchmarks micro --out results/micro.json
+    python -m benchmarks http --mode sync --baseline results/http.json
+
+Benchmarks run against bench.db by default, never the real database.
+"""
+DEFAULT_DB = "bench.db"
+
+
+def _scale_of(path: str) -> int:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM Students").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def _finish(report, args) -> int:
+    print_results(report["results"])
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        write_report(report, args.out)
+    if args.baseline:
+        regressions = compare(report, args.baseline, args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="create a synthetic database")
+    gen.add_argument("--scale", type=int, default=1000,
+                     help="number of students")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--db", default=DEFAULT_DB)
+
+    micro = commands.add_parser("micro", help="time every crud function")
+    micro.add_argument("--iterations", type=int, default=1000)
+    micro.add_argument("--only", nargs="*", help="benchmark names to run")
+
+    http = commands.add_parser("http", help="concurrent load on the API")
+    http.add_argument("--requests", type=int, default=5000)
+    http.add_argument("--concurrency", type=int, default=16)
+    http.add_argument("--mode", choices=("async", "sync"), default="async",
+                      help="DB_MODE for in-process runs")
+    http.add_argument("--url", help="base URL of a running server")
+
+    for command in (micro, http):
+        command.add_argument("--db", default=DEFAULT_DB)
+        command.add_argument("--seed", type=int, default=42)
+        command.add_argument("--out", help="write the JSON report here")
+        command.add_argument("--baseline",
+                             help="earlier JSON report to compare p95 with")
+        command.add_argument("--threshold", type=float, default=0.2,
+                             help="allowed p95 slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        sizes = generate(args.db, args.scale, args.seed)
+        for table, count in sizes.items():
+            print(f"{table}: {count}")
+        return 0
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist, run generate first")
+    set_db_path(args.db)
+    scale = _scale_of(args.db)
+
+    if args.command == "micro":
+        from benchmarks.micro import run_micro
+        results = run_micro(args.iterations, args.seed, args.only)
+        report = build_report("micro", results, scale=scale,
+                              iterations=args.iterations, seed=args.seed)
+    else:
+        import async_crud
+        from benchmarks.http_load import run_http
+        async_crud.set_db_mode(args.mode)
+        results = run_http(table_sizes(scale), args.requests,
+                           args.concurrency, args.seed, args.url)
+        report = build_report("http", results, scale=scale, mode=args.mode,
+                              requests=args.requests,
+                              concurrency=args.concurrency, seed=args.seed,
+                              url=args.url)
+    return _finish(report, args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+import os
+import random
+import time
+from typing import Dict
+
+import ayah_coverage
+from connection import get_db_connection, set_db_path
+from dataBase import migrate, rebuild_summaries
+from quran import SURAH_COUNT, SURAH_LENGTHS, ayah_ordinal
+
+"""Deterministic synthetic data for the real schema"""
+# scale is the number of students. Everything else is derived from it so a
+# given (scale, seed) always produces the same database.
+STUDENTS_PER_TEACHER = 30
+STUDENTS_PER_PARENT = 2
+STUDENTS_PER_HOMEWORK = 10
+STUDENTS_PER_TASK = 20
+ASSIGNMENTS_PER_STUDENT = 5
+DAY = 24 * 3600
+
+_CHUNK = 10000
+
+
+def table_sizes(scale: int) -> Dict[str, int]:
+    return {
+        "teachers": max(1, scale // STUDENTS_PER_TEACHER),
+        "parents": max(1, scale // STUDENTS_PER_PARENT),
+        "students": scale,
+        "homework": max(1, scale // STUDENTS_PER_HOMEWORK),
+        "tasks": max(1, scale // STUDENTS_PER_TASK),
+        "assignments": scale * ASSIGNMENTS_PER_STUDENT,
+    }
+
+
+def _verse_range(rng: random.Random):
+    chapter = rng.randint(1, SURAH_COUNT)
+    length = SURAH_LENGTHS[chapter - 1]
+    verse_start = rng.randint(1, length)
+    verse_end = min(length, verse_start + rng.randint(0, 20))
+    return chapter, verse_start, chapter, verse_end
+
+
+def generate(path: str, scale: int = 1000, seed: int = 42,
+             now: int = None) -> Dict[str, int]:
+    """
+    Creates a fresh database at path filled with synthetic users, students,
+    homework, tasks and assignments. Due dates spread 30 days either side of
+    now. Returns the number of rows written per table.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    set_db_path(path)
+    migrate()
+
+    rng = random.Random(seed)
+    now = int(time.time()) if now is None else now
+    sizes = table_sizes(scale)
+    teachers = sizes["teachers"]
+    parents = sizes["parents"]
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        # Users: admin first, then teachers, then parents
+        users = [("Admin", "admin@example.com", "password", "admin")]
+        users += [(f"Teacher {i}", f"teacher{i}@example.com", "password",
+                   "teacher") for i in range(teachers)]
+        users += [(f"Parent {i}", f"parent{i}@example.com", "password",
+                   "parent") for i in range(parents)]
+        cursor.executemany("INSERT INTO Users (name, email, password, role) "
+                           "VALUES (?, ?, ?, ?)", users)
+        teacher_ids = (2, 1 + teachers)
+        parent_ids = (2 + teachers, 1 + teachers + parents)
+
+        for start in range(0, scale, _CHUNK):
+            cursor.executemany(
+                "INSERT INTO Students (name, email, parent_id, teacher_id, "
+                "classroom) VALUES (?, ?, ?, ?, ?)",
+                [(f"Student {i}", f"student{i}@example.com",
+                  rng.randint(*parent_ids), teacher_ids[0] + i % teachers,
+                  f"Class {(i % teachers) % 3 + 1}")
+                 for i in range(start, min(scale, start + _CHUNK))])
+
+        homework = []
+        for i in range(sizes["homework"]):
+            chapter_start, verse_start, chapter_end, verse_end = \
+                _verse_range(rng)
+            homework.append((
+                f"Homework {i}", f"Memorize {chapter_start}:{verse_start}-"
+                                 f"{chapter_end}:{verse_end}",
+                chapter_start, chapter_end, verse_start, verse_end,
+                now + rng.randint(-30, 30) * DAY,
+                "completed" if rng.random() < 0.4 else "pending",
+                ayah_ordinal(chapter_start, verse_start),
+                ayah_ordinal(chapter_end, verse_end)))
+        cursor.executemany(
+            "INSERT INTO Homework (title, description, chapter_start, "
+            "chapter_end, verse_start, verse_end, due_date, status, "
+            "ordinal_start, ordinal_end) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", homework)
+
+        tasks = []
+        for i in range(sizes["tasks"]):
+            start_date = now + rng.randint(-30, 30) * DAY
+            tasks.append((f"Task {i}", f"Revision task {i}", start_date,
+                          start_date + rng.randint(1, 7) * DAY,
+                          "completed" if rng.random() < 0.3
+                          else "incomplete"))
+        cursor.executemany("INSERT INTO Tasks (title, description, "
+                           "start_date, end_date, status) "
+                           "VALUES (?, ?, ?, ?, ?)", tasks)
+
+        for start in range(0, sizes["assignments"], _CHUNK):
+            rows = []
+            for i in range(start, min(sizes["assignments"], start + _CHUNK)):
+                student_id = i // ASSIGNMENTS_PER_STUDENT + 1
+                if rng.random() < 0.8:
+                    rows.append((student_id,
+                                 rng.randint(1, sizes["homework"]), None))
+                else:
+                    rows.append((student_id, None,
+                                 rng.randint(1, sizes["tasks"])))
+            cursor.executemany("INSERT INTO Assignments (student_id, "
+                               "homework_id, task_id) VALUES (?, ?, ?)",
+                               rows)
+        ayah_coverage.rebuild(cursor)
+        connection.commit()
+    finally:
+        connection.close()
+    rebuild_summaries()
+    return sizes
@@ -0,0 +1,94 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.report import summarize
+
+"""Concurrent HTTP load against the FastAPI app"""
+# Without a base URL the app is driven in-process through TestClient, which
+# runs it on a single event loop like uvicorn does. With one, requests go to
+# a running server over the network instead.
+
+# (weight, name, method, path factory); paths get a random.Random and the
+# table sizes from datagen.table_sizes
+REQUEST_MIX: List[Tuple[int, str, str, Callable]] = [
+    (20, "get_user", "GET",
+     lambda rng, n: f"/users/{rng.randint(1, n['teachers'] + 1)}"),
+    (10, "list_users", "GET",
+     lambda rng, n: f"/users/?limit=100&after={rng.randint(0, n['parents'])}"),
+    (10, "list_students", "GET",
+     lambda rng, n: f"/students/?limit=100&after="
+                    f"{rng.randint(0, n['students'])}"),
+    (20, "student_homework", "GET",
+     lambda rng, n: f"/students/{rng.randint(1, n['students'])}/homework"),
+    (10, "student_coverage", "GET",
+     lambda rng, n: f"/students/{rng.randint(1, n['students'])}/coverage"),
+    (10, "homework_students", "GET",
+     lambda rng, n: f"/homework/{rng.randint(1, n['homework'])}/students"),
+    (5, "homework_covering", "GET",
+     lambda rng, n: f"/homework/covering?chapter=2&verse="
+                    f"{rng.randint(1, 286)}"),
+    (5, "homework_completion", "GET",
+     lambda rng, n: f"/homework/completion?teacher_id="
+                    f"{rng.randint(2, n['teachers'] + 1)}"),
+    (5, "teacher_summary", "GET",
+     lambda rng, n: f"/teachers/{rng.randint(2, n['teachers'] + 1)}/summary"),
+    (5, "update_user", "PUT",
+     lambda rng, n: f"/users/{rng.randint(1, n['teachers'] + 1)}"),
+]
+
+
+def _plan(requests: int, sizes: Dict[str, int], seed: int) -> List[tuple]:
+    rng = random.Random(seed)
+    weights = [weight for weight, *_ in REQUEST_MIX]
+    plan = []
+    for weight, name, method, path in rng.choices(REQUEST_MIX, weights,
+                                                  k=requests):
+        params = {"name": f"User {rng.random()}"} if method == "PUT" \
+            else None
+        plan.append((name, method, path(rng, sizes), params))
+    return plan
+
+
+def run_http(sizes: Dict[str, int], requests: int = 5000,
+             concurrency: int = 16, seed: int = 42, base_url: str = None)\
+        -> Dict[str, Dict[str, float]]:
+    """
+    Sends requests from the mix above with concurrency client threads.
+    Returns latency and throughput per request type plus an "all" entry.
+    """
+    plan = _plan(requests, sizes, seed)
+    if base_url:
+        import httpx
+        client = httpx.Client(base_url=base_url, limits=httpx.Limits(
+            max_connections=concurrency))
+    else:
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+
+    def send(item):
+        name, method, path, params = item
+        began = time.perf_counter()
+        response = client.request(method, path, params=params)
+        return name, time.perf_counter() - began, response.status_code
+
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    with client:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for name, latency, status in executor.map(send, plan):
+                latencies.setdefault(name, []).append(latency)
+                if status >= 400:
+                    errors[name] = errors.get(name, 0) + 1
+        elapsed = time.perf_counter() - start
+
+    results = {name: dict(summarize(values, elapsed),
+                          errors=errors.get(name, 0))
+               for name, values in sorted(latencies.items())}
+    results["all"] = dict(summarize([v for values in latencies.values()
+                                     for v in values], elapsed),
+                          errors=sum(errors.values()))
+    return results
@@ -0,0 +1,204 @@
+import random
+import time
+from typing import Callable, Dict, List
+
+import crud
+from connection import get_db_connection
+from passwords import hash_password
+
+from benchmarks.report import summarize
+
+"""Micro-benchmarks for every crud.py function"""
+# Each benchmark is a factory that takes a random.Random and returns the
+# arguments for one call, so runs are repeatable for a given seed. Write
+# benchmarks that create rows come before the ones that delete them, and
+# the deletes remove exactly the rows the creates added. Getters behind a
+# read_through cache are timed without it, so they measure the query
+# rather than a dict copy out of the cache.
+
+
+def _max_ids() -> Dict[str, int]:
+    connection = get_db_connection()
+    try:
+        return {table: connection.execute(
+            f"SELECT COALESCE(MAX(id), 1) FROM {table}").fetchone()[0]
+            for table in ("Users", "Students", "Homework", "Tasks",
+                          "Assignments")}
+    finally:
+        connection.close()
+
+
+def _teacher_and_parent() -> Dict[str, int]:
+    connection = get_db_connection()
+    try:
+        return dict(connection.execute(
+            "SELECT role, MIN(id) FROM Users WHERE role IN "
+            "('teacher', 'parent') GROUP BY role").fetchall())
+    finally:
+        connection.close()
+
+
+def _created_ids(table: str, column: str, prefix: str) -> List[int]:
+    connection = get_db_connection()
+    try:
+        return [row[0] for row in connection.execute(
+            f"SELECT id FROM {table} WHERE {column} LIKE ? ORDER BY id",
+            (prefix + "%",))]
+    finally:
+        connection.close()
+
+
+def _uncached(func: Callable) -> Callable:
+    """The function under a read_through cache, or func itself."""
+    return func.__wrapped__ if hasattr(func, "cache") else func
+
+
+def benchmarks(run_id: str) -> List[tuple]:
+    """
+    Returns (name, function, argument factory) triples. Factories get a
+    random.Random and a dict of id ranges and leftover ids to delete.
+    """
+    def rid(table):
+        return lambda rng, ids: rng.randint(1, ids[table])
+
+    counter = iter(range(10 ** 9))
+    # Hashed once up front so create_user measures the database work only
+    password_hash = hash_password("password")
+    return [
+        ("create_user", crud.create_user, lambda rng, ids: (
+            f"Bench {run_id}", f"bench-{run_id}-{next(counter)}@example.com",
+            "password", "parent", password_hash)),
+        ("get_user_by_id", crud.get_user_by_id,
+         lambda rng, ids: (rid("Users")(rng, ids),)),
+        ("get_all_users", crud.get_all_users,
+         lambda rng, ids: (100, rid("Users")(rng, ids))),
+        ("update_user", crud.update_user,
+         lambda rng, ids: (rid("Users")(rng, ids), f"User {rng.random()}")),
+        ("validate_ids", crud.validate_ids, None),
+        ("create_student", crud.create_student, lambda rng, ids: (
+            f"Bench {run_id}", f"bench-{run_id}-{next(counter)}@example.com",
+            "password", ids["parent"], ids["teacher"], "Bench")),
+        ("get_student_by_id", crud.get_student_by_id,
+         lambda rng, ids: (rid("Students")(rng, ids),)),
+        ("get_students_by_teacher", crud.get_students_by_teacher,
+         lambda rng, ids: (ids["teacher"],)),
+        ("get_students_by_parent", crud.get_students_by_parent,
+         lambda rng, ids: (ids["parent"],)),
+        ("get_all_students", crud.get_all_students,
+         lambda rng, ids: (100, rid("Students")(rng, ids))),
+        ("update_student", crud.update_student, None),
+        ("create_homework", crud.create_homework, lambda rng, ids: (
+            f"bench-{run_id}", "Benchmark homework", 2, 2, 1, 10,
+            int(time.time()) + 86400)),
+        ("get_homework_by_id", crud.get_homework_by_id,
+         lambda rng, ids: (rid("Homework")(rng, ids),)),
+        ("update_homework", crud.update_homework, None),
+        ("get_homework_covering", crud.get_homework_covering,
+         lambda rng, ids: (2, rng.randint(1, 286))),
+        ("get_assigned_students", crud.get_assigned_students,
+         lambda rng, ids: (rid("Homework")(rng, ids),)),
+        ("get_homework_completion", crud.get_homework_completion,
+         lambda rng, ids: (ids["teacher"],)),
+        ("create_task", crud.create_task, lambda rng, ids: (
+            f"bench-{run_id}", "Benchmark task", 0, 86400)),
+        ("get_task_by_id", crud.get_task_by_id,
+         lambda rng, ids: (rid("Tasks")(rng, ids),)),
+        ("update_task", crud.update_task, None),
+        ("create_assignment", crud.create_assignment,
+         lambda rng, ids: (rid("Students")(rng, ids),
+                           rid("Homework")(rng, ids))),
+        ("get_assignment", crud.get_assignment,
+         lambda rng, ids: (rid("Assignments")(rng, ids),)),
+        ("get_student_homework", crud.get_student_homework,
+         lambda rng, ids: (rid("Students")(rng, ids),)),
+        ("get_student_coverage", crud.get_student_coverage,
+         lambda rng, ids: (rid("Students")(rng, ids),)),
+        ("get_classroom_coverage", crud.get_classroom_coverage,
+         lambda rng, ids: (f"Class {rng.randint(1, 3)}", ids["teacher"])),
+        ("get_teacher_summary", crud.get_teacher_summary,
+         lambda rng, ids: (ids["teacher"],)),
+        ("get_status_summary", crud.get_status_summary,
+         lambda rng, ids: ()),
+        ("delete_assignment", crud.delete_assignment,
+         lambda rng, ids: (ids["delete"]["Assignments"].pop(),)),
+        ("delete_task", crud.delete_task,
+         lambda rng, ids: (ids["delete"]["Tasks"].pop(),)),
+        ("delete_homework", crud.delete_homework,
+         lambda rng, ids: (ids["delete"]["Homework"].pop(),)),
+        ("delete_student", crud.delete_student,
+         lambda rng, ids: (ids["delete"]["Students"].pop(),)),
+        ("delete_user", crud.delete_user,
+         lambda rng, ids: (ids["delete"]["Users"].pop(),)),
+    ]
+
+
+# Functions whose keyword arguments cannot be expressed as positional ones
+_KEYWORD_CALLS: Dict[str, Callable] = {
+    "validate_ids": lambda rng, ids: {
+        "student_id": rng.randint(1, ids["Students"]),
+        "teacher_id": ids["teacher"],
+        "homework_id": rng.randint(1, ids["Homework"])},
+    "update_student": lambda rng, ids: {
+        "student_id": rng.randint(1, ids["Students"]),
+        "name": f"Student {rng.random()}"},
+    "update_homework": lambda rng, ids: {
+        "homework_id": rng.randint(1, ids["Homework"]),
+        "title": f"Homework {rng.random()}"},
+    "update_task": lambda rng, ids: {
+        "task_id": rng.randint(1, ids["Tasks"]),
+        "title": f"Task {rng.random()}"},
+}
+
+
+def run_micro(iterations: int = 1000, seed: int = 42,
+              only: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """
+    Calls each crud function iterations times and reports latency
+    percentiles and throughput. Rows created along the way are deleted by
+    the matching delete benchmarks, leaving the database as it was.
+    """
+    rng = random.Random(seed)
+    run_id = f"{seed}-{int(time.time())}"
+    ids: Dict = _max_ids()
+    ids.update(_teacher_and_parent())
+    results = {}
+    for name, func, make_args in benchmarks(run_id):
+        if only and name not in only:
+            continue
+        func = _uncached(func)
+        if name.startswith("delete_") and "delete" not in ids:
+            assignments_before = ids["Assignments"]
+            ids["delete"] = {
+                "Users": _created_ids("Users", "email", f"bench-{run_id}"),
+                "Students": _created_ids("Students", "email",
+                                         f"bench-{run_id}"),
+                "Homework": _created_ids("Homework", "title",
+                                         f"bench-{run_id}"),
+                "Tasks": _created_ids("Tasks", "title", f"bench-{run_id}"),
+                "Assignments": [id_ for id_ in range(
+                    assignments_before + 1, _max_ids()["Assignments"] + 1)],
+            }
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            try:
+                if make_args is None:
+                    kwargs = _KEYWORD_CALLS[name](rng, ids)
+                    began = time.perf_counter()
+                    func(**kwargs)
+                else:
+                    args = make_args(rng, ids)
+                    began = time.perf_counter()
+                    func(*args)
+            except IndexError:
+                # Nothing left to delete
+                break
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - began)
+        results[name] = dict(summarize(latencies,
+                                       time.perf_counter() - start),
+                             errors=errors)
+    return results
@@ -0,0 +1,77 @@
+import json
+import platform
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Latency percentiles in milliseconds and throughput in ops/second."""
+    values = sorted(latencies)
+    return {
+        "n": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 4) if values
+        else 0.0,
+        "p50_ms": round(1000 * percentile(values, 0.50), 4),
+        "p95_ms": round(1000 * percentile(values, 0.95), 4),
+        "p99_ms": round(1000 * percentile(values, 0.99), 4),
+        "ops_per_sec": round(len(values) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def build_report(kind: str, results: Dict[str, Dict[str, float]],
+                 **meta) -> Dict[str, Any]:
+    return {
+        "kind": kind,
+        "meta": dict(meta, timestamp=int(time.time()),
+                     python=platform.python_version(),
+                     sqlite=sqlite3.sqlite_version,
+                     machine=platform.machine()),
+        "results": results,
+    }
+
+
+def write_report(report: Dict[str, Any], path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(report: Dict[str, Any], baseline_path: str,
+            threshold: float = 0.2) -> List[str]:
+    """
+    Compares p95 latency against a baseline JSON file. Returns a line per
+    benchmark that got slower by more than threshold (0.2 = 20%).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = result["p95_ms"] / before["p95_ms"] - 1
+        if change > threshold:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.3f}ms -> "
+                               f"{result['p95_ms']:.3f}ms "
+                               f"(+{100 * change:.0f}%)")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, float]]):
+    width = max([len(name) for name in results] + [9])
+    print(f"{'benchmark':<{width}}  {'p50 ms':>9}  {'p95 ms':>9}  "
+          f"{'p99 ms':>9}  {'ops/s':>10}  {'errors':>6}")
+    for name, result in results.items():
+        print(f"{name:<{width}}  {result['p50_ms']:>9.3f}  "
+              f"{result['p95_ms']:>9.3f}  {result['p99_ms']:>9.3f}  "
+              f"{result['ops_per_sec']:>10.1f}  "
+              f"{result.get('errors', 0):>6}")
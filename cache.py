@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with an optional time-to-live.
+    Keeps hit, miss and eviction counters for monitoring.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by every invalidation; see set_if_unchanged()
+        self.version = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._store(key, value)
+
+    def set_if_unchanged(self, key: Hashable, value: Any, version: int):
+        """
+        Stores a value loaded while the cache was at the given version,
+        unless something was invalidated in the meantime. This keeps a slow
+        read that raced with a write from caching the old row.
+        """
+        with self._lock:
+            if self.version == version:
+                self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self.version += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+def read_through(cache: LRUCache,
+                 bypass: Optional[Callable[[], Any]] = None,
+                 scope: Optional[Callable[[], Hashable]] = None) -> Callable:
+    """
+    Decorator for single-key lookups returning a dict. Results are served
+    from the cache when present; error results are never cached. Callers
+    get their own copy, so mutating a result cannot corrupt the cache.
+    While bypass() is truthy the cache is neither read nor filled, e.g.
+    inside a transaction whose changes other threads cannot see yet.
+    With scope, entries are keyed by (scope(), key), e.g. so the same id
+    in two databases gets two entries.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(key):
+            if bypass is not None and bypass():
+                return func(key)
+            entry = key if scope is None else (scope(), key)
+            value = cache.get(entry)
+            if value is None:
+                version = cache.version
+                value = func(key)
+                if "error" in value:
+                    return value
+                cache.set_if_unchanged(entry, value, version)
+            return dict(value)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,421 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import LifoQueue, Empty
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+DB_PATH = "database.db"
+
+# Pool tuning. busy_timeout is how long a connection waits on the SQLite
+# write lock before raising "database is locked".
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+ACQUIRE_TIMEOUT = 30
+
+# Most values bound to one statement; stays below the 999 limit of SQLite
+# builds older than 3.32
+MAX_SQL_PARAMS = 900
+
+# Pragmas applied once when a pooled connection is opened
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000),
+)
+
+# Functions called with every freshly opened sqlite3 connection
+_connection_hooks: List[Callable[[sqlite3.Connection], None]] = []
+# Functions called with the seconds a thread waited to check a connection out
+_checkout_hooks: List[Callable[[float], None]] = []
+# sqlite3.Cursor subclass used by PooledConnection.cursor(), if any
+_cursor_factory: Optional[type] = None
+
+
+def add_connection_hook(hook: Callable[[sqlite3.Connection], None]):
+    """
+    Registers a function that is called with every new raw connection, e.g.
+    to register SQL functions or tracing callbacks.
+    """
+    _connection_hooks.append(hook)
+
+
+def add_checkout_hook(hook: Callable[[float], None]):
+    """
+    Registers a function that is called with the time spent waiting for
+    the pool whenever a thread checks a connection out (not for nested
+    acquires, which reuse the thread's connection).
+    """
+    _checkout_hooks.append(hook)
+
+
+def set_cursor_factory(factory: Optional[type]):
+    """Makes pooled connections create cursors of the given Cursor subclass."""
+    global _cursor_factory
+    _cursor_factory = factory
+
+
+class Transaction:
+    """
+    The unit of work open on a connection, see transaction(). Work that
+    must only happen once the changes are durable (cache invalidation,
+    notifications) is queued with after_commit(). Rolling a savepoint back
+    also drops the callbacks queued since it was opened.
+    """
+    __slots__ = ("_callbacks",)
+
+    def __init__(self):
+        self._callbacks: List[tuple] = []
+
+    def after_commit(self, func: Callable, *args):
+        self._callbacks.append((func, args))
+
+    def take_callbacks(self) -> List[tuple]:
+        """
+        Removes and returns the queued (func, args) pairs, for a caller
+        that runs them itself after the commit, e.g. the writer lane.
+        """
+        callbacks, self._callbacks = self._callbacks, []
+        return callbacks
+
+    def _mark(self) -> int:
+        return len(self._callbacks)
+
+    def _discard_since(self, mark: int):
+        del self._callbacks[mark:]
+
+    def _run_callbacks(self):
+        for func, args in self._callbacks:
+            func(*args)
+
+
+class _Lease:
+    """A raw connection checked out of the pool by one thread."""
+    __slots__ = ("raw", "depth", "owner", "transaction")
+
+    def __init__(self, raw: sqlite3.Connection):
+        self.raw = raw
+        self.depth = 0
+        self.owner = None
+        # Set while transaction() is open on this connection
+        self.transaction: Optional[Transaction] = None
+
+
+class PooledConnection:
+    """
+    Handle returned by ConnectionPool.acquire(). It behaves like a
+    sqlite3.Connection, but close() gives the connection back to the pool
+    instead of closing the file. Calling close() more than once is harmless.
+
+    Inside transaction(), each handle covers a savepoint: commit() keeps
+    its changes for the enclosing transaction to commit, rollback() undoes
+    only what was done through this handle, and close() releases it.
+    """
+
+    def __init__(self, pool: "ConnectionPool", lease: _Lease,
+                 savepoint: Optional[str] = None, mark: int = 0):
+        self._pool = pool
+        self._lease = lease
+        self._savepoint = savepoint
+        # Callbacks queued before the savepoint opened survive its rollback
+        self._mark = mark
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        if self._lease is None:
+            raise sqlite3.ProgrammingError("Connection was returned to "
+                                           "the pool")
+        return self._lease.raw
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, factory: Optional[type] = None) -> sqlite3.Cursor:
+        factory = factory or _cursor_factory
+        return self.raw.cursor(factory) if factory else self.raw.cursor()
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> sqlite3.Cursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if self._savepoint is None:
+            self.raw.commit()
+
+    def rollback(self):
+        if self._savepoint is None:
+            self.raw.rollback()
+        elif self.raw.in_transaction:
+            self.raw.execute(f"ROLLBACK TO {self._savepoint}")
+            if self._lease.transaction is not None:
+                self._lease.transaction._discard_since(self._mark)
+
+    def close(self):
+        if self._lease is not None:
+            lease, self._lease = self._lease, None
+            if self._savepoint is not None and lease.raw.in_transaction:
+                lease.raw.execute(f"RELEASE {self._savepoint}")
+            self._pool._release(lease)
+
+    # Safety net for code paths that raise before reaching close()
+    __del__ = close
+
+
+class ConnectionPool:
+    """
+    Thread-aware pool of SQLite connections to a single database file.
+
+    Each thread holds at most one connection at a time: nested acquire()
+    calls from the same thread (e.g. validate_ids() inside update_student())
+    share the connection that is already checked out, so one request uses
+    one connection.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE,
+                 busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+                 pragmas: Sequence[Tuple[str, object]] = PRAGMAS):
+        self.path = path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pragmas = tuple(pragmas)
+        self._idle = LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+        self._closed = False
+        # See retire()
+        self._retired = False
+
+    def _connect(self) -> sqlite3.Connection:
+        raw = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                              check_same_thread=False)
+        raw.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        for name, value in self.pragmas:
+            raw.execute(f"PRAGMA {name} = {value}")
+        for hook in _connection_hooks:
+            hook(raw)
+        return raw
+
+    def _checkout(self) -> _Lease:
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            # A retired pool never refills _idle, so nobody may wait on it
+            if len(self._all) < self.size or self._retired:
+                raw = self._connect()
+                self._all.append(raw)
+                return _Lease(raw)
+        try:
+            return self._idle.get(timeout=ACQUIRE_TIMEOUT)
+        except Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled "
+                                           "database connection")
+
+    def _timed_checkout(self) -> _Lease:
+        if not _checkout_hooks:
+            return self._checkout()
+        started = time.perf_counter()
+        lease = self._checkout()
+        waited = time.perf_counter() - started
+        for hook in _checkout_hooks:
+            hook(waited)
+        return lease
+
+    def acquire(self) -> PooledConnection:
+        me = threading.get_ident()
+        lease: Optional[_Lease] = getattr(self._local, "lease", None)
+        if lease is None or lease.depth == 0 or lease.owner != me:
+            lease = self._timed_checkout()
+            lease.owner = me
+            self._local.lease = lease
+        lease.depth += 1
+        if lease.transaction is None:
+            return PooledConnection(self, lease)
+        savepoint = f"handle_{lease.depth}"
+        lease.raw.execute(f"SAVEPOINT {savepoint}")
+        return PooledConnection(self, lease, savepoint,
+                                lease.transaction._mark())
+
+    def acquire_detached(self) -> PooledConnection:
+        """
+        Checks out a connection that is not bound to the calling thread, for
+        generators that are resumed from whichever worker thread is free,
+        e.g. behind a StreamingResponse. Other code running on the same
+        thread never shares it.
+        """
+        lease = self._timed_checkout()
+        lease.depth = 1
+        return PooledConnection(self, lease)
+
+    def _release(self, lease: _Lease):
+        lease.depth -= 1
+        if lease.depth > 0:
+            return
+        lease.owner = None
+        lease.transaction = None
+        if getattr(self._local, "lease", None) is lease:
+            self._local.lease = None
+        if self._closed:
+            lease.raw.close()
+            return
+        if self._retired:
+            with self._lock:
+                self._all.remove(lease.raw)
+            lease.raw.close()
+            return
+        # Never hand out a connection with a half-finished transaction
+        if lease.raw.in_transaction:
+            lease.raw.rollback()
+        self._idle.put(lease)
+
+    def current_transaction(self) -> Optional[Transaction]:
+        lease: Optional[_Lease] = getattr(self._local, "lease", None)
+        if lease is None or lease.depth == 0 \
+                or lease.owner != threading.get_ident():
+            return None
+        return lease.transaction
+
+    def close(self):
+        """Closes every idle connection and refuses new checkouts."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().raw.close()
+            except Empty:
+                break
+
+    def retire(self):
+        """
+        Closes every idle connection now and the others as they are
+        returned, but keeps serving checkouts for code that still holds
+        the pool (each then opens and closes a connection of its own).
+        """
+        with self._lock:
+            self._retired = True
+        while True:
+            try:
+                lease = self._idle.get_nowait()
+            except Empty:
+                break
+            with self._lock:
+                self._all.remove(lease.raw)
+            lease.raw.close()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+# Pool that get_db_connection() uses instead of the shared one, see
+# use_pool()
+_routed_pool: ContextVar[Optional[ConnectionPool]] = \
+    ContextVar("routed_pool", default=None)
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def get_db_connection() -> PooledConnection:
+    """
+    Checks a connection out of the shared pool, or the pool selected with
+    use_pool(). close() returns it.
+    """
+    return (_routed_pool.get() or get_pool()).acquire()
+
+
+@contextmanager
+def use_pool(pool: ConnectionPool) -> Iterator[ConnectionPool]:
+    """
+    Sends the get_db_connection() calls made inside the block (and in
+    threads that copy its context) to another pool, e.g. a read-only
+    snapshot, without changing the code that makes them.
+    """
+    token = _routed_pool.set(pool)
+    try:
+        yield pool
+    finally:
+        _routed_pool.reset(token)
+
+
+def routed_pool() -> Optional[ConnectionPool]:
+    """The pool selected with use_pool() for this context, if any."""
+    return _routed_pool.get()
+
+
+@contextmanager
+def transaction() -> Iterator[Transaction]:
+    """
+    Runs the block as one unit of work: every get_db_connection() call the
+    thread makes inside it (e.g. from crud functions) shares one connection
+    and one BEGIN IMMEDIATE ... COMMIT, so a whole workflow costs a single
+    lock acquisition and fsync and is applied entirely or not at all. An
+    exception rolls everything back. Nested transaction() blocks become
+    savepoints of the outer one.
+    """
+    connection = get_db_connection()
+    lease = connection._lease
+    if connection._savepoint is not None:
+        # Already inside a unit of work
+        try:
+            yield lease.transaction
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        return
+    unit = Transaction()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        lease.transaction = unit
+        try:
+            yield unit
+        except BaseException:
+            lease.transaction = None
+            connection.rollback()
+            raise
+        lease.transaction = None
+        connection.commit()
+    finally:
+        lease.transaction = None
+        connection.close()
+    unit._run_callbacks()
+
+
+def current_transaction() -> Optional[Transaction]:
+    """The calling thread's open transaction(), if any."""
+    return (_routed_pool.get() or get_pool()).current_transaction()
+
+
+def get_detached_connection() -> PooledConnection:
+    """Like get_db_connection(), but usable from any thread until closed."""
+    return (_routed_pool.get() or get_pool()).acquire_detached()
+
+
+def set_db_path(path: str):
+    """Points the shared pool at another database file, e.g. for benchmarks."""
+    global DB_PATH
+    close_pool()
+    DB_PATH = path
+
+
+def close_pool():
+    """Shuts the shared pool down. Called from the app lifespan."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
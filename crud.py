@@ -1,82 +1,407 @@
+import json
+import re
 import sqlite3
-from typing import List, Dict, Any
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, \
+    Set, Tuple
 
 from anyio import connect_tcp
 
-DB_PATH = "database.db"
+import ayah_coverage
+from cache import LRUCache, read_through
+from connection import MAX_SQL_PARAMS, current_transaction, \
+    get_db_connection, transaction as _transaction
+from passwords import hash_in_pool, hash_many_in_pool
+from records import ASSIGNMENTS, HOMEWORK, STUDENTS, TABLES, TASKS, USERS, \
+    Table
+from quran import TOTAL_AYAHS, ayah_ordinal, range_length, validate_range
+from tenants import current_tenant
+
+# Table and required role (if any) behind each id kind validate_ids accepts
+ID_TABLES = {"user_id": ("Users", None), "parent_id": ("Users", "parent"),
+             "teacher_id": ("Users", "teacher"),
+             "student_id": ("Students", None),
+             "homework_id": ("Homework", None), "task_id": ("Tasks", None),
+             "assignment_id": ("Assignments", None)}
+
+USER_ROLES = USERS.choices["role"]
+
+HOMEWORK_RANGE_FIELDS = ("chapter_start", "verse_start", "chapter_end",
+                         "verse_end")
+
+# Full-text search: the FTS5 index and date column behind each result type.
+# Title matches weigh ten times as much as description matches in bm25().
+SEARCH_SOURCES = {"homework": ("HomeworkSearch", "Homework", "homework_id",
+                               "due_date"),
+                  "task": ("TaskSearch", "Tasks", "task_id", "end_date")}
+SEARCH_WEIGHTS = (10.0, 1.0)
+_SEARCH_TOKEN = re.compile(r"\w+")
+
+# Read-through caches for the single-row getters. Entries are dropped by
+# the matching update_* and delete_* functions, once their transaction
+# commits. Inside a transaction() the getters skip the caches. Entries are
+# keyed by (school, id), since every school's ids start at 1.
+ENTITY_CACHE_SIZE = 10000
+ENTITY_CACHE_TTL = 300
+ENTITY_CACHES = {table: LRUCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
+                 for table in ("Users", "Students", "Homework", "Tasks")}
+
+# Per-request memo of id lookups: {table: {id: role, True or None}}
+_id_cache: ContextVar[Optional[Dict[str, Dict[int, Any]]]] = \
+    ContextVar("id_cache", default=None)
+
+
+@contextmanager
+def validation_scope():
+    """
+    Memoizes validate_ids() lookups until the block exits, so repeated
+    checks of the same ids within one request or transaction are free.
+    Nested scopes share the outermost cache.
+    """
+    token = None
+    if _id_cache.get() is None:
+        token = _id_cache.set({})
+    try:
+        yield
+    finally:
+        if token is not None:
+            _id_cache.reset(token)
+
+
+@contextmanager
+def transaction():
+    """
+    Groups crud calls into one atomic unit of work with a single commit:
+
+        with transaction():
+            create_homework(...)
+            assign_to_roster(teacher_id=7, homework_id=...)
+            set_status("homework", last_week_ids, "completed")
+
+    Each call still returns its usual message or error dict; a call that
+    fails only undoes its own changes. Raise to roll back the whole block.
+    Cache invalidation and deadline notifications wait for the commit.
+    """
+    with validation_scope():
+        try:
+            with _transaction() as unit:
+                yield unit
+        except BaseException:
+            # Ids looked up inside the block may have been rolled back
+            _id_cache.get().clear()
+            raise
+
+
+def _after_commit(func: Callable, *args):
+    """Calls func now, or once the enclosing transaction() commits."""
+    unit = current_transaction()
+    if unit is None:
+        func(*args)
+    else:
+        unit.after_commit(func, *args)
+
+
+def _in_transaction() -> bool:
+    return current_transaction() is not None
+
+
+def _forget_ids(table: str, *ids: int):
+    """Drops ids from the request cache after they are created or deleted."""
+    cache = _id_cache.get()
+    if cache is not None and table in cache:
+        for id_ in ids:
+            cache[table].pop(id_, None)
+
+
+def _invalidate(table: str, id_: int):
+    """Drops a row from every cache after it is updated or deleted."""
+    _forget_ids(table, id_)
+    cache = ENTITY_CACHES.get(table)
+    if cache is not None:
+        _after_commit(cache.invalidate, (current_tenant(), id_))
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {table: cache.stats() for table, cache in ENTITY_CACHES.items()}
+
+
+# Functions told about deadline changes as (kind, id, due date or None,
+# school or None for the default database)
+DeadlineListener = Callable[[str, int, Optional[int], Optional[str]], None]
+_deadline_listeners: List[DeadlineListener] = []
+
+
+def add_deadline_listener(listener: DeadlineListener):
+    _deadline_listeners.append(listener)
+
+
+def remove_deadline_listener(listener: DeadlineListener):
+    if listener in _deadline_listeners:
+        _deadline_listeners.remove(listener)
+
+
+def _notify_deadline(kind: str, id_: int, due: Optional[int]):
+    """
+    Reports that a homework or task deadline may have changed. due is None
+    when only the status changed.
+    """
+    school = current_tenant()
+    for listener in _deadline_listeners:
+        _after_commit(listener, kind, id_, due, school)
+
+
+def _lookup_ids(cursor, table: str, ids: Iterable[int]) -> Dict[int, Any]:
+    """
+    Returns a map of id -> role (Users), True (other tables) or None
+    (missing) covering every id given, with one IN (...) query per chunk of
+    ids that are not cached yet.
+    """
+    cache = _id_cache.get()
+    known = cache.setdefault(table, {}) if cache is not None else {}
+    missing = [id_ for id_ in ids if id_ not in known]
+    column = "role" if table == "Users" else "1"
+    for start in range(0, len(missing), MAX_SQL_PARAMS):
+        chunk = missing[start:start + MAX_SQL_PARAMS]
+        marks = ", ".join("?" * len(chunk))
+        cursor.execute(f"SELECT id, {column} FROM {table} WHERE id IN "
+                       f"({marks})", chunk)
+        found = dict(cursor.fetchall())
+        for id_ in chunk:
+            known[id_] = found.get(id_)
+    return known
+
+
+def validate_id_batches(**kwargs) -> Dict[str, Set[int]]:
+    """
+    Set-based version of validate_ids. Each keyword takes a single id or an
+    iterable of ids, and all ids that live in the same table are checked
+    together with one query per table.
+    :param kwargs: user_id, student_id, homework_id, task_id, teacher_id,
+    parent_id, assignment_id
+    :return: Dict[str, Set[int]] mapping each keyword to its valid ids
+    """
+    requested: Dict[str, List[int]] = {}
+    by_table: Dict[str, Set[int]] = {}
+    for key, value in kwargs.items():
+        table = ID_TABLES[key][0]
+        if value is None:
+            ids = []
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            ids = [id_ for id_ in value if id_ is not None]
+        else:
+            ids = [value]
+        requested[key] = ids
+        by_table.setdefault(table, set()).update(ids)
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        found = {table: _lookup_ids(cursor, table, ids)
+                 for table, ids in by_table.items() if ids}
+    finally:
+        connection.close()
+
+    res = {}
+    for key, ids in requested.items():
+        table, role = ID_TABLES[key]
+        rows = found.get(table, {})
+        res[key] = {id_ for id_ in ids if rows.get(id_) is not None
+                    and (role is None or rows[id_] == role)}
+    return res
 
-# Helper function to connect to the database
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
 
 # Helper function to validate ids
 def validate_ids(**kwargs) -> List[bool]:
     """
     validate_ids checks whether the given ids exist within their respective
-    tables. Returns a list of bools in the order of the ids given.
-    :param kwargs: used_id, student_id, homework_id, task_id, teacher_id,
-    parent_id, assignments_id
+    tables. teacher_id and parent_id must also belong to a user with that
+    role. Returns a list of bools in the order of the ids given; a list of
+    ids is valid only if every id in it is.
+    :param kwargs: user_id, student_id, homework_id, task_id, teacher_id,
+    parent_id, assignment_id
     :return: List[bool]
     """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    tables = {"user_id": "Users", "parent_id": "Users", "teacher_id": "Users",
-             "student_id": "Students", "homework_id": "Homeworks",
-             "task_id": "Tasks", "assignment_id": "Assignments"}
+    valid = validate_id_batches(**kwargs)
     res = []
     for key, value in kwargs.items():
-        table = tables[key]
         if value is None:
             res.append(False)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            res.append(all(id_ in valid[key] for id_ in value))
         else:
-            if key in ["user_id", "teacher_id", "parent_id"]:
-                role = ""
-                if key == "user_id":
-                    role = "admin"
-                else:
-                    end = key.find('_')
-                    role = key[:end]
-                cursor.execute(f"SELECT FROM {table} WHERE id = {value} AND "
-                               f"role = {role}")
-            else:
-                cursor.execute(f"SELECT FROM {table} WHERE id = {value}")
-            if cursor.fetchone():
-                res.append(True)
-            else:
-                res.append(False)
-    connection.close()
+            res.append(value in valid[key])
     return res
 
 
-def create_user(name: str, email: str, password: str, role: str)\
-        -> Dict[str, Any]:
+def _present(**values) -> Dict[str, Any]:
+    """The keyword arguments that were actually given (not None)."""
+    return {key: value for key, value in values.items() if value is not None}
+
+
+def _check_values(table: Table, values: Dict[str, Any]) -> Optional[str]:
+    """
+    Checks shared by every insert and update: known columns, allowed values
+    and referenced ids that must exist (with the right role).
+    """
+    error = table.validate(values)
+    if error:
+        return error
+    refs = {kind: values[column] for column, kind in table.references.items()
+            if values.get(column) is not None}
+    if refs:
+        for kind, valid in zip(refs, validate_ids(**refs)):
+            if not valid:
+                return f"Invalid {kind} or {kind} does not exist"
+    return None
+
+
+def _update_row(table: Table, row_id: int, values: Dict[str, Any],
+                message: str) -> Dict[str, Any]:
+    """Runs a checked single-row UPDATE and drops the cached row."""
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        table.update(cursor, row_id, values)
+        connection.commit()
+    except sqlite3.IntegrityError as e:
+        return {"error": str(e)}
+    finally:
+        connection.close()
+    _invalidate(table.table, row_id)
+    return {"message": message}
+
+
+def create_user(name: str, email: str, password: str, role: str,
+                password_hash: str = None) -> Dict[str, Any]:
     """
     Creates a new user in the Users table.
     Args:
         name (str): User's name.
         email (str): User's email.
-        password (str): User's password.
+        password (str): User's password. It is hashed before it is stored.
         role (str): User's role (e.g., 'teacher', 'parent').
+        password_hash (str, optional): Hash made with passwords.py, stored
+            instead of hashing password here.
     Returns:
         Dict[str, Any]: Message or error details.
     """
+    values = {"name": name, "email": email, "role": role}
+    error = _check_values(USERS, values)
+    if error:
+        return {"error": error}
+    values["password"] = password_hash or hash_in_pool(password)
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute(
-            """
-            INSERT INTO Users (name, email, password, role)
-            VALUES (?, ?, ?, ?)
-            """,
-            (name, email, password, role),
-        )
+        user_id = USERS.insert(cursor, values)
         connection.commit()
+        _forget_ids("Users", user_id)
         return {"message": "User created successfully!"}
     except sqlite3.IntegrityError as e:
         return {"error": str(e)}
     finally:
         connection.close()
 
+def _chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Groups an iterable into lists of at most size items, lazily."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert_chunk(connection, table: Table,
+                  chunk: List[Tuple[int, Dict[str, Any]]],
+                  errors: List[Dict[str, Any]]) -> int:
+    """
+    Inserts one chunk with Table.insert_many in a single transaction. If the
+    chunk hits a constraint, it is retried row by row so only the offending
+    rows are reported. chunk items are (row_number, values) pairs.
+    """
+    cursor = connection.cursor()
+    try:
+        table.insert_many(cursor, [values for _, values in chunk])
+        connection.commit()
+        return len(chunk)
+    except sqlite3.IntegrityError:
+        connection.rollback()
+    created = 0
+    for row_number, values in chunk:
+        try:
+            table.insert(cursor, values)
+            created += 1
+        except sqlite3.IntegrityError as e:
+            errors.append({"row": row_number, "error": str(e)})
+    connection.commit()
+    return created
+
+
+def bulk_create_users(rows: Iterable[Dict[str, Any]],
+                      chunk_size: int = 1000) -> Dict[str, Any]:
+    """
+    Creates many users at once, e.g. from a roster import.
+    Args:
+        rows (Iterable[Dict[str, Any]]): Rows with name, email, password
+            and role. Unreadable rows may be passed as ValueError instances
+            and are reported as errors.
+        chunk_size (int): Rows inserted per transaction.
+    Returns:
+        Dict[str, Any]: Number of users created and a per-row error report.
+    """
+    errors = []
+    created = 0
+    seen_emails = set()
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        for chunk in _chunks(enumerate(rows, start=1), chunk_size):
+            emails = [row.get("email") for _, row in chunk
+                      if isinstance(row, dict)]
+            for start in range(0, len(emails), MAX_SQL_PARAMS):
+                batch = emails[start:start + MAX_SQL_PARAMS]
+                marks = ", ".join("?" * len(batch))
+                cursor.execute(f"SELECT email FROM Users WHERE email IN "
+                               f"({marks})", batch)
+                seen_emails.update(email for email, in cursor.fetchall())
+            pending = []
+            for row_number, row in chunk:
+                if isinstance(row, Exception):
+                    errors.append({"row": row_number, "error": str(row)})
+                    continue
+                missing = [field for field in ("name", "email", "password",
+                                               "role") if not row.get(field)]
+                if missing:
+                    errors.append({"row": row_number, "error":
+                                   f"Missing fields: {', '.join(missing)}"})
+                elif row["role"] not in USER_ROLES:
+                    errors.append({"row": row_number,
+                                   "error": f"Invalid role: {row['role']}"})
+                elif row["email"] in seen_emails:
+                    errors.append({"row": row_number, "error":
+                                   f"Email already exists: {row['email']}"})
+                else:
+                    seen_emails.add(row["email"])
+                    pending.append((row_number, {
+                        "name": row["name"], "email": row["email"],
+                        "password": row["password"], "role": row["role"]}))
+            # Hash the whole chunk across the worker processes at once
+            hashes = hash_many_in_pool([values["password"]
+                                        for _, values in pending])
+            for (_, values), hashed in zip(pending, hashes):
+                values["password"] = hashed
+            if pending:
+                created += _insert_chunk(connection, USERS, pending, errors)
+    finally:
+        connection.close()
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+@read_through(ENTITY_CACHES["Users"], _in_transaction, current_tenant)
 def get_user_by_id(user_id: int) -> Dict[str, Any]:
     """
     Retrieves a user's details by their ID.
@@ -88,35 +413,50 @@ def get_user_by_id(user_id: int) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
 
-    cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
+    cursor.execute(USERS.select("id = ?"), (user_id,))
+    user = USERS.row(cursor.fetchone())
     connection.close()
 
-    if user:
-        return {"id": user[0], "name": user[1], "email": user[2],
-                "role": user[4]}
-    return {"error": "User not found"}
+    return user or {"error": "User not found"}
 
-def get_all_users() -> List[Dict[str, Any]]:
+def get_all_users(limit: int = None, after: int = 0)\
+        -> List[Dict[str, Any]]:
     """
-    Retrieves all users from the Users table.
+    Retrieves users from the Users table in id order, one page at a time.
+    Args:
+        limit (int, optional): Maximum number of users to return. All
+            remaining users are returned if not given.
+        after (int, optional): Keyset cursor; only users with an id greater
+            than this are returned. Pass the last id of the previous page.
     Returns:
         List[Dict[str, Any]]: List of user details.
     """
     connection = get_db_connection()
     cursor = connection.cursor()
 
-    cursor.execute("SELECT * FROM Users")
-    users = cursor.fetchall()
+    cursor.execute(USERS.select("id > ?", "ORDER BY id LIMIT ?"),
+                   (after, -1 if limit is None else limit))
+    users = USERS.rows(cursor.fetchall())
     connection.close()
+    return users
 
-    return [
-        {"id": user[0], "name": user[1], "email": user[2], "role": user[4]}
-        for user in users
-    ]
+def iter_users(after: int = 0, batch_size: int = 500)\
+        -> Iterator[Dict[str, Any]]:
+    """
+    Yields every user after the given id, fetching batch_size rows per
+    query, so memory use does not grow with the size of the table. No
+    connection is held between batches.
+    """
+    while True:
+        users = get_all_users(limit=batch_size, after=after)
+        yield from users
+        if len(users) < batch_size:
+            return
+        after = users[-1]["id"]
 
 def update_user(user_id: int, name: str = None, email: str = None,
-                role: str = None) -> Dict[str, Any]:
+                role: str = None, password: str = None,
+                password_hash: str = None) -> Dict[str, Any]:
     """
     Updates user details in the Users table.
     Args:
@@ -124,38 +464,57 @@ def update_user(user_id: int, name: str = None, email: str = None,
         name (str, optional): New name for the user.
         email (str, optional): New email for the user.
         role (str, optional): New role for the user.
+        password (str, optional): New password, hashed before it is stored.
+        password_hash (str, optional): Hash of the new password made with
+            passwords.py, used instead of hashing password here.
     Returns:
         Dict[str, Any]: Message or error details.
     """
-    is_valid = validate_ids(user_id = user_id)
-    if not is_valid[0]:
+    values = _present(name=name, email=email, role=role)
+    if not values and not password and not password_hash:
+        return {"error": "No fields to update"}
+    error = _check_values(USERS, values)
+    if error:
+        return {"error": error}
+    if not validate_ids(user_id = user_id)[0]:
         return {"error": "Invalid user_id or user_id not found"}
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    updates = []
-    params = []
-
-    if name:
-        updates.append("name = ?")
-        params.append(name)
-    if email:
-        updates.append("email = ?")
-        params.append(email)
-    if role:
-        updates.append("role = ?")
-        params.append(role)
+    if password or password_hash:
+        values["password"] = password_hash or hash_in_pool(password)
+    return _update_row(USERS, user_id, values, "User updated successfully!")
 
-    if not updates:
+def get_login(email: str) -> Optional[Dict[str, Any]]:
+    """
+    Looks a user up by email for sign-in, including the stored password
+    hash. Never cached and never returned to clients.
+    """
+    connection = get_db_connection()
+    try:
+        user = connection.execute("SELECT id, name, email, password, role "
+                                  "FROM Users WHERE email = ?",
+                                  (email,)).fetchone()
+    finally:
         connection.close()
-        return {"error": "No fields to update"}
-
-    params.append(user_id)
-    sql = f"UPDATE Users SET {', '.join(updates)} WHERE id = ?"
+    if user is None:
+        return None
+    return {"id": user[0], "name": user[1], "email": user[2],
+            "password": user[3], "role": user[4]}
 
-    cursor.execute(sql, tuple(params))
-    connection.commit()
-    connection.close()
-    return {"message": "User updated successfully!"}
+def replace_password_hash(user_id: int, old: str, new: str) -> bool:
+    """
+    Swaps a stored password for a new hash, e.g. to upgrade a plaintext
+    password after sign-in. Does nothing if the password changed meanwhile.
+    """
+    connection = get_db_connection()
+    try:
+        cursor = connection.execute("UPDATE Users SET password = ? "
+                                    "WHERE id = ? AND password = ?",
+                                    (new, user_id, old))
+        if cursor.rowcount == 1:
+            _invalidate("Users", user_id)
+        connection.commit()
+        return cursor.rowcount == 1
+    finally:
+        connection.close()
 
 def delete_user(user_id: int) -> Dict[str, Any]:
     """
@@ -168,36 +527,30 @@ def delete_user(user_id: int) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
 
-    cursor.execute("DELETE FROM Users WHERE id = ?", (user_id,))
-    if cursor.rowcount == 0:
+    if USERS.delete(cursor, user_id) == 0:
         connection.close()
         return {"error": "User not found or could not be deleted"}
 
     connection.commit()
+    _invalidate("Users", user_id)
     connection.close()
     return {"message": "User deleted successfully!"}
 
 def create_student(name: str, email: str, password: str, parent_id: int,
                    teacher_id: int, classroom: str):
+    # Students have no password column; password is accepted for
+    # compatibility with existing callers
+    values = {"name": name, "email": email, "parent_id": parent_id,
+              "teacher_id": teacher_id, "classroom": classroom}
+    error = _check_values(STUDENTS, values)
+    if error:
+        return {"error": error}
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        # validate parent and teacher IDs
-        is_valid = validate_ids(parent_id = parent_id, teacher_id = teacher_id)
-        if not is_valid[0]:
-            return {"error": "Invalid parent ID"}
-        if not is_valid[1]:
-            return {"error": "Invalid teacher ID"}
-
-        # Insert the new student
-        cursor.execute(
-            """INSERT INTO Students (name, email, parent_id, teacher_id, 
-            classroom)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (name, email, parent_id, teacher_id, classroom),
-        )
+        student_id = STUDENTS.insert(cursor, values)
         connection.commit()
+        _forget_ids("Students", student_id)
         return {"message": "Student created successfully!"}
     except sqlite3.IntegrityError as e:
         return {"error": str(e)}
@@ -205,271 +558,600 @@ def create_student(name: str, email: str, password: str, parent_id: int,
         connection.close()
 
 
+def bulk_create_students(rows: Iterable[Dict[str, Any]],
+                         chunk_size: int = 1000) -> Dict[str, Any]:
+    """
+    Creates many students at once, e.g. from a roster import. Parent and
+    teacher ids are validated one chunk at a time.
+    Args:
+        rows (Iterable[Dict[str, Any]]): Rows with name, email, parent_id,
+            teacher_id and an optional classroom. Unreadable rows may be
+            passed as ValueError instances and are reported as errors.
+        chunk_size (int): Rows inserted per transaction.
+    Returns:
+        Dict[str, Any]: Number of students created and a per-row error
+        report.
+    """
+    errors = []
+    created = 0
+    connection = get_db_connection()
+    try:
+        for chunk in _chunks(enumerate(rows, start=1), chunk_size):
+            parsed = []
+            for row_number, row in chunk:
+                if isinstance(row, Exception):
+                    errors.append({"row": row_number, "error": str(row)})
+                    continue
+                missing = [field for field in ("name", "email", "parent_id",
+                                               "teacher_id")
+                           if row.get(field) in (None, "")]
+                if missing:
+                    errors.append({"row": row_number, "error":
+                                   f"Missing fields: {', '.join(missing)}"})
+                    continue
+                try:
+                    parent_id = int(row["parent_id"])
+                    teacher_id = int(row["teacher_id"])
+                except (TypeError, ValueError):
+                    errors.append({"row": row_number,
+                                   "error": "parent_id and teacher_id must "
+                                            "be integers"})
+                    continue
+                # Every row has the same columns, so insert_many keeps
+                # them in order in a single executemany
+                parsed.append((row_number, {
+                    "name": row["name"], "email": row["email"],
+                    "parent_id": parent_id, "teacher_id": teacher_id,
+                    "classroom": row.get("classroom") or None}))
+
+            valid = validate_id_batches(
+                parent_id=[values["parent_id"] for _, values in parsed],
+                teacher_id=[values["teacher_id"] for _, values in parsed])
+            pending = []
+            for row_number, values in parsed:
+                if values["parent_id"] not in valid["parent_id"]:
+                    errors.append({"row": row_number, "error":
+                                   f"Invalid parent ID: "
+                                   f"{values['parent_id']}"})
+                elif values["teacher_id"] not in valid["teacher_id"]:
+                    errors.append({"row": row_number, "error":
+                                   f"Invalid teacher ID: "
+                                   f"{values['teacher_id']}"})
+                else:
+                    pending.append((row_number, values))
+            if pending:
+                created += _insert_chunk(connection, STUDENTS, pending,
+                                         errors)
+    finally:
+        connection.close()
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+
+@read_through(ENTITY_CACHES["Students"], _in_transaction, current_tenant)
 def get_student_by_id(student_id: int) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT * FROM Students WHERE id = ?", (student_id,))
-    student = cursor.fetchone()
+    cursor.execute(STUDENTS.select("id = ?"), (student_id,))
+    student = STUDENTS.row(cursor.fetchone())
     connection.close()
-    if student:
-        return {"id": student[0], "name": student[1], "email": student[2],
-                "parent id": student[3], "teacher id": student[4],
-                "classroom": student[5]}
-    return {"error": "Student not found"}
+    return student or {"error": "Student not found"}
 
 def get_students_by_teacher(teacher_id) -> List[Dict[str, Any]]:
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT * FROM Students WHERE teacher_id = ?", (teacher_id,))
-    students = cursor.fetchall()
+    cursor.execute(STUDENTS.select("teacher_id = ?"), (teacher_id,))
+    students = STUDENTS.rows(cursor.fetchall())
     connection.close()
-    return [
-        {"student id": student[0], "name": student[1], "email": student[2],
-         "parent id": student[3], "teacher id": student[4],
-         "classroom": student[5]}
-        for student in students
-    ]
+    return students
 
 def get_students_by_parent(parent_id) -> List[Dict[str, Any]]:
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT * FROM Students WHERE parent_id = ?", (parent_id,))
-    students = cursor.fetchall()
+    cursor.execute(STUDENTS.select("parent_id = ?"), (parent_id,))
+    students = STUDENTS.rows(cursor.fetchall())
     connection.close()
-    return [
-        {"student id": student[0], "name": student[1], "email": student[2],
-         "parent id": student[3], "teacher id": student[4],
-         "classroom": student[5]}
-        for student in students
-    ]
+    return students
 
-def get_all_students() -> List[Dict[str, Any]]:
+def get_all_students(limit: int = None, after: int = 0)\
+        -> List[Dict[str, Any]]:
+    """
+    Retrieves students in id order, one keyset page at a time. Only
+    students with an id greater than after are returned; all of them if
+    limit is not given.
+    """
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT * FROM Students")
-    students = cursor.fetchall()
+    cursor.execute(STUDENTS.select("id > ?", "ORDER BY id LIMIT ?"),
+                   (after, -1 if limit is None else limit))
+    students = STUDENTS.rows(cursor.fetchall())
     connection.close()
-    return [
-        {"student id": student[0], "name": student[1], "email": student[2],
-         "parent id": student[3], "teacher id": student[4],
-         "classroom": student[5]}
-        for student in students
-    ]
+    return students
 
-def update_student(student_id: int, **kwargs):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    updates = []
-    params = []
+def iter_students(after: int = 0, batch_size: int = 500)\
+        -> Iterator[Dict[str, Any]]:
+    """Yields every student after the given id, batch_size rows per query."""
+    while True:
+        students = get_all_students(limit=batch_size, after=after)
+        yield from students
+        if len(students) < batch_size:
+            return
+        after = students[-1]["id"]
 
-    for key, value in kwargs.items():
-        if key in ("name", "email", "classroom") and value:
-            updates.append(f"{key} = ?")
-            params.append(value)
-        elif key == "parent_id":
-            is_valid = validate_ids(parent_id = key)
-            if not is_valid[0]:
-                connection.close()
-                return {"error": f"Invalid parent ID: {value}"}
-            updates.append("parent_id = ?")
-            params.append(value)
-        elif key == "teacher_id":
-            is_valid = validate_ids(teacher_id = key)
-            if not is_valid[0]:
-                connection.close()
-                return {"error": f"Invalid teacher ID: {value}"}
-            updates.append("teacher_id = ?")
-            params.append(value)
-
-    if not updates:
+def update_student(student_id: int, **kwargs):
+    values = _present(**kwargs)
+    if not values:
         return {"error": "No fields to update"}
-
+    error = _check_values(STUDENTS, values)
+    if error:
+        return {"error": error}
     if not validate_ids(student_id = student_id)[0]:
-        connection.close()
         return {"error": "Incorrect student_id or student_id does not exist"}
-    params.append(student_id)
-    sql = f"UPDATE Students SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(sql, params)
-    connection.commit()
-    connection.close()
-    return {"message": "Student updated successfully!"}
+    return _update_row(STUDENTS, student_id, values,
+                       "Student updated successfully!")
 
 def delete_student(student_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("DELETE FROM Students WHERE id = ?", (student_id,))
-    if cursor.rowcount == 0:
+    if STUDENTS.delete(cursor, student_id) == 0:
         connection.close()
         return {"error": "Student not found or could not be deleted"}
+    cursor.execute("DELETE FROM StudentCoverage WHERE student_id = ?",
+                   (student_id,))
     connection.commit()
+    _invalidate("Students", student_id)
     connection.close()
     return {"message": "Student deleted successfully!"}
 
 def create_homework(title: str, description: str, chapter_start: int,
                     chapter_end: int, verse_start: int, verse_end: int,
                     due_date: int, status = "pending"):
+    values = {"title": title, "description": description,
+              "chapter_start": chapter_start, "chapter_end": chapter_end,
+              "verse_start": verse_start, "verse_end": verse_end,
+              "due_date": due_date, "status": status}
+    # Range checks use the bundled surah table, no database reads needed
+    error = validate_range(chapter_start, verse_start, chapter_end,
+                           verse_end) or _check_values(HOMEWORK, values)
+    if error:
+        return {"error": error}
+    values["ordinal_start"] = ayah_ordinal(chapter_start, verse_start)
+    values["ordinal_end"] = ayah_ordinal(chapter_end, verse_end)
+
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute(
-            """INSERT INTO Homework (description, chapter_start, 
-            chapter_end, verse_start, verse_end, due_date, status, title)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (description, chapter_start, chapter_end, verse_start,
-             verse_end, due_date, status, title),
-        )
+        homework_id = HOMEWORK.insert(cursor, values)
         connection.commit()
+        _forget_ids("Homework", homework_id)
+        _notify_deadline("homework", homework_id, due_date)
         return {"message": "Homework created successfully!"}
     except sqlite3.IntegrityError as e:
         return {"error": str(e)}
     finally:
         connection.close()
 
+@read_through(ENTITY_CACHES["Homework"], _in_transaction, current_tenant)
 def get_homework_by_id(homework_id) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("""SELECT * FROM Homework WHERE id = ?""",(homework_id,))
-    homework = cursor.fetchone()
+    cursor.execute(HOMEWORK.select("id = ?"), (homework_id,))
+    homework = HOMEWORK.row(cursor.fetchone())
     connection.close()
-    if homework:
-        return {"homework_id": homework[0], "title": homework[9],
-                "description": homework[2], "chapter start": homework[3],
-                "chapter end": homework[4], "verse start": homework[5],
-                "verse end": homework[6], "due date": homework[7],
-                "status": homework[8]}
-    return {"error": "Homework not found"}
+    if homework is None:
+        return {"error": "Homework not found"}
+    homework["ayah_count"] = range_length(
+        homework["chapter_start"], homework["verse_start"],
+        homework["chapter_end"], homework["verse_end"])
+    return homework
 
 def update_homework(homework_id: int, **kwargs):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    updates = []
-    params = []
-
-    for key, value in kwargs.items():
-        if (key in ("title", "description", "chapter_start", "chapter_end",
-                   "verse_start", "verse_end", "due_date", "status")
-                and value is not None):
-            updates.append(f"{key} = ?")
-            params.append(value)
-
-    if not updates:
-        connection.close()
+    values = _present(**kwargs)
+    if not values:
         return {"error": "No fields to update"}
+    error = _check_values(HOMEWORK, values)
+    if error:
+        return {"error": error}
+
+    # Keep the ayah ordinals in step with the verse range
+    given = {key: values[key] for key in HOMEWORK_RANGE_FIELDS
+             if key in values}
+    expressions = ()
+    range_check = ""
+    range_params = []
+    if len(given) == len(HOMEWORK_RANGE_FIELDS):
+        error = validate_range(given["chapter_start"], given["verse_start"],
+                               given["chapter_end"], given["verse_end"])
+        if error:
+            return {"error": error}
+        values["ordinal_start"] = ayah_ordinal(given["chapter_start"],
+                                               given["verse_start"])
+        values["ordinal_end"] = ayah_ordinal(given["chapter_end"],
+                                             given["verse_end"])
+    elif given:
+        # Only part of the range changes: combine the new values with the
+        # stored ones inside the UPDATE itself, and only apply it if the
+        # resulting range is valid, instead of reading the row first
+        start = "ayah_ordinal(COALESCE(?, chapter_start), " \
+                "COALESCE(?, verse_start))"
+        end = "ayah_ordinal(COALESCE(?, chapter_end), COALESCE(?, verse_end))"
+        range_params = [given.get("chapter_start"), given.get("verse_start"),
+                        given.get("chapter_end"), given.get("verse_end")]
+        expressions = (f"ordinal_start = {start}", f"ordinal_end = {end}")
+        range_check = f"{start} <= {end}"
 
     if not validate_ids(homework_id = homework_id)[0]:
-        connection.close()
-        return {"error": "Incorrect student_id or student_id does not exist"}
+        return {"error": "Incorrect homework_id or homework_id does not exist"}
 
-    params.append(homework_id)
-    sql = f"UPDATE Homework SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(sql, params)
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    if HOMEWORK.update(cursor, homework_id, values, expressions, range_params,
+                       range_check, range_params) == 0:
+        connection.close()
+        return {"error": "Invalid verse range"}
+    # Completing homework only adds ayahs to its students' coverage; any
+    # other status or range change may remove some, so rebuild theirs
+    if values.get("status") == "completed" and not given:
+        ayah_coverage.add_homework(cursor, homework_id)
+    elif "status" in values or given:
+        ayah_coverage.rebuild(cursor,
+                              _assigned_student_ids(cursor, homework_id))
     connection.commit()
+    _invalidate("Homework", homework_id)
     connection.close()
+    if "due_date" in values or values.get("status") == "pending":
+        _notify_deadline("homework", homework_id, values.get("due_date"))
     return {"message": "Homework updated successfully!"}
 
+def _find_homework(condition: str, params: List[Any], limit: int)\
+        -> List[Dict[str, Any]]:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(f"""SELECT id, title, chapter_start, verse_start,
+    chapter_end, verse_end, due_date, status, ordinal_end - ordinal_start + 1
+    FROM Homework WHERE {condition}
+    ORDER BY ordinal_start, ordinal_end, id LIMIT ?""", params + [limit])
+    rows = cursor.fetchall()
+    connection.close()
+    return [
+        {"homework_id": row[0], "title": row[1], "chapter_start": row[2],
+         "verse_start": row[3], "chapter_end": row[4], "verse_end": row[5],
+         "due_date": row[6], "status": row[7], "ayah_count": row[8]}
+        for row in rows
+    ]
+
+def get_homework_covering(chapter: int, verse: int, limit: int = 100)\
+        -> List[Dict[str, Any]] or Dict:
+    """
+    Returns homework whose verse range includes chapter:verse, e.g. 2:255.
+    """
+    ordinal = ayah_ordinal(chapter, verse)
+    if ordinal is None:
+        return {"error": f"Invalid verse {chapter}:{verse}"}
+    return _find_homework("ordinal_start <= ? AND ordinal_end >= ?",
+                          [ordinal, ordinal], limit)
+
+def get_homework_overlapping(chapter_start: int, verse_start: int,
+                             chapter_end: int, verse_end: int,
+                             limit: int = 100) -> List[Dict[str, Any]] or Dict:
+    """Returns homework that shares at least one ayah with the range."""
+    error = validate_range(chapter_start, verse_start, chapter_end, verse_end)
+    if error:
+        return {"error": error}
+    return _find_homework("ordinal_start <= ? AND ordinal_end >= ?",
+                          [ayah_ordinal(chapter_end, verse_end),
+                           ayah_ordinal(chapter_start, verse_start)], limit)
+
+def get_homework_within(chapter_start: int, verse_start: int,
+                        chapter_end: int, verse_end: int,
+                        limit: int = 100) -> List[Dict[str, Any]] or Dict:
+    """Returns homework whose whole range lies inside the given range."""
+    error = validate_range(chapter_start, verse_start, chapter_end, verse_end)
+    if error:
+        return {"error": error}
+    return _find_homework("ordinal_start >= ? AND ordinal_end <= ?",
+                          [ayah_ordinal(chapter_start, verse_start),
+                           ayah_ordinal(chapter_end, verse_end)], limit)
+
+def _assigned_student_ids(cursor, homework_id: int) -> List[int]:
+    cursor.execute("SELECT DISTINCT student_id FROM Assignments "
+                   "WHERE homework_id = ?", (homework_id,))
+    return [row[0] for row in cursor.fetchall()]
+
 def delete_homework(homework_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("""DELETE FROM Homework WHERE id = ?""", (homework_id,))
-    if cursor.rowcount == 0:
+    student_ids = _assigned_student_ids(cursor, homework_id)
+    if HOMEWORK.delete(cursor, homework_id) == 0:
         connection.close()
-        return {"error": "Student not found or could not be deleted"}
+        return {"error": "Homework not found or could not be deleted"}
+    ayah_coverage.rebuild(cursor, student_ids)
     connection.commit()
+    _invalidate("Homework", homework_id)
     connection.close()
     return {"message": "Homework deleted successfully!"}
 
 def create_assignment(student_id: int, homework_id = None, task_id = None):
-
-    # Validate ids
-    if homework_id is not None:
-        is_valid = validate_ids(student_id = student_id, homework_id =
-        homework_id)
-        if is_valid[0] == False or is_valid[1] == False:
-            return {"error": "Invalid ids"}
-    else:
-        is_valid = validate_ids(student_id = student_id, task_id = task_id)
-        if is_valid[0] == False or is_valid[1] == False:
-            return {"error": "Invalid ids"}
+    if student_id is None:
+        return {"error": "student_id is required"}
+    if homework_id is None and task_id is None:
+        return {"error": "Either homework_id or task_id is required"}
+    values = {"student_id": student_id, "homework_id": homework_id,
+              "task_id": task_id}
+    error = _check_values(ASSIGNMENTS, values)
+    if error:
+        return {"error": error}
 
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute("""INSERT INTO Assignments (student_id, homework_id, task_id)
-        VALUES (?, ?, ?)""", (student_id, homework_id, task_id))
+        assignment_id = ASSIGNMENTS.insert(cursor, values)
+        if homework_id is not None:
+            ayah_coverage.add_homework(cursor, homework_id, [student_id])
         connection.commit()
+        _forget_ids("Assignments", assignment_id)
+        return {"message": "Assignment created successfully!"}
     except sqlite3.IntegrityError as e:
         return {"error": "Could not assign homework to student because of\n" +
                          str(e)}
     finally:
         connection.close()
 
-# def get_student_homework(student_id) -> List[Dict[str, Any]]:
-#     # Validate student_id
-#     if not validate_student_id(student_id):
-#         return [{"error": "Incorrect student_id or student_id does not exist"}]
-#     connection = get_db_connection()
-#     cursor = connection.cursor()
-#     cursor.execute("""SELECT * FROM Assignments WHERE student_id = ?""", (student_id,))
-#     homeworks = cursor.fetchall()
-#     connection.close()
-#     homework_ids = [homeworks[1] for homework in homeworks]
-#     res = []
-#     for homework_id in homework_ids:
-#         res.append(get_homework_by_id(homework_id))
-#     return res
-#
-# def get_assigned_students(homework_id) -> List[Dict[str, Any]] or Dict:
-#     # Validate homework_id
-#     if not validate_homework_id(homework_id):
-#         return {"error": "Incorrect student_id or student_id does not exist"}
-#     connection = get_db_connection()
-#     cursor = connection.cursor()
-#     cursor.execute("""SELECT * FROM Assignments WHERE homework_id = ?""", (homework_id,))
-#     student_rows = cursor.fetchall()
-#     student_ids = [student_id[2] for student_id in student_rows]
-#     res = []
-#     for student_id in student_ids:
-#         res.append(get_student_by_id(student_id))
-#     return res
+def assign_to_roster(teacher_id: int = None, classroom: str = None,
+                     homework_id: int = None, task_id: int = None)\
+        -> Dict[str, Any]:
+    """
+    Assigns a homework and/or task to every student of a teacher, of a
+    classroom, or of one teacher's classroom, with one INSERT ... SELECT.
+    Students who already have the assignment are skipped, so running it
+    again after new students join only assigns them.
+    Args:
+        teacher_id (int, optional): Assign to this teacher's students.
+        classroom (str, optional): Assign to students in this classroom.
+        homework_id (int, optional): Homework to assign.
+        task_id (int, optional): Task to assign.
+    Returns:
+        Dict[str, Any]: Message and the number of students assigned, or
+        error details.
+    """
+    if teacher_id is None and classroom is None:
+        return {"error": "Either teacher_id or classroom is required"}
+    if homework_id is None and task_id is None:
+        return {"error": "Either homework_id or task_id is required"}
+    error = _check_values(ASSIGNMENTS, {"homework_id": homework_id,
+                                        "task_id": task_id})
+    if error:
+        return {"error": error}
+    if teacher_id is not None and not validate_ids(
+            teacher_id = teacher_id)[0]:
+        return {"error": "Invalid teacher_id or teacher_id does not exist"}
+
+    conditions = []
+    params: List[Any] = [homework_id, task_id]
+    if teacher_id is not None:
+        conditions.append("s.teacher_id = ?")
+        params.append(teacher_id)
+    if classroom is not None:
+        conditions.append("s.classroom = ?")
+        params.append(classroom)
+    params += [homework_id, task_id]
+
+    with transaction():
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""INSERT INTO Assignments (student_id,
+            homework_id, task_id)
+            SELECT s.id, ?, ? FROM Students s
+            WHERE {" AND ".join(conditions)} AND NOT EXISTS (
+                SELECT 1 FROM Assignments a WHERE a.student_id = s.id
+                AND a.homework_id IS ? AND a.task_id IS ?)
+            ORDER BY s.id""", params)
+            assigned = cursor.rowcount
+            if homework_id is not None and assigned:
+                ayah_coverage.add_homework(cursor, homework_id)
+            connection.commit()
+        except sqlite3.IntegrityError as e:
+            connection.rollback()
+            return {"error": "Could not assign to the roster because of\n"
+                             + str(e)}
+        finally:
+            connection.close()
+    return {"message": f"Assigned to {assigned} students",
+            "assigned": assigned}
+
+def get_student_homework(student_id: int, status: str = None,
+                         due_after: int = None, due_before: int = None,
+                         descending: bool = False, limit: int = 50,
+                         offset: int = 0) -> List[Dict[str, Any]] or Dict:
+    """
+    Returns a student's homework and task feed with a single JOIN over
+    Assignments, Homework and Tasks, however many assignments there are.
+    For tasks the due date is their end_date.
+    Args:
+        student_id (int): Student whose feed to load.
+        status (str, optional): Only items with this status.
+        due_after (int, optional): Only items due on or after this date.
+        due_before (int, optional): Only items due on or before this date.
+        descending (bool): Latest due date first instead of soonest first.
+        limit (int): Page size.
+        offset (int): Number of items to skip.
+    Returns:
+        List[Dict[str, Any]] or Dict: Feed items, or an error if the
+        student does not exist.
+    """
+    conditions = ["a.student_id = ?"]
+    params: List[Any] = [student_id]
+    if status is not None:
+        conditions.append("COALESCE(h.status, t.status) = ?")
+        params.append(status)
+    if due_after is not None:
+        conditions.append("COALESCE(h.due_date, t.end_date) >= ?")
+        params.append(due_after)
+    if due_before is not None:
+        conditions.append("COALESCE(h.due_date, t.end_date) <= ?")
+        params.append(due_before)
+    direction = "DESC" if descending else "ASC"
+    params.extend([limit, offset])
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(f"""SELECT a.id, a.homework_id, a.task_id,
+    COALESCE(h.title, t.title), COALESCE(h.description, t.description),
+    COALESCE(h.status, t.status), COALESCE(h.due_date, t.end_date),
+    h.chapter_start, h.chapter_end, h.verse_start, h.verse_end, t.start_date
+    FROM Assignments a
+    LEFT JOIN Homework h ON h.id = a.homework_id
+    LEFT JOIN Tasks t ON t.id = a.task_id
+    WHERE {" AND ".join(conditions)}
+    ORDER BY COALESCE(h.due_date, t.end_date) {direction}, a.id {direction}
+    LIMIT ? OFFSET ?""", params)
+    rows = cursor.fetchall()
+    connection.close()
+
+    # An empty page is the only case that needs to tell a student with no
+    # homework apart from a student that does not exist
+    if not rows and offset == 0 and not validate_ids(
+            student_id = student_id)[0]:
+        return {"error": "Incorrect student_id or student_id does not exist"}
+
+    res = []
+    for row in rows:
+        item = {"assignment_id": row[0], "title": row[3],
+                "description": row[4], "status": row[5], "due_date": row[6]}
+        if row[1] is not None:
+            item.update({"type": "homework", "homework_id": row[1],
+                         "chapter_start": row[7], "chapter_end": row[8],
+                         "verse_start": row[9], "verse_end": row[10]})
+        else:
+            item.update({"type": "task", "task_id": row[2],
+                         "start_date": row[11]})
+        res.append(item)
+    return res
+
+def get_assigned_students(homework_id: int)\
+        -> List[Dict[str, Any]] or Dict:
+    """
+    Returns every student a homework is assigned to, with one JOIN instead
+    of a get_student_by_id() call per student.
+    Args:
+        homework_id (int): Homework to list the roster for.
+    Returns:
+        List[Dict[str, Any]] or Dict: Students ordered by classroom and
+        name, or an error if the homework does not exist.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("""SELECT a.id, s.id, s.name, s.email, s.parent_id,
+    s.teacher_id, s.classroom
+    FROM Assignments a JOIN Students s ON s.id = a.student_id
+    WHERE a.homework_id = ?
+    ORDER BY s.classroom, s.name, s.id""", (homework_id,))
+    rows = cursor.fetchall()
+    connection.close()
+    if not rows and not validate_ids(homework_id = homework_id)[0]:
+        return {"error": "Incorrect homework_id or homework_id does not exist"}
+    return [
+        {"assignment_id": row[0], "student_id": row[1], "name": row[2],
+         "email": row[3], "parent_id": row[4], "teacher_id": row[5],
+         "classroom": row[6]}
+        for row in rows
+    ]
+
+def get_homework_completion(teacher_id: int = None, homework_id: int = None,
+                            classroom: str = None, now: int = None)\
+        -> List[Dict[str, Any]]:
+    """
+    Counts assigned, completed and overdue homework per homework and per
+    classroom in one GROUP BY over Assignments, Students and Homework.
+    Completion is recorded on the Homework row, not per assignment, so
+    every student assigned a homework counts as completed (or overdue)
+    together: a homework's completed count is either 0 or its assigned
+    count.
+    Args:
+        teacher_id (int, optional): Only this teacher's students.
+        homework_id (int, optional): Only this homework.
+        classroom (str, optional): Only this classroom.
+        now (int, optional): Time that due dates are compared against to
+            decide what is overdue. Defaults to the current time.
+    Returns:
+        List[Dict[str, Any]]: One entry per homework with its totals and a
+        breakdown by classroom.
+    """
+    if now is None:
+        now = int(time.time())
+    conditions = []
+    params: List[Any] = [now]
+    if teacher_id is not None:
+        conditions.append("s.teacher_id = ?")
+        params.append(teacher_id)
+    if homework_id is not None:
+        conditions.append("a.homework_id = ?")
+        params.append(homework_id)
+    if classroom is not None:
+        conditions.append("s.classroom = ?")
+        params.append(classroom)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(f"""SELECT h.id, h.title, h.due_date, s.classroom,
+    COUNT(*),
+    SUM(h.status = 'completed'),
+    SUM(h.status != 'completed' AND h.due_date < ?)
+    FROM Assignments a
+    JOIN Students s ON s.id = a.student_id
+    JOIN Homework h ON h.id = a.homework_id
+    {where}
+    GROUP BY h.id, s.classroom
+    ORDER BY h.due_date, h.id, s.classroom""", params)
+    rows = cursor.fetchall()
+    connection.close()
+
+    res = []
+    for row in rows:
+        if not res or res[-1]["homework_id"] != row[0]:
+            res.append({"homework_id": row[0], "title": row[1],
+                        "due_date": row[2], "assigned": 0, "completed": 0,
+                        "overdue": 0, "classrooms": []})
+        entry = res[-1]
+        entry["assigned"] += row[4]
+        entry["completed"] += row[5]
+        entry["overdue"] += row[6]
+        entry["classrooms"].append({"classroom": row[3], "assigned": row[4],
+                                    "completed": row[5], "overdue": row[6]})
+    return res
 
 def get_assignment(assignment_id: int) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT * FROM Assignments WHERE id = ?", (assignment_id,))
-    assignment = cursor.fetchone()
-    if not assignment:
-        return {"error":
-                    "Invalid assignment_id or assignment_id does not exist"}
-    return {"id": assignment[0], "student_id": assignment[1],
-            "homework_id": assignment[2], "task_id": assignment[3]}
+    cursor.execute(ASSIGNMENTS.select("id = ?"), (assignment_id,))
+    assignment = ASSIGNMENTS.row(cursor.fetchone())
+    connection.close()
+    return assignment or {"error": "Invalid assignment_id or assignment_id "
+                                   "does not exist"}
 
 def update_assignment(assignment_id: int, student_id: int = None,
                       homework_id: int = None, task_id: int = None):
+    values = _present(student_id=student_id, homework_id=homework_id,
+                      task_id=task_id)
+    if not values:
+        return {"error": "No fields to update"}
+    error = _check_values(ASSIGNMENTS, values)
+    if error:
+        return {"error": error}
     connection = get_db_connection()
     cursor = connection.cursor()
-    updates = []
-    params = []
-    if student_id is not None:
-        if not validate_ids(student_id = student_id)[0]:
-            connection.close()
-            return {"error": "Invalid student_id or student_id does not exist"}
-        updates.append("student_id = ?")
-        params.append(student_id)
-    if homework_id is not None:
-        if not validate_ids(homework_id = homework_id)[0]:
-            connection.close()
-            return {"error":
-                        "Invalid homework_id or homework_id does not exist"}
-        updates.append("student_id = ?")
-        params.append(student_id)
-    if task_id is not None:
-        if not validate_ids(task_id = task_id):
-            connection.close()
-            return {"error": "Invalid task_id or task_id does not exist"}
-    params.append(assignment_id)
-    sql = f"UPDATE Assignments SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(sql, tuple(params))
+    cursor.execute("SELECT student_id FROM Assignments WHERE id = ?",
+                   (assignment_id,))
+    old = cursor.fetchone()
+    if old is None:
+        connection.close()
+        return {"error": "Invalid assignment_id or assignment_id does not "
+                         "exist"}
+    ASSIGNMENTS.update(cursor, assignment_id, values)
+    if "student_id" in values or "homework_id" in values:
+        ayah_coverage.rebuild(cursor, {old[0],
+                                       values.get("student_id", old[0])})
     connection.commit()
     connection.close()
     return {"message": "Assignment updated successfully!"}
@@ -477,47 +1159,139 @@ def update_assignment(assignment_id: int, student_id: int = None,
 def delete_assignment(assignment_id: int):
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("""DELETE FROM Assignments WHERE id = ?""",
+    cursor.execute(ASSIGNMENTS.delete_sql("student_id, homework_id"),
                    (assignment_id,))
-    if cursor.rowcount == 0:
+    deleted = cursor.fetchone()
+    if deleted is None:
         connection.close()
         return {"error": "Assignment not found or could not be deleted"}
+    if deleted[1] is not None:
+        ayah_coverage.rebuild(cursor, [deleted[0]])
     connection.commit()
+    _forget_ids("Assignments", assignment_id)
     connection.close()
     return {"message": "Homework Assignment deleted successfully!"}
 
+def get_student_coverage(student_id: int) -> Dict[str, Any]:
+    """
+    Returns which ayahs a student has completed, as a count and as verse
+    ranges, plus what is left to memorize.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT bitmap FROM StudentCoverage WHERE student_id = ?",
+                   (student_id,))
+    row = cursor.fetchone()
+    connection.close()
+    if row is None and not validate_ids(student_id = student_id)[0]:
+        return {"error": "Incorrect student_id or student_id does not exist"}
+    mask = ayah_coverage.from_blob(row[0] if row else None)
+    completed = ayah_coverage.popcount(mask)
+    return {"student_id": student_id, "ayahs_completed": completed,
+            "ayahs_remaining": TOTAL_AYAHS - completed,
+            "percent": round(100 * completed / TOTAL_AYAHS, 2),
+            "completed": ayah_coverage.to_ranges(mask),
+            "remaining": ayah_coverage.to_ranges(
+                ayah_coverage.remaining(mask))}
+
+def get_classroom_coverage(classroom: str, teacher_id: int = None)\
+        -> Dict[str, Any]:
+    """
+    Combines the coverage of every student in a classroom: what anyone has
+    completed (union), what everyone has completed (intersection), and
+    what nobody has covered yet.
+    """
+    sql = """SELECT s.id, c.bitmap FROM Students s
+    LEFT JOIN StudentCoverage c ON c.student_id = s.id
+    WHERE s.classroom = ?"""
+    params: List[Any] = [classroom]
+    if teacher_id is not None:
+        sql += " AND s.teacher_id = ?"
+        params.append(teacher_id)
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    masks = [ayah_coverage.from_blob(row[1]) for row in cursor.fetchall()]
+    connection.close()
+    if not masks:
+        return {"error": "No students in this classroom"}
+    anyone = ayah_coverage.union(masks)
+    everyone = ayah_coverage.intersection(masks)
+    return {"classroom": classroom, "students": len(masks),
+            "ayahs_completed_by_anyone": ayah_coverage.popcount(anyone),
+            "ayahs_completed_by_everyone": ayah_coverage.popcount(everyone),
+            "completed_by_everyone": ayah_coverage.to_ranges(everyone),
+            "not_started": ayah_coverage.to_ranges(
+                ayah_coverage.remaining(anyone))}
+
+def get_teacher_summary(teacher_id: int) -> Dict[str, Any]:
+    """
+    Dashboard counts for one teacher: students, and their homework and task
+    assignments by status. Reads one row of the TeacherSummary table, which
+    triggers keep current.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("""SELECT students, homework_pending, homework_completed,
+    tasks_incomplete, tasks_completed FROM TeacherSummary
+    WHERE teacher_id = ?""", (teacher_id,))
+    row = cursor.fetchone()
+    connection.close()
+    if row is None:
+        if not validate_ids(teacher_id = teacher_id)[0]:
+            return {"error": "Invalid teacher_id or teacher_id does not exist"}
+        row = (0, 0, 0, 0, 0)
+    return {"teacher_id": teacher_id, "students": row[0],
+            "homework_pending": row[1], "homework_completed": row[2],
+            "tasks_incomplete": row[3], "tasks_completed": row[4]}
+
+def get_status_summary() -> Dict[str, Dict[str, int]]:
+    """Number of Homework and Tasks rows in each status."""
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT entity, status, total FROM StatusSummary")
+    rows = cursor.fetchall()
+    connection.close()
+    res = {"Homework": {"pending": 0, "completed": 0},
+           "Tasks": {"incomplete": 0, "completed": 0}}
+    for entity, status, total in rows:
+        res[entity][status] = total
+    return res
+
 def create_task(title: str, description: str, start_date: int = None,
                 end_date: int = None, status: str = 'incomplete'):
-    # Validate and dates and status:
-    if start_date > end_date:
+    # Validate dates and status
+    if start_date is not None and end_date is not None \
+            and start_date > end_date:
         return {"error": "The start date must be less than end date"}
-    if status not in ['completed', 'incomplete']:
-        return {"error":
-                    "Invalid status. Status must be 'completed' or "
-                    "'incomplete'."}
+    values = {"title": title, "description": description,
+              "start_date": start_date, "end_date": end_date,
+              "status": status}
+    error = _check_values(TASKS, values)
+    if error:
+        return {"error": error}
 
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute("""INSERT INTO Tasks (title, description, 
-        start_date, end_date, status)
-        VALUES (?, ?, ?, ?, ?)""", (title, description, start_date,
-                                    end_date, status))
+        task_id = TASKS.insert(cursor, values)
         connection.commit()
+        _forget_ids("Tasks", task_id)
+        _notify_deadline("task", task_id, end_date)
         return {"message": "Task created successfully!"}
     except sqlite3.IntegrityError as e:
         return {"error": str(e)}
     finally:
         connection.close()
 
+@read_through(ENTITY_CACHES["Tasks"], _in_transaction, current_tenant)
 def get_task_by_id(task_id: int) -> Dict[str, Any]:
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
-        cursor.execute("""SELECT * FROM Tasks WHERE id = ?""", (task_id,))
-        task = cursor.fetchone()
-        return {"task_id": task[0], "title": task[1], "description": task[2],
-                "start_date": task[3], "end_date": task[4], "status": task[5]}
+        cursor.execute(TASKS.select("id = ?"), (task_id,))
+        task = TASKS.row(cursor.fetchone())
+        return task or {"error": "Invalid task_id or task_id does not exist"}
     except sqlite3.IntegrityError as e:
         return {"error": str(e) + "\nOr Invalid task_id or task_id does not "
                                   "exist"}
@@ -527,34 +1301,23 @@ def get_task_by_id(task_id: int) -> Dict[str, Any]:
 def update_task(task_id: int, title: str = None, description: str = None,
                 start_date: int = None, end_date: int = None,
                 status: str = None):
-    is_valid = validate_ids(task_id = task_id)
-    if not is_valid[0]:
+    values = _present(title=title, description=description,
+                      start_date=start_date, end_date=end_date, status=status)
+    if not values:
+        return {"error": "No fields to update"}
+    if start_date is not None and end_date is not None \
+            and start_date > end_date:
+        return {"error": "The start date must be less than end date"}
+    error = _check_values(TASKS, values)
+    if error:
+        return {"error": error}
+    if not validate_ids(task_id = task_id)[0]:
         return {"error": "Invalid task_id or task_id does not exist"}
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    updates = []
-    params = []
-
-    if title is not None:
-        updates.append("title = ?")
-        params.append(title)
-    if description is not None:
-        updates.append("description = ?")
-        params.append(description)
-    if start_date is not None:
-        updates.append("start_date = ?")
-        params.append(start_date)
-    if end_date is not None:
-        updates.append("end_date = ?")
-        params.append(end_date)
-    if status is not None:
-        updates.append("status = ?")
-        params.append(start_date)
-    sql = f"UPDATE Tasks SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(sql, tuple(params))
-    connection.commit()
-    connection.close()
-    return {"message": "Updated tasks successfully!"}
+    res = _update_row(TASKS, task_id, values, "Updated tasks successfully!")
+    if "error" not in res and (end_date is not None
+                               or status == "incomplete"):
+        _notify_deadline("task", task_id, end_date)
+    return res
 
 def delete_task(task_id: int):
     is_valid = validate_ids(task_id = task_id)
@@ -562,10 +1325,233 @@ def delete_task(task_id: int):
         return {"error": "Invalid task_id or task_id does not exist"}
     connection = get_db_connection()
     cursor = connection.cursor()
-    cursor.execute("DELETE FROM Tasks WHERE id = ?", (task_id,))
-    if cursor.rowcount == 0:
+    if TASKS.delete(cursor, task_id) == 0:
         connection.close()
         return {"error": "Task could not be deleted"}
     connection.commit()
+    _invalidate("Tasks", task_id)
     connection.close()
     return {"message": "Task was deleted successfully!"}
+
+
+# Tables and the status that reopens work, per set_status() kind
+STATUS_TABLES = {"homework": (HOMEWORK, "pending"),
+                 "task": (TASKS, "incomplete")}
+
+def set_status(kind: str, ids: List[int], status: str) -> Dict[str, Any]:
+    """
+    Sets the status of many Homework or Tasks rows with one UPDATE. The ids
+    are bound as a single JSON array, however many there are.
+    Args:
+        kind (str): "homework" or "task".
+        ids (List[int]): Rows to change. Unknown ids are ignored.
+        status (str): New status, e.g. "completed".
+    Returns:
+        Dict[str, Any]: Message and the number of rows whose status
+        changed, or error details.
+    """
+    if kind not in STATUS_TABLES:
+        return {"error": f"Invalid kind. Must be one of: "
+                         f"{', '.join(STATUS_TABLES)}"}
+    table, reopened = STATUS_TABLES[kind]
+    error = table.validate({"status": status})
+    if error:
+        return {"error": error}
+    try:
+        id_list = json.dumps([int(id_) for id_ in ids])
+    except (TypeError, ValueError):
+        return {"error": "ids must be a list of integers"}
+
+    with transaction():
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"""UPDATE {table.table} SET status = ?
+            WHERE id IN (SELECT value FROM json_each(?)) AND status != ?
+            RETURNING id""", (status, id_list, status))
+            changed = [row[0] for row in cursor.fetchall()]
+            if kind == "homework" and changed:
+                # One coverage pass over every student of the changed rows
+                cursor.execute("""SELECT DISTINCT student_id FROM Assignments
+                WHERE homework_id IN (SELECT value FROM json_each(?))""",
+                               (json.dumps(changed),))
+                ayah_coverage.rebuild(cursor, [row[0] for row in
+                                          cursor.fetchall()])
+            connection.commit()
+        finally:
+            connection.close()
+        for id_ in changed:
+            _invalidate(table.table, id_)
+            if status == reopened:
+                _notify_deadline(kind, id_, None)
+    return {"message": f"Updated the status of {len(changed)} {kind} rows",
+            "updated": len(changed)}
+
+def _match_expression(query: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query that matches rows containing every
+    word, the last one as a prefix so results follow the user's typing.
+    Words are quoted, so FTS5 operators and punctuation in the input are
+    searched as plain text rather than parsed.
+    """
+    words = _SEARCH_TOKEN.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if query.rstrip() == query and query[-1:].isalnum():
+        terms[-1] += "*"
+    return " ".join(terms)
+
+def search(query: str, kind: str = None, teacher_id: int = None,
+           classroom: str = None, limit: int = 20, offset: int = 0)\
+        -> List[Dict[str, Any]] or Dict:
+    """
+    Searches homework and task titles and descriptions through the FTS5
+    indexes, best matches first.
+    Args:
+        query (str): Words to look for, e.g. "tajweed revision".
+        kind (str, optional): "homework" or "task"; both when omitted.
+        teacher_id (int, optional): Only work assigned to this teacher's
+            students.
+        classroom (str, optional): Only work assigned to students in this
+            classroom.
+        limit (int): Page size.
+        offset (int): Results to skip, for the following pages.
+    Returns:
+        List[Dict[str, Any]] or Dict: Matches with a highlighted snippet,
+        or an error for an unknown kind or a query without any words.
+    """
+    if kind is not None and kind not in SEARCH_SOURCES:
+        return {"error": f"Invalid kind. Must be one of: "
+                         f"{', '.join(SEARCH_SOURCES)}"}
+    match = _match_expression(query)
+    if match is None:
+        return {"error": "The search query must contain at least one word"}
+
+    filters = []
+    filter_params: List[Any] = []
+    if teacher_id is not None:
+        filters.append("s.teacher_id = ?")
+        filter_params.append(teacher_id)
+    if classroom is not None:
+        filters.append("s.classroom = ?")
+        filter_params.append(classroom)
+
+    selects = []
+    params: List[Any] = []
+    for name, (index, table, column, date) in SEARCH_SOURCES.items():
+        if kind is not None and kind != name:
+            continue
+        where = f"{index} MATCH ?"
+        if filters:
+            # Assignments are only consulted for rows FTS5 already matched
+            where += f""" AND EXISTS (SELECT 1 FROM Assignments a
+            JOIN Students s ON s.id = a.student_id
+            WHERE a.{column} = r.id AND {' AND '.join(filters)})"""
+        selects.append(f"""SELECT '{name}', r.id, r.title, r.status,
+        r.{date}, snippet({index}, -1, '[', ']', '...', 12),
+        bm25({index}, {SEARCH_WEIGHTS[0]}, {SEARCH_WEIGHTS[1]}) AS rank
+        FROM {index} JOIN {table} r ON r.id = {index}.rowid
+        WHERE {where}""")
+        params += [match] + filter_params
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(" UNION ALL ".join(selects)
+                       + " ORDER BY rank, 1, 2 LIMIT ? OFFSET ?",
+                       params + [limit, offset])
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError as e:
+        return {"error": f"Search failed: {e}"}
+    finally:
+        connection.close()
+    return [
+        {"type": row[0], "id": row[1], "title": row[2], "status": row[3],
+         "due_date": row[4], "snippet": row[5], "rank": row[6]}
+        for row in rows
+    ]
+
+def get_entity_versions(*tables: str) -> List[int]:
+    """
+    The latest change version of each table, 0 if it never changed. It
+    moves on every insert, update or delete, so it makes a cheap ETag for
+    listings of that table.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT " + ", ".join(
+        ["(SELECT MAX(version) FROM ChangeLog WHERE entity = ?)"]
+        * len(tables)), tables)
+    versions = [version or 0 for version in cursor.fetchone()]
+    connection.close()
+    return versions
+
+def get_changes(since: int = 0, limit: int = 500,
+                entities: List[str] = None) -> Dict[str, Any]:
+    """
+    Returns the rows inserted, updated or deleted after a change version,
+    oldest change first, for clients that keep a local copy in sync.
+    Args:
+        since (int): Highest version the client has seen; 0 for a full
+            sync.
+        limit (int): Maximum number of changes to return.
+        entities (List[str], optional): Only these tables, e.g. ["Users"].
+    Returns:
+        Dict[str, Any]: "changes" with the current row of each changed
+        entry, or a tombstone (deleted: true, row: null) for deleted rows;
+        "cursor", the version to pass as since next time; and "has_more".
+        An error if since is older than the pruned change history, in
+        which case the client has to resync from 0.
+    """
+    unknown = [entity for entity in entities or () if entity not in TABLES]
+    if unknown:
+        return {"error": f"Unknown entity: {', '.join(unknown)}. Must be "
+                         f"one of: {', '.join(TABLES)}"}
+    condition = "version > ?"
+    params: List[Any] = [since]
+    if entities:
+        condition += f" AND entity IN ({', '.join('?' * len(entities))})"
+        params += entities
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    # One snapshot for the log and the rows it points at
+    began = not connection.in_transaction
+    if began:
+        connection.execute("BEGIN")
+    try:
+        cursor.execute("SELECT pruned_through FROM ChangeLogState")
+        pruned_through = cursor.fetchone()[0]
+        if 0 < since < pruned_through:
+            return {"error": "The change history since this cursor was "
+                             "pruned; resync from 0", "resync": True}
+        cursor.execute(f"""SELECT version, entity, row_id, deleted
+        FROM ChangeLog WHERE {condition} ORDER BY version LIMIT ?""",
+                       params + [limit])
+        entries = cursor.fetchall()
+        changed: Dict[str, List[int]] = {}
+        for _, entity, row_id, deleted in entries:
+            if not deleted:
+                changed.setdefault(entity, []).append(row_id)
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for entity, ids in changed.items():
+            table = TABLES[entity]
+            cursor.execute(table.select(
+                "id IN (SELECT value FROM json_each(?))"), (json.dumps(ids),))
+            for row in table.rows(cursor.fetchall()):
+                rows[(entity, row["id"])] = row
+    finally:
+        if began:
+            connection.commit()
+        connection.close()
+
+    return {
+        "changes": [
+            {"entity": entity, "id": row_id, "version": version,
+             "deleted": bool(deleted),
+             "row": None if deleted else rows.get((entity, row_id))}
+            for version, entity, row_id, deleted in entries],
+        "cursor": entries[-1][0] if entries else since,
+        "has_more": len(entries) == limit,
+    }
@@ -1,103 +1,681 @@
-import sqlite3
+import argparse
+import sys
+from typing import Callable, List, Tuple
+
+import ayah_coverage
+from connection import get_db_connection
+from quran import ayah_ordinal
 
 """Below is the database schema/design"""
-# # Connect to SQLite database (or create it if it doesn't exist)
-# connection = sqlite3.connect("database.db")
-# cursor = connection.cursor()
-#
-# # Define the updated SQL schema
-# sql_schema = """
-# CREATE TABLE Users (
-#     id INTEGER PRIMARY KEY AUTOINCREMENT,
-#     name TEXT NOT NULL,
-#     email TEXT UNIQUE NOT NULL,
-#     password TEXT NOT NULL,
-#     role TEXT NOT NULL CHECK(role IN ('admin','teacher','parent'))
-# );
-#
-# CREATE TABLE Students (
-#     id INTEGER PRIMARY KEY AUTOINCREMENT,
-#     name TEXT NOT NULL,
-#     email TEXT NOT NULL,
-#     parent_id INTEGER NOT NULL,
-#     teacher_id INTEGER NOT NULL,
-#     classroom TEXT,
-#
-#     FOREIGN KEY (parent_id) REFERENCES Users(id),
-#     FOREIGN KEY (teacher_id) REFERENCES Users(id)
-# );
-#
-# CREATE TABLE Homeworks (
-#     id INTEGER PRIMARY KEY AUTOINCREMENT,
-#     title TEXT NOT NULL,
-#     description TEXT NOT NULL,
-#     chapter_start INTEGER,
-#     chapter_end INTEGER,
-#     verse_start INTEGER,
-#     verse_end INTEGER,
-#     due_date DATE DEFAULT CURRENT_TIMESTAMP,
-#     status TEXT NOT NULL CHECK(status IN ('completed', 'pending'))
-# );
-#
-# CREATE TABLE Assignments (
-#     id INTEGER PRIMARY KEY AUTOINCREMENT,
-#     student_id INTEGER NOT NULL,
-#     homework_id INTEGER,
-#     task_id INTEGER,
-#
-#     FOREIGN KEY (student_id) REFERENCES Students(id),
-#     FOREIGN KEY (homework_id) REFERENCES Homeworks(id),
-#     FOREIGN KEY (task_id) REFERENCES Tasks(id)
-# );
-#
-# CREATE TABLE Tasks (
-#     id INTEGER PRIMARY KEY AUTOINCREMENT,
-#     title TEXT NOT NULL,
-#     description TEXT NOT NULL,
-#     start_date DATE,
-#     end_date DATE,
-#     status TEXT NOT NULL CHECK(status IN ('completed', 'incomplete'))
-# );
-# """
-#
-# # Execute the schema
-# cursor.executescript(sql_schema)
-#
-# print("Updated database schema created successfully!")
-#
-# # Commit changes and close the connection
-# connection.commit()
-# connection.close()
-
-"""Use the following code to add new column(s) to a specific table"""
-# Connect to SQLite database (or create it if it doesn't exist)
-# connection = sqlite3.connect("database.db")
-# cursor = connection.cursor()
-#
-# # Alter the Students table to add the classroom column
-# try:
-#     cursor.execute("ALTER TABLE Homework ADD COLUMN title TEXT;")
-#     print("Added 'title' column to the Homework table.")
-# except sqlite3.OperationalError as e:
-#     if "duplicate column name" in str(e).lower():
-#         print("'title' column already exists in the Homework table.")
-#     else:
-#         raise e
-#
-# # Commit changes and close the connection
-# connection.commit()
-# connection.close()
-
-
-"""Use the follwoing code to check table structure"""
-# def check_table_structure():
-#     connection = sqlite3.connect("database.db")
-#     cursor = connection.cursor()
-#     cursor.execute("PRAGMA table_info(Homework);")
-#     columns = cursor.fetchall()
-#     connection.close()
-#     for column in columns:
-#         print(column)
-#
-# check_table_structure()
+# Each migration brings the schema from version - 1 to version. The applied
+# version is stored in PRAGMA user_version, so migrate() is safe to run on
+# every startup and only applies what is missing.
+
+def _v1_base_schema(cursor):
+    # Early databases named the homework table "Homeworks"; crud.py uses
+    # "Homework". RENAME also rewrites the foreign key in Assignments.
+    tables = _tables(cursor)
+    if "Homeworks" in tables and "Homework" not in tables:
+        cursor.execute("ALTER TABLE Homeworks RENAME TO Homework")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('admin','teacher','parent'))
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        parent_id INTEGER NOT NULL,
+        teacher_id INTEGER NOT NULL,
+        classroom TEXT,
+
+        FOREIGN KEY (parent_id) REFERENCES Users(id),
+        FOREIGN KEY (teacher_id) REFERENCES Users(id)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Homework (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        chapter_start INTEGER,
+        chapter_end INTEGER,
+        verse_start INTEGER,
+        verse_end INTEGER,
+        due_date DATE DEFAULT CURRENT_TIMESTAMP,
+        status TEXT NOT NULL CHECK(status IN ('completed', 'pending'))
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        homework_id INTEGER,
+        task_id INTEGER,
+
+        FOREIGN KEY (student_id) REFERENCES Students(id),
+        FOREIGN KEY (homework_id) REFERENCES Homework(id),
+        FOREIGN KEY (task_id) REFERENCES Tasks(id)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        start_date DATE,
+        end_date DATE,
+        status TEXT NOT NULL CHECK(status IN ('completed', 'incomplete'))
+    )""")
+
+    # Older Homework tables got their title column through ALTER TABLE
+    if "title" not in _columns(cursor, "Homework"):
+        cursor.execute("ALTER TABLE Homework ADD COLUMN title TEXT")
+
+
+def _v2_hot_path_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_teacher_id "
+                   "ON Students (teacher_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_parent_id "
+                   "ON Students (parent_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignments_student_id "
+                   "ON Assignments (student_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignments_homework_id "
+                   "ON Assignments (homework_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignments_task_id "
+                   "ON Assignments (task_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_homework_due_date "
+                   "ON Homework (due_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_start_date "
+                   "ON Tasks (start_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_end_date "
+                   "ON Tasks (end_date)")
+
+
+def _v3_homework_ayah_ordinals(cursor):
+    # Global ayah ordinals of each homework's verse range, for range and
+    # overlap queries. Rows with an invalid range are left NULL.
+    cursor.execute("ALTER TABLE Homework ADD COLUMN ordinal_start INTEGER")
+    cursor.execute("ALTER TABLE Homework ADD COLUMN ordinal_end INTEGER")
+    cursor.execute("SELECT id, chapter_start, verse_start, chapter_end, "
+                   "verse_end FROM Homework")
+    rows = [(ayah_ordinal(row[1], row[2]), ayah_ordinal(row[3], row[4]),
+             row[0]) for row in cursor.fetchall()]
+    cursor.executemany("UPDATE Homework SET ordinal_start = ?, "
+                       "ordinal_end = ? WHERE id = ?", rows)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_homework_ordinals "
+                   "ON Homework (ordinal_start, ordinal_end)")
+
+
+def _v4_student_coverage(cursor):
+    # One bitmap per student over global ayah ordinals of completed homework
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS StudentCoverage (
+        student_id INTEGER PRIMARY KEY,
+        bitmap BLOB NOT NULL,
+        ayah_count INTEGER NOT NULL DEFAULT 0,
+
+        FOREIGN KEY (student_id) REFERENCES Students(id)
+    )""")
+    ayah_coverage.rebuild(cursor)
+
+
+"""Summary tables for the dashboards"""
+# TeacherSummary counts each teacher's students and the homework/task
+# assignments of those students by status. StatusSummary counts Homework
+# and Tasks rows by status. Both are kept current by the triggers below,
+# so they stay right whichever code path writes, and dashboard reads are
+# single-row lookups. rebuild_summaries() recomputes them from scratch.
+
+def _assignment_delta(row: str, sign: str) -> str:
+    """Adds or removes one assignment row's counts for its teacher."""
+    return f"""
+    UPDATE TeacherSummary SET
+        homework_pending = homework_pending {sign} (SELECT COUNT(*)
+            FROM Homework WHERE id = {row}.homework_id AND status = 'pending'),
+        homework_completed = homework_completed {sign} (SELECT COUNT(*)
+            FROM Homework WHERE id = {row}.homework_id
+            AND status = 'completed'),
+        tasks_incomplete = tasks_incomplete {sign} (SELECT COUNT(*)
+            FROM Tasks WHERE id = {row}.task_id AND status = 'incomplete'),
+        tasks_completed = tasks_completed {sign} (SELECT COUNT(*)
+            FROM Tasks WHERE id = {row}.task_id AND status = 'completed')
+    WHERE teacher_id = (SELECT teacher_id FROM Students
+                        WHERE id = {row}.student_id);"""
+
+
+def _student_delta(row: str, sign: str) -> str:
+    """Adds or removes a student and all of their assignments."""
+    return f"""
+    UPDATE TeacherSummary SET
+        students = students {sign} 1,
+        homework_pending = homework_pending {sign} (SELECT COUNT(*)
+            FROM Assignments a JOIN Homework h ON h.id = a.homework_id
+            WHERE a.student_id = {row}.id AND h.status = 'pending'),
+        homework_completed = homework_completed {sign} (SELECT COUNT(*)
+            FROM Assignments a JOIN Homework h ON h.id = a.homework_id
+            WHERE a.student_id = {row}.id AND h.status = 'completed'),
+        tasks_incomplete = tasks_incomplete {sign} (SELECT COUNT(*)
+            FROM Assignments a JOIN Tasks t ON t.id = a.task_id
+            WHERE a.student_id = {row}.id AND t.status = 'incomplete'),
+        tasks_completed = tasks_completed {sign} (SELECT COUNT(*)
+            FROM Assignments a JOIN Tasks t ON t.id = a.task_id
+            WHERE a.student_id = {row}.id AND t.status = 'completed')
+    WHERE teacher_id = {row}.teacher_id;"""
+
+
+def _work_delta(table: str, row: str, sign: str) -> str:
+    """
+    Adds or removes the assignments of one Homework or Tasks row for every
+    teacher that has them, under the row's status.
+    """
+    column, first, second = {
+        "Homework": ("homework_id", "homework_pending", "homework_completed"),
+        "Tasks": ("task_id", "tasks_incomplete", "tasks_completed"),
+    }[table]
+    first_status = "pending" if table == "Homework" else "incomplete"
+    count = f"""(SELECT COUNT(*) FROM Assignments a
+        JOIN Students s ON s.id = a.student_id
+        WHERE a.{column} = {row}.id
+        AND s.teacher_id = TeacherSummary.teacher_id)"""
+    return f"""
+    UPDATE TeacherSummary SET
+        {first} = {first} {sign} CASE WHEN {row}.status = '{first_status}'
+            THEN {count} ELSE 0 END,
+        {second} = {second} {sign} CASE WHEN {row}.status = 'completed'
+            THEN {count} ELSE 0 END
+    WHERE teacher_id IN (SELECT s.teacher_id FROM Assignments a
+        JOIN Students s ON s.id = a.student_id
+        WHERE a.{column} = {row}.id);"""
+
+
+def _status_count(table: str, row: str, sign: str) -> str:
+    if sign == "+":
+        return f"""
+    INSERT INTO StatusSummary (entity, status, total)
+    VALUES ('{table}', {row}.status, 1)
+    ON CONFLICT (entity, status) DO UPDATE SET total = total + 1;"""
+    return f"""
+    UPDATE StatusSummary SET total = total - 1
+    WHERE entity = '{table}' AND status = {row}.status;"""
+
+
+def _ensure_teacher(student_row: str) -> str:
+    return f"""
+    INSERT OR IGNORE INTO TeacherSummary (teacher_id)
+    SELECT teacher_id FROM Students WHERE id = {student_row}.student_id;"""
+
+
+SUMMARY_TRIGGERS = {
+    "students_summary_insert":
+        ("AFTER INSERT ON Students",
+         "INSERT OR IGNORE INTO TeacherSummary (teacher_id) "
+         "VALUES (NEW.teacher_id);" + _student_delta("NEW", "+")),
+    "students_summary_delete":
+        ("AFTER DELETE ON Students", _student_delta("OLD", "-")),
+    "students_summary_move":
+        ("AFTER UPDATE OF teacher_id ON Students "
+         "WHEN OLD.teacher_id IS NOT NEW.teacher_id",
+         _student_delta("OLD", "-")
+         + "INSERT OR IGNORE INTO TeacherSummary (teacher_id) "
+           "VALUES (NEW.teacher_id);" + _student_delta("NEW", "+")),
+    "assignments_summary_insert":
+        ("AFTER INSERT ON Assignments",
+         _ensure_teacher("NEW") + _assignment_delta("NEW", "+")),
+    "assignments_summary_delete":
+        ("AFTER DELETE ON Assignments", _assignment_delta("OLD", "-")),
+    "assignments_summary_update":
+        ("AFTER UPDATE OF student_id, homework_id, task_id ON Assignments",
+         _assignment_delta("OLD", "-") + _ensure_teacher("NEW")
+         + _assignment_delta("NEW", "+")),
+    "homework_summary_insert":
+        ("AFTER INSERT ON Homework", _status_count("Homework", "NEW", "+")),
+    "homework_summary_delete":
+        ("AFTER DELETE ON Homework",
+         _status_count("Homework", "OLD", "-")
+         + _work_delta("Homework", "OLD", "-")),
+    "homework_summary_status":
+        ("AFTER UPDATE OF status ON Homework "
+         "WHEN OLD.status IS NOT NEW.status",
+         _status_count("Homework", "OLD", "-")
+         + _status_count("Homework", "NEW", "+")
+         + _work_delta("Homework", "OLD", "-")
+         + _work_delta("Homework", "NEW", "+")),
+    "tasks_summary_insert":
+        ("AFTER INSERT ON Tasks", _status_count("Tasks", "NEW", "+")),
+    "tasks_summary_delete":
+        ("AFTER DELETE ON Tasks",
+         _status_count("Tasks", "OLD", "-") + _work_delta("Tasks", "OLD", "-")),
+    "tasks_summary_status":
+        ("AFTER UPDATE OF status ON Tasks WHEN OLD.status IS NOT NEW.status",
+         _status_count("Tasks", "OLD", "-")
+         + _status_count("Tasks", "NEW", "+")
+         + _work_delta("Tasks", "OLD", "-")
+         + _work_delta("Tasks", "NEW", "+")),
+}
+
+
+def _rebuild_summaries(cursor):
+    cursor.execute("DELETE FROM TeacherSummary")
+    cursor.execute("DELETE FROM StatusSummary")
+    cursor.execute("""
+    INSERT INTO TeacherSummary (teacher_id, students, homework_pending,
+        homework_completed, tasks_incomplete, tasks_completed)
+    SELECT s.teacher_id, COUNT(DISTINCT s.id),
+        COALESCE(SUM(h.status = 'pending'), 0),
+        COALESCE(SUM(h.status = 'completed'), 0),
+        COALESCE(SUM(t.status = 'incomplete'), 0),
+        COALESCE(SUM(t.status = 'completed'), 0)
+    FROM Students s
+    LEFT JOIN Assignments a ON a.student_id = s.id
+    LEFT JOIN Homework h ON h.id = a.homework_id
+    LEFT JOIN Tasks t ON t.id = a.task_id
+    GROUP BY s.teacher_id""")
+    cursor.execute("""
+    INSERT INTO StatusSummary (entity, status, total)
+    SELECT 'Homework', status, COUNT(*) FROM Homework GROUP BY status
+    UNION ALL
+    SELECT 'Tasks', status, COUNT(*) FROM Tasks GROUP BY status""")
+
+
+def _v5_summary_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS TeacherSummary (
+        teacher_id INTEGER PRIMARY KEY,
+        students INTEGER NOT NULL DEFAULT 0,
+        homework_pending INTEGER NOT NULL DEFAULT 0,
+        homework_completed INTEGER NOT NULL DEFAULT 0,
+        tasks_incomplete INTEGER NOT NULL DEFAULT 0,
+        tasks_completed INTEGER NOT NULL DEFAULT 0
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS StatusSummary (
+        entity TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity, status)
+    )""")
+    for name, (event, body) in SUMMARY_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+    _rebuild_summaries(cursor)
+
+
+"""Full-text search over homework and tasks"""
+# HomeworkSearch and TaskSearch are FTS5 indexes over the title and
+# description of Homework and Tasks. They are external-content tables: the
+# text stays in the base tables and the index only holds the tokens, keyed
+# by the base row's id. The triggers below keep them in sync on every
+# insert, delete and title/description change, whichever code path writes.
+# Prefix indexes for 2 and 3 characters keep search-as-you-type queries
+# ("surah al-ba*") as fast as whole-word ones.
+SEARCH_INDEXES = {"HomeworkSearch": "Homework", "TaskSearch": "Tasks"}
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2"
+
+
+def _search_triggers(index: str, table: str) -> dict:
+    insert = (f"INSERT INTO {index} (rowid, title, description) "
+              f"VALUES (NEW.id, NEW.title, NEW.description);")
+    delete = (f"INSERT INTO {index} ({index}, rowid, title, description) "
+              f"VALUES ('delete', OLD.id, OLD.title, OLD.description);")
+    prefix = table.lower()
+    return {
+        f"{prefix}_search_insert": (f"AFTER INSERT ON {table}", insert),
+        f"{prefix}_search_delete": (f"AFTER DELETE ON {table}", delete),
+        f"{prefix}_search_update":
+            (f"AFTER UPDATE OF title, description ON {table}",
+             delete + insert),
+    }
+
+
+SEARCH_TRIGGERS = {name: trigger
+                   for index, table in SEARCH_INDEXES.items()
+                   for name, trigger in _search_triggers(index,
+                                                         table).items()}
+
+
+def _rebuild_search(cursor):
+    for index in SEARCH_INDEXES:
+        cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+def _v6_search_index(cursor):
+    for index, table in SEARCH_INDEXES.items():
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+            title, description,
+            content='{table}', content_rowid='id',
+            tokenize='{SEARCH_TOKENIZER}', prefix='2 3'
+        )""")
+    for name, (event, body) in SEARCH_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+    _rebuild_search(cursor)
+
+
+"""Change tracking for client sync"""
+# Every insert, update and delete on the tracked tables is recorded in
+# ChangeLog by the triggers below, under a new version from its
+# AUTOINCREMENT key, and the row's row_version is set to that version.
+# ChangeLog keeps one entry per row, its latest change (INSERT OR REPLACE
+# on (entity, row_id)), so it stays as large as the tables plus tombstones
+# for deleted rows. Clients sync by asking for entries after the highest
+# version they have seen; prune_changes() drops old tombstones and moves
+# ChangeLogState.pruned_through so clients further behind know to resync.
+TRACKED_TABLES = ("Users", "Students", "Homework", "Tasks", "Assignments")
+
+
+def _log_change(table: str, row: str, deleted: int) -> str:
+    return f"""
+    INSERT OR REPLACE INTO ChangeLog (entity, row_id, deleted, changed_at)
+    VALUES ('{table}', {row}.id, {deleted},
+            CAST(strftime('%s', 'now') AS INTEGER));"""
+
+
+def _stamp(table: str) -> str:
+    # Inside a trigger, last_insert_rowid() is the ChangeLog version
+    return f"""
+    UPDATE {table} SET row_version = last_insert_rowid()
+    WHERE id = NEW.id;"""
+
+
+def _change_triggers(table: str) -> dict:
+    prefix = table.lower()
+    return {
+        f"{prefix}_changes_insert":
+            (f"AFTER INSERT ON {table}",
+             _log_change(table, "NEW", 0) + _stamp(table)),
+        # The stamp is an update too; it changes row_version, so it is
+        # not logged again
+        f"{prefix}_changes_update":
+            (f"AFTER UPDATE ON {table} "
+             f"WHEN NEW.row_version IS OLD.row_version",
+             _log_change(table, "NEW", 0) + _stamp(table)),
+        f"{prefix}_changes_delete":
+            (f"AFTER DELETE ON {table}", _log_change(table, "OLD", 1)),
+    }
+
+
+CHANGE_TRIGGERS = {name: trigger for table in TRACKED_TABLES
+                   for name, trigger in _change_triggers(table).items()}
+
+
+def _v7_change_log(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ChangeLog (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        changed_at INTEGER NOT NULL,
+        UNIQUE (entity, row_id)
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changelog_entity_version "
+                   "ON ChangeLog (entity, version)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ChangeLogState (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        pruned_through INTEGER NOT NULL DEFAULT 0
+    )""")
+    cursor.execute("INSERT OR IGNORE INTO ChangeLogState (id) VALUES (1)")
+    for table in TRACKED_TABLES:
+        if "row_version" not in _columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN "
+                           f"row_version INTEGER NOT NULL DEFAULT 0")
+        # Existing rows start out as one change each
+        cursor.execute(f"""
+        INSERT OR IGNORE INTO ChangeLog (entity, row_id, changed_at)
+        SELECT '{table}', id, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM {table} ORDER BY id""")
+        cursor.execute(f"""
+        UPDATE {table} SET row_version = (SELECT version FROM ChangeLog
+            WHERE entity = '{table}' AND row_id = {table}.id)""")
+    for name, (event, body) in CHANGE_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base schema", _v1_base_schema),
+    (2, "hot path indexes", _v2_hot_path_indexes),
+    (3, "homework ayah ordinals", _v3_homework_ayah_ordinals),
+    (4, "student coverage bitmaps", _v4_student_coverage),
+    (5, "dashboard summary tables", _v5_summary_tables),
+    (6, "full-text search indexes", _v6_search_index),
+    (7, "change log for client sync", _v7_change_log),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _tables(cursor) -> List[str]:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _columns(cursor, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def get_schema_version(connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection=None) -> int:
+    """
+    Applies every migration newer than the database's recorded version, each
+    in its own transaction. Returns the resulting schema version.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+    try:
+        for version, description, apply in MIGRATIONS:
+            if get_schema_version(connection) >= version:
+                continue
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited
+                if get_schema_version(connection) < version:
+                    apply(connection.cursor())
+                    connection.execute(f"PRAGMA user_version = {version}")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        return get_schema_version(connection)
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def rebuild_summaries(connection=None):
+    """
+    Recomputes TeacherSummary and StatusSummary from the base tables, e.g.
+    after restoring a backup or editing rows with the triggers dropped.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            _rebuild_summaries(connection.cursor())
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def rebuild_search(connection=None):
+    """
+    Rebuilds HomeworkSearch and TaskSearch from the base tables, e.g. after
+    bulk edits made with the triggers dropped.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            _rebuild_search(connection.cursor())
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def prune_changes(max_age_days: float = 30, connection=None) -> int:
+    """
+    Deletes tombstones of rows deleted more than max_age_days ago, except
+    each entity's latest change, which its list ETags are built from.
+    Clients whose cursor is older than the newest pruned tombstone must
+    resync from scratch. Returns the number of tombstones removed.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+            DELETE FROM ChangeLog WHERE deleted = 1
+            AND changed_at < CAST(strftime('%s', 'now') AS INTEGER) - ?
+            AND version < (SELECT MAX(version) FROM ChangeLog latest
+                           WHERE latest.entity = ChangeLog.entity)
+            RETURNING version""", (int(max_age_days * 86400),))
+            versions = [row[0] for row in cursor.fetchall()]
+            if versions:
+                cursor.execute("UPDATE ChangeLogState SET pruned_through = "
+                               "MAX(pruned_through, ?)", (max(versions),))
+            connection.commit()
+            return len(versions)
+        except Exception:
+            connection.rollback()
+            raise
+    finally:
+        if own_connection:
+            connection.close()
+
+
+"""Query plans of the hot paths"""
+# Every query here must be answered through an index. check_query_plans()
+# reports any that SQLite would run as a full table scan.
+HOT_QUERIES = {
+    "students by teacher":
+        ("SELECT * FROM Students WHERE teacher_id = ?", (1,)),
+    "students by parent":
+        ("SELECT * FROM Students WHERE parent_id = ?", (1,)),
+    "assignments by student":
+        ("SELECT * FROM Assignments WHERE student_id = ?", (1,)),
+    "assignments by homework":
+        ("SELECT * FROM Assignments WHERE homework_id = ?", (1,)),
+    "homework due between":
+        ("SELECT * FROM Homework WHERE due_date BETWEEN ? AND ?", (0, 1)),
+    "tasks starting between":
+        ("SELECT * FROM Tasks WHERE start_date BETWEEN ? AND ?", (0, 1)),
+    "tasks ending between":
+        ("SELECT * FROM Tasks WHERE end_date BETWEEN ? AND ?", (0, 1)),
+    "student homework feed":
+        ("SELECT a.id FROM Assignments a "
+         "LEFT JOIN Homework h ON h.id = a.homework_id "
+         "LEFT JOIN Tasks t ON t.id = a.task_id "
+         "WHERE a.student_id = ?", (1,)),
+    "homework completion by teacher":
+        ("SELECT h.id, s.classroom, COUNT(*) FROM Assignments a "
+         "JOIN Students s ON s.id = a.student_id "
+         "JOIN Homework h ON h.id = a.homework_id "
+         "WHERE s.teacher_id = ? GROUP BY h.id, s.classroom", (1,)),
+    "homework covering an ayah":
+        ("SELECT id FROM Homework WHERE ordinal_start <= ? "
+         "AND ordinal_end >= ?", (262, 262)),
+    "homework within a range":
+        ("SELECT id FROM Homework WHERE ordinal_start >= ? "
+         "AND ordinal_end <= ?", (8, 293)),
+    "homework search by teacher":
+        ("SELECT h.id FROM HomeworkSearch JOIN Homework h "
+         "ON h.id = HomeworkSearch.rowid WHERE HomeworkSearch MATCH ? "
+         "AND EXISTS (SELECT 1 FROM Assignments a "
+         "JOIN Students s ON s.id = a.student_id "
+         "WHERE a.homework_id = h.id AND s.teacher_id = ?)",
+         ('"memorize"', 1)),
+    "assignment history export by teacher":
+        ("SELECT a.id FROM Assignments a "
+         "JOIN Students s ON s.id = a.student_id "
+         "LEFT JOIN Homework h ON h.id = a.homework_id "
+         "LEFT JOIN Tasks t ON t.id = a.task_id "
+         "WHERE (s.id, a.id) > (?, ?) AND s.teacher_id = ? "
+         "ORDER BY s.id, a.id", (0, 0, 1)),
+    "changes since a version":
+        ("SELECT version, entity, row_id, deleted FROM ChangeLog "
+         "WHERE version > ? ORDER BY version LIMIT ?", (0, 100)),
+    "latest change of an entity":
+        ("SELECT MAX(version) FROM ChangeLog WHERE entity = ?", ("Users",)),
+}
+
+
+def check_query_plans(connection=None) -> List[str]:
+    """
+    Runs EXPLAIN QUERY PLAN over HOT_QUERIES. Returns one message per step
+    that scans a table without an index; an empty list means all is well.
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_db_connection()
+    problems = []
+    try:
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = connection.execute("EXPLAIN QUERY PLAN " + sql,
+                                      params).fetchall()
+            for row in plan:
+                detail = row[-1]
+                if detail.startswith("SCAN") and "INDEX" not in detail:
+                    problems.append(f"{name}: {detail}")
+    finally:
+        if own_connection:
+            connection.close()
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database maintenance")
+    parser.add_argument("command", choices=["migrate", "check-plans",
+                                            "rebuild-summaries",
+                                            "rebuild-search",
+                                            "prune-changes"])
+    parser.add_argument("--days", type=float, default=30,
+                        help="prune-changes: keep tombstones this recent")
+    args = parser.parse_args()
 
+    if args.command == "migrate":
+        print(f"Database is at schema version {migrate()}")
+    elif args.command == "check-plans":
+        migrate()
+        problems = check_query_plans()
+        for problem in problems:
+            print(f"Full table scan in {problem}")
+        if problems:
+            sys.exit(1)
+        print("All hot queries use an index.")
+    elif args.command == "rebuild-summaries":
+        migrate()
+        rebuild_summaries()
+        print("Summary tables rebuilt.")
+    elif args.command == "rebuild-search":
+        migrate()
+        rebuild_search()
+        print("Search indexes rebuilt.")
+    elif args.command == "prune-changes":
+        migrate()
+        print(f"Pruned {prune_changes(args.days)} tombstones.")
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from connection import get_detached_connection
+from records import Projection
+from snapshot import reporting_pool
+
+try:
+    import orjson
+except ImportError:  # optional; the standard json module is used instead
+    orjson = None
+
+"""Streaming export of assignment history"""
+# An export is one SELECT over Assignments joined with Students, Homework
+# and Tasks, read through a single cursor chunk_size rows at a time and
+# written out chunk by chunk, so memory stays flat however many rows there
+# are. The statement reads one consistent snapshot from start to finish,
+# from the reporting snapshot when that is enabled and fresh enough.
+#
+# Rows come in (student_id, assignment_id) order, which SQLite reads
+# straight off the primary key and idx_assignments_student_id without a
+# sort step. That pair is also the keyset cursor: an interrupted export is
+# resumed by passing "<student_id>:<assignment_id>" of the last row
+# received as after.
+EXPORT_FORMATS = ("csv", "ndjson")
+MEDIA_TYPES: Dict[str, str] = {"csv": "text/csv; charset=utf-8",
+                               "ndjson": "application/x-ndjson"}
+EXPORT_CHUNK_SIZE = 1000
+# Each export holds a pooled connection until it finishes; further exports
+# wait for a slot instead of starving the request handlers.
+MAX_CONCURRENT_EXPORTS = 2
+
+_export_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXPORTS)
+
+ASSIGNMENT_HISTORY = Projection(
+    "Assignments a JOIN Students s ON s.id = a.student_id "
+    "LEFT JOIN Homework h ON h.id = a.homework_id "
+    "LEFT JOIN Tasks t ON t.id = a.task_id",
+    ("s.id", "a.id", "s.name", "s.email", "s.classroom", "s.teacher_id",
+     "s.parent_id",
+     "CASE WHEN a.homework_id IS NOT NULL THEN 'homework' ELSE 'task' END",
+     "a.homework_id", "a.task_id", "COALESCE(h.title, t.title)",
+     "COALESCE(h.description, t.description)",
+     "COALESCE(h.status, t.status)", "COALESCE(h.due_date, t.end_date)",
+     "t.start_date", "h.chapter_start", "h.verse_start", "h.chapter_end",
+     "h.verse_end"),
+    ("student_id", "assignment_id", "student_name", "student_email",
+     "classroom", "teacher_id", "parent_id", "type", "homework_id",
+     "task_id", "title", "description", "status", "due_date", "start_date",
+     "chapter_start", "verse_start", "chapter_end", "verse_end"))
+
+
+def parse_cursor(after: Optional[str]) -> Tuple[int, int]:
+    """
+    Reads a "<student_id>:<assignment_id>" keyset cursor; no cursor starts
+    from the beginning. Raises ValueError for anything else.
+    """
+    if not after:
+        return 0, 0
+    student_id, sep, assignment_id = after.partition(":")
+    try:
+        if not sep:
+            raise ValueError
+        return int(student_id), int(assignment_id)
+    except ValueError:
+        raise ValueError("after must look like <student_id>:<assignment_id>")
+
+
+def iter_assignment_history(teacher_id: int = None, classroom: str = None,
+                            after: Tuple[int, int] = (0, 0),
+                            chunk_size: int = EXPORT_CHUNK_SIZE)\
+        -> Iterator[List[tuple]]:
+    """
+    Yields the assignment history in chunks of up to chunk_size row tuples,
+    in ASSIGNMENT_HISTORY.keys order.
+    Args:
+        teacher_id (int, optional): Only this teacher's students.
+        classroom (str, optional): Only students in this classroom.
+        after (Tuple[int, int]): Keyset cursor from parse_cursor(); only
+            rows after this (student_id, assignment_id) are exported.
+        chunk_size (int): Rows fetched per chunk.
+    """
+    conditions = ["(s.id, a.id) > (?, ?)"]
+    params: List[Any] = list(after)
+    if teacher_id is not None:
+        conditions.append("s.teacher_id = ?")
+        params.append(teacher_id)
+    if classroom is not None:
+        conditions.append("s.classroom = ?")
+        params.append(classroom)
+    sql = ASSIGNMENT_HISTORY.select(" AND ".join(conditions),
+                                    "ORDER BY s.id, a.id")
+
+    with _export_slots:
+        # Resumed from whichever thread the response is streamed on
+        pool = reporting_pool()
+        connection = pool.acquire_detached() if pool is not None \
+            else get_detached_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if rows:
+                    yield rows
+                if len(rows) < chunk_size:
+                    return
+        finally:
+            cursor.close()
+            connection.close()
+
+
+def to_csv(chunks: Iterator[List[tuple]]) -> Iterator[str]:
+    """A header line, then one block of CSV lines per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ASSIGNMENT_HISTORY.keys)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def to_ndjson(chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    """One block of newline-delimited JSON objects per chunk."""
+    keys = ASSIGNMENT_HISTORY.keys
+    for rows in chunks:
+        if orjson is not None:
+            yield b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n"
+                           for row in rows)
+        else:
+            yield "".join(json.dumps(dict(zip(keys, row))) + "\n"
+                          for row in rows).encode()
+
+
+def export_assignment_history(fmt: str, teacher_id: int = None,
+                              classroom: str = None, after: str = None,
+                              chunk_size: int = EXPORT_CHUNK_SIZE)\
+        -> Iterator:
+    """
+    The assignment history as CSV or NDJSON, ready for a StreamingResponse.
+    Raises ValueError for an unknown format or a malformed cursor before
+    anything is read.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Export format must be 'csv' or 'ndjson'")
+    chunks = iter_assignment_history(teacher_id, classroom,
+                                     parse_cursor(after), chunk_size)
+    return to_csv(chunks) if fmt == "csv" else to_ndjson(chunks)
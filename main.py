@@ -1,34 +1,469 @@
-from fastapi import FastAPI
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, \
+    Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, \
+    StreamingResponse
 #from databases import Database
 import sqlite3
-from crud import create_user, get_user_by_id, get_all_users, update_user, delete_user
+import async_crud as db
+import auth
+from async_crud import shutdown_executor
+from connection import get_pool, close_pool
+from dataBase import migrate
+from export import MEDIA_TYPES, export_assignment_history
+from metrics import get_slow_queries, observe_request, render, request_scope
+from passwords import HashingBusy, shutdown_pool
+from crud import validation_scope, iter_users, iter_students
+from roster_import import detect_format, iter_roster_rows
+from scheduler import DeadlineScheduler
+from snapshot import REPORT_SNAPSHOT, start_snapshots, stop_snapshots
+from tenants import TENANT_HEADER, UnknownSchool, close_tenant_pools, \
+    current_tenant, get_tenant_pool, open_pool, tenant_scope
+from writer import WriteQueueFull, shutdown_write_lane
+
+try:
+    import orjson
+except ImportError:  # optional; the standard json module is used instead
+    orjson = None
 
 """Use the folowing comamnd in the terminal to activate the env"""
 #env\Scripts\activate
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # All endpoints share one connection pool; close it cleanly on shutdown
+    get_pool()
+    migrate()
+    # Reminder/overdue callbacks log by default; replace them on the
+    # scheduler to send notifications
+    app.state.deadlines = DeadlineScheduler()
+    app.state.deadlines.start()
+    # Reports and exports read a periodically refreshed copy of the database
+    if REPORT_SNAPSHOT:
+        start_snapshots()
+    yield
+    stop_snapshots()
+    app.state.deadlines.stop()
+    # Waiting for queued writes and DB work must not block the event loop
+    await run_in_threadpool(shutdown_write_lane)
+    await run_in_threadpool(shutdown_executor)
+    shutdown_pool()
+    close_tenant_pools()
+    close_pool()
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson when it is installed. Endpoints that
+    return large lists build it themselves, which also skips FastAPI's
+    jsonable_encoder pass over every row.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+def entity_tag(*parts) -> str:
+    """Weak ETag from change versions and whatever else shapes the body."""
+    school = current_tenant()
+    if school is not None:
+        # Same URL, same versions, different school: different body
+        parts = (school,) + parts
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip()
+                                             for tag in header.split(","))
+
+def tagged_response(request: Request, etag: str, content=None):
+    """304 if the client already has this version, else content + ETag."""
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return FastJSONResponse(content, headers={"ETag": etag})
+
+@app.middleware("http")
+async def validation_scope_middleware(request, call_next):
+    # id checks are memoized for the rest of the request
+    with validation_scope():
+        return await call_next(request)
+
+@app.middleware("http")
+async def tenant_middleware(request, call_next):
+    # Requests naming a school run against that school's database
+    school = request.headers.get(TENANT_HEADER)
+    if school is None:
+        return await call_next(request)
+    pool = open_pool(school)
+    if pool is None:
+        try:
+            # A school's first request opens its pool and may migrate it
+            pool = await run_in_threadpool(get_tenant_pool, school)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except UnknownSchool as e:
+            return JSONResponse({"error": str(e)}, status_code=404)
+    with tenant_scope(school, pool):
+        return await call_next(request)
+
+@app.middleware("http")
+async def metrics_middleware(request, call_next):
+    # Added last, so it runs first and its timing includes the other
+    # middleware. Routes are labelled by path template, not the raw URL.
+    with request_scope() as stats:
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            observe_request(request.method,
+                            route.path if route else "unmatched", status,
+                            time.perf_counter() - started, stats)
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request, exc):
+    # Sign-in bursts are shed here rather than queueing behind each other
+    return JSONResponse({"error": str(exc)}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+@app.exception_handler(WriteQueueFull)
+async def write_queue_full_handler(request, exc):
+    # Backpressure from the writer lane: the client retries the write
+    return JSONResponse({"error": str(exc)}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/slow-queries")
+async def slow_queries_endpoint():
+    return get_slow_queries()
 
 # SQLite database connection
 DATABASE_URL = "sqlite:///./database.db"
 #database = Database(DATABASE_URL)
 
 @app.post("/users/")
-def create_user_endpoint(name: str, email: str, password: str, role: str):
-    return create_user(name, email, password, role)
+async def create_user_endpoint(name: str, email: str, password: str, role: str):
+    return await db.create_user(name, email, password, role)
 
 @app.get("/users/{user_id}")
-def get_user_endpoint(user_id: int):
-    return get_user_by_id(user_id)
+async def get_user_endpoint(user_id: int, request: Request):
+    user = await db.get_user_by_id(user_id)
+    if "error" in user:
+        return user
+    return tagged_response(request, entity_tag("Users", user_id,
+                                               user["row_version"]), user)
+
+# Page size limits for the listing endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def ndjson_response(rows):
+    """Streams rows as newline-delimited JSON while they are being read."""
+    if orjson is not None:
+        lines = (orjson.dumps(row) + b"\n" for row in rows)
+    else:
+        lines = (json.dumps(row) + "\n" for row in rows)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
 @app.get("/users/")
-def get_all_users_endpoint():
-    return get_all_users()
+async def get_all_users_endpoint(request: Request,
+                                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1,
+                                                    le=MAX_PAGE_SIZE),
+                                 after: int = 0, stream: bool = False):
+    # stream=true returns every user after the cursor as NDJSON
+    if stream:
+        return ndjson_response(iter_users(after))
+    # The version is read before the page, so a write in between can only
+    # make the tag older than the body, never newer
+    version, = await db.get_entity_versions("Users")
+    etag = entity_tag("Users", version, limit, after)
+    if not_modified(request, etag):
+        return tagged_response(request, etag)
+    return tagged_response(request, etag,
+                           await db.get_all_users(limit, after))
 
 @app.put("/users/{user_id}")
-def update_user_endpoint(user_id: int, name: str = None, email: str = None, role: str = None):
-    return update_user(user_id, name, email, role)
+async def update_user_endpoint(user_id: int, name: str = None, email: str = None, role: str = None,
+                               password: str = None):
+    return await db.update_user(user_id, name, email, role, password)
 
 @app.delete("/users/{user_id}")
-def delete_user_endpoint(user_id: int):
-    return delete_user(user_id)
+async def delete_user_endpoint(user_id: int):
+    return await db.delete_user(user_id)
+
+def _bearer_token(authorization: str) -> str:
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    return token
+
+@app.post("/login")
+async def login_endpoint(email: str = Form(...), password: str = Form(...)):
+    session = await auth.login(email, password)
+    if session is None:
+        raise HTTPException(status_code=401,
+                            detail="Invalid email or password")
+    return session
+
+@app.get("/session")
+async def session_endpoint(authorization: str = Header(None)):
+    user = await auth.get_session(_bearer_token(authorization))
+    if user is None:
+        raise HTTPException(status_code=401, detail="Session expired")
+    return user
+
+async def require_admin(authorization: str = Header(None)):
+    """
+    Dependency of the cross-school endpoints: an admin signed in to the
+    default database. Admins of a single school (X-School sessions) are
+    refused.
+    """
+    user = await auth.get_session(_bearer_token(authorization))
+    if user is None:
+        raise HTTPException(status_code=401, detail="Session expired")
+    if user["role"] != "admin" or current_tenant() is not None:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@app.post("/logout")
+async def logout_endpoint(authorization: str = Header(None)):
+    auth.logout(_bearer_token(authorization))
+    return {"message": "Signed out"}
+
+# Rows per import transaction; each chunk is hashed and inserted at once
+MAX_IMPORT_CHUNK = 10000
+
+@app.post("/users/import")
+async def import_users_endpoint(file: UploadFile = File(...),
+                                format: str = None,
+                                chunk_size: int = Query(
+                                    1000, ge=1, le=MAX_IMPORT_CHUNK)):
+    try:
+        fmt = detect_format(file.filename, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await db.bulk_create_users(iter_roster_rows(file.file, fmt),
+                                      chunk_size)
+
+@app.post("/students/import")
+async def import_students_endpoint(file: UploadFile = File(...),
+                                   format: str = None,
+                                   chunk_size: int = Query(
+                                       1000, ge=1, le=MAX_IMPORT_CHUNK)):
+    try:
+        fmt = detect_format(file.filename, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await db.bulk_create_students(iter_roster_rows(file.file, fmt),
+                                         chunk_size)
+
+@app.get("/students/")
+async def get_all_students_endpoint(request: Request,
+                                    limit: int = Query(DEFAULT_PAGE_SIZE,
+                                                       ge=1, le=MAX_PAGE_SIZE),
+                                    after: int = 0, stream: bool = False):
+    if stream:
+        return ndjson_response(iter_students(after))
+    version, = await db.get_entity_versions("Students")
+    etag = entity_tag("Students", version, limit, after)
+    if not_modified(request, etag):
+        return tagged_response(request, etag)
+    return tagged_response(request, etag,
+                           await db.get_all_students(limit, after))
+
+@app.get("/exports/assignments")
+async def export_assignments_endpoint(format: str = "csv",
+                                      teacher_id: int = None,
+                                      classroom: str = None,
+                                      after: str = None):
+    # Every row carries student_id and assignment_id; an interrupted export
+    # resumes with after=<student_id>:<assignment_id> of the last row
+    try:
+        body = export_assignment_history(format, teacher_id, classroom,
+                                         after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format], headers={
+        "Content-Disposition":
+            f'attachment; filename="assignments.{format}"'})
+
+@app.get("/students/{student_id}/homework")
+async def get_student_homework_endpoint(request: Request, student_id: int,
+                                        status: str = None,
+                                        due_after: int = None,
+                                        due_before: int = None,
+                                        descending: bool = False,
+                                        limit: int = Query(DEFAULT_PAGE_SIZE,
+                                                           ge=1,
+                                                           le=MAX_PAGE_SIZE),
+                                        offset: int = Query(0, ge=0)):
+    versions = await db.get_entity_versions("Assignments", "Homework",
+                                            "Tasks")
+    etag = entity_tag("feed", student_id, *versions, status, due_after,
+                      due_before, descending, limit, offset)
+    if not_modified(request, etag):
+        return tagged_response(request, etag)
+    return tagged_response(request, etag, await db.get_student_homework(
+        student_id, status, due_after, due_before, descending, limit, offset))
+
+@app.get("/homework/completion")
+async def get_homework_completion_endpoint(teacher_id: int = None,
+                                           homework_id: int = None,
+                                           classroom: str = None):
+    return FastJSONResponse(await db.get_homework_completion(
+        teacher_id, homework_id, classroom))
+
+@app.get("/homework/covering")
+async def get_homework_covering_endpoint(chapter: int, verse: int,
+                                         limit: int = Query(DEFAULT_PAGE_SIZE,
+                                                            ge=1,
+                                                            le=MAX_PAGE_SIZE)):
+    return FastJSONResponse(await db.get_homework_covering(chapter, verse,
+                                                           limit))
+
+@app.get("/homework/overlapping")
+async def get_homework_overlapping_endpoint(chapter_start: int,
+                                            verse_start: int,
+                                            chapter_end: int, verse_end: int,
+                                            limit: int = Query(
+                                                DEFAULT_PAGE_SIZE, ge=1,
+                                                le=MAX_PAGE_SIZE)):
+    return FastJSONResponse(await db.get_homework_overlapping(
+        chapter_start, verse_start, chapter_end, verse_end, limit))
+
+@app.get("/homework/within")
+async def get_homework_within_endpoint(chapter_start: int, verse_start: int,
+                                       chapter_end: int, verse_end: int,
+                                       limit: int = Query(DEFAULT_PAGE_SIZE,
+                                                          ge=1,
+                                                          le=MAX_PAGE_SIZE)):
+    return FastJSONResponse(await db.get_homework_within(
+        chapter_start, verse_start, chapter_end, verse_end, limit))
+
+@app.get("/homework/{homework_id}/students")
+async def get_assigned_students_endpoint(homework_id: int):
+    return FastJSONResponse(await db.get_assigned_students(homework_id))
+
+@app.post("/assignments/roster")
+async def assign_to_roster_endpoint(teacher_id: int = None,
+                                    classroom: str = None,
+                                    homework_id: int = None,
+                                    task_id: int = None):
+    return await db.assign_to_roster(teacher_id, classroom, homework_id,
+                                     task_id)
+
+@app.put("/homework/status")
+async def set_homework_status_endpoint(status: str,
+                                       ids: List[int] = Query(...)):
+    return await db.set_status("homework", ids, status)
+
+@app.put("/tasks/status")
+async def set_task_status_endpoint(status: str, ids: List[int] = Query(...)):
+    return await db.set_status("task", ids, status)
+
+# Single-row edits; these and the status endpoints above go through the
+# writer lane and may answer 503 when it is full
+
+@app.put("/students/{student_id}")
+async def update_student_endpoint(student_id: int, name: str = None,
+                                  email: str = None, parent_id: int = None,
+                                  teacher_id: int = None,
+                                  classroom: str = None):
+    return await db.update_student(student_id, name=name, email=email,
+                                   parent_id=parent_id,
+                                   teacher_id=teacher_id, classroom=classroom)
+
+@app.put("/homework/{homework_id}")
+async def update_homework_endpoint(homework_id: int, title: str = None,
+                                   description: str = None,
+                                   chapter_start: int = None,
+                                   chapter_end: int = None,
+                                   verse_start: int = None,
+                                   verse_end: int = None,
+                                   due_date: int = None, status: str = None):
+    return await db.update_homework(
+        homework_id, title=title, description=description,
+        chapter_start=chapter_start, chapter_end=chapter_end,
+        verse_start=verse_start, verse_end=verse_end, due_date=due_date,
+        status=status)
+
+@app.put("/tasks/{task_id}")
+async def update_task_endpoint(task_id: int, title: str = None,
+                               description: str = None,
+                               start_date: int = None, end_date: int = None,
+                               status: str = None):
+    return await db.update_task(task_id, title, description, start_date,
+                                end_date, status)
+
+@app.put("/assignments/{assignment_id}")
+async def update_assignment_endpoint(assignment_id: int,
+                                     student_id: int = None,
+                                     homework_id: int = None,
+                                     task_id: int = None):
+    return await db.update_assignment(assignment_id, student_id, homework_id,
+                                      task_id)
+
+@app.get("/students/{student_id}/coverage")
+async def get_student_coverage_endpoint(student_id: int):
+    return await db.get_student_coverage(student_id)
+
+@app.get("/classrooms/{classroom}/coverage")
+async def get_classroom_coverage_endpoint(classroom: str,
+                                          teacher_id: int = None):
+    return FastJSONResponse(await db.get_classroom_coverage(classroom,
+                                                            teacher_id))
+
+@app.get("/teachers/{teacher_id}/summary")
+async def get_teacher_summary_endpoint(teacher_id: int):
+    return await db.get_teacher_summary(teacher_id)
+
+@app.get("/summary")
+async def get_status_summary_endpoint():
+    return await db.get_status_summary()
+
+@app.get("/search")
+async def search_endpoint(q: str, kind: str = None, teacher_id: int = None,
+                          classroom: str = None,
+                          limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                          offset: int = Query(0, ge=0)):
+    return FastJSONResponse(await db.search(q, kind, teacher_id, classroom,
+                                            limit, offset))
+
+@app.get("/changes")
+async def get_changes_endpoint(since: int = Query(0, ge=0),
+                               limit: int = Query(500, ge=1,
+                                                  le=MAX_PAGE_SIZE),
+                               entity: List[str] = Query(None)):
+    # Poll with since=<cursor> from the previous response until has_more
+    # is false; a pruned cursor gets 410 and the client resyncs from 0
+    changes = await db.get_changes(since, limit, entity)
+    if changes.get("resync"):
+        return JSONResponse(changes, status_code=410)
+    return FastJSONResponse(changes)
+
+@app.post("/admin/schools", dependencies=[Depends(require_admin)])
+async def create_school_endpoint(school: str):
+    return await db.create_school(school)
 
+@app.get("/admin/schools", dependencies=[Depends(require_admin)])
+async def get_school_totals_endpoint():
+    return FastJSONResponse(await db.get_school_totals())
 
+@app.get("/admin/users", dependencies=[Depends(require_admin)])
+async def find_users_by_email_endpoint(email: str):
+    return FastJSONResponse(await db.find_users_by_email(email))
@@ -0,0 +1,392 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, \
+    Sequence, Tuple
+
+from connection import add_checkout_hook, add_connection_hook, \
+    set_cursor_factory
+
+logger = logging.getLogger(__name__)
+
+"""Request and SQL statement metrics in Prometheus text format"""
+# Statements are timed by TimedCursor, the cursor class handed out by the
+# pool, from execute() until the last row is fetched or the cursor goes
+# away. sqlite3's trace callback counts every statement that runs,
+# including trigger invocations, and the progress handler counts
+# VM steps, which shows full scans even when they are fast. Everything is
+# kept in plain counters behind one lock per metric, so it stays on in
+# production. DB_METRICS=off disables the SQL-level hooks.
+METRICS_ENABLED = os.environ.get("DB_METRICS", "on") != "off"
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", 100)) / 1000
+SLOW_QUERY_LOG_SIZE = 100
+# The progress handler runs once per this many SQLite VM instructions
+PROGRESS_STEPS = 10000
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+STEP_BUCKETS = (1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n")\
+        .replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any],
+            extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names,
+                                                                 values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str,
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values,
+                                                          0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} "
+                         f"{value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str,
+                 buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, [list(counts), total, count])
+                           for key, (counts, total, count)
+                           in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),),
+                                     counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """A value that goes up and down, set directly or read at scrape time."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Reports function() on every scrape instead of the set value."""
+        self._function = function
+
+    def render(self) -> List[str]:
+        value = self._function() if self._function else self._value
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+HTTP_DURATION = Histogram("http_request_duration_seconds",
+                          "Time to produce the response headers",
+                          labels=("method", "route", "status"))
+REQUEST_QUERIES = Histogram("db_queries_per_request",
+                            "SQL statements run per request, including "
+                            "trigger statements", COUNT_BUCKETS, ("route",))
+REQUEST_DB_TIME = Histogram("db_time_per_request_seconds",
+                            "Time spent in SQL statements per request",
+                            labels=("route",))
+REQUEST_VM_STEPS = Histogram("sqlite_vm_steps_per_request",
+                             "SQLite VM instructions per request, in units "
+                             f"of {PROGRESS_STEPS}", STEP_BUCKETS,
+                             ("route",))
+STATEMENT_DURATION = Histogram("sqlite_statement_duration_seconds",
+                               "Time from execute() until the last row is "
+                               "fetched", labels=("statement",))
+STATEMENTS = Counter("sqlite_statements_total",
+                     "Statements run, counting each trigger invocation")
+SLOW_QUERIES = Counter("sqlite_slow_queries_total",
+                       f"Statements slower than {SLOW_QUERY_SECONDS}s",
+                       ("statement",))
+CONNECTIONS_OPENED = Counter("sqlite_connections_opened_total",
+                             "Raw SQLite connections opened by the pool")
+POOL_WAIT = Histogram("db_pool_wait_seconds",
+                      "Time spent waiting to check a pooled connection out")
+DB_CALL_DURATION = Histogram("db_call_duration_seconds",
+                             "Run time of crud functions called from "
+                             "endpoints", labels=("function",))
+DB_QUEUE_WAIT = Histogram("db_executor_wait_seconds",
+                          "Time crud calls waited for a DB worker thread")
+SNAPSHOT_AGE = Gauge("report_snapshot_age_seconds",
+                     "How far the reporting snapshot lags the primary "
+                     "database; -1 without a snapshot")
+SNAPSHOT_GENERATION = Gauge("report_snapshot_generation",
+                            "Reporting snapshots taken since startup")
+SNAPSHOT_REFRESH_DURATION = Histogram("report_snapshot_refresh_seconds",
+                                      "Time to copy the database into a "
+                                      "new reporting snapshot")
+SNAPSHOT_REFRESH_FAILURES = Counter("report_snapshot_refresh_failures_total",
+                                    "Snapshot refreshes that failed")
+SNAPSHOT_READS = Counter("report_reads_total",
+                         "Report reads by the database that served them",
+                         ("target",))
+WRITE_QUEUE_DEPTH = Gauge("write_queue_depth",
+                          "Writes waiting for the single writer thread")
+WRITE_BATCH_SIZE = Histogram("write_batch_size",
+                             "Writes applied per group commit",
+                             COUNT_BUCKETS)
+WRITE_QUEUE_WAIT = Histogram("write_queue_wait_seconds",
+                             "Time writes waited for the writer thread")
+WRITE_COMMIT_DURATION = Histogram("write_batch_commit_seconds",
+                                  "Time to apply and commit one batch")
+WRITES_REJECTED = Counter("write_queue_rejected_total",
+                          "Writes refused because the queue was full")
+
+REGISTRY = [HTTP_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME,
+            REQUEST_VM_STEPS, STATEMENT_DURATION, STATEMENTS, SLOW_QUERIES,
+            CONNECTIONS_OPENED, POOL_WAIT, DB_CALL_DURATION, DB_QUEUE_WAIT,
+            SNAPSHOT_AGE, SNAPSHOT_GENERATION, SNAPSHOT_REFRESH_DURATION,
+            SNAPSHOT_REFRESH_FAILURES, SNAPSHOT_READS, WRITE_QUEUE_DEPTH,
+            WRITE_BATCH_SIZE, WRITE_QUEUE_WAIT, WRITE_COMMIT_DURATION,
+            WRITES_REJECTED]
+
+_slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+class RequestStats:
+    """Per-request totals, shared with the DB worker threads via contextvars."""
+    __slots__ = ("queries", "db_time", "vm_steps")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.vm_steps = 0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = \
+    ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestStats]:
+    """Collects query counts and DB time for the code run inside it."""
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def observe_request(method: str, route: str, status: int, elapsed: float,
+                    stats: RequestStats):
+    HTTP_DURATION.observe(elapsed, method, route, status)
+    REQUEST_QUERIES.observe(stats.queries, route)
+    REQUEST_DB_TIME.observe(stats.db_time, route)
+    REQUEST_VM_STEPS.observe(stats.vm_steps / PROGRESS_STEPS, route)
+
+
+@lru_cache(maxsize=4096)
+def statement_label(sql: str) -> str:
+    """Low-cardinality name for a statement, e.g. "SELECT Users"."""
+    words = sql.split(None, 1)
+    if not words:
+        return "EMPTY"
+    verb = words[0].upper()
+    match = re.search(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w\"]+)", sql,
+                      re.IGNORECASE)
+    return f"{verb} {match.group(1).strip(chr(34))}" if match else verb
+
+
+def _record(sql: str, elapsed: float):
+    label = statement_label(sql)
+    STATEMENT_DURATION.observe(elapsed, label)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_time += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc(1, label)
+        _slow_queries.append({"statement": label, "sql": " ".join(sql.split()),
+                              "ms": round(1000 * elapsed, 3),
+                              "at": int(time.time())})
+        logger.warning("Slow query (%.1f ms): %s", 1000 * elapsed,
+                       " ".join(sql.split()))
+
+
+def get_slow_queries() -> List[Dict[str, Any]]:
+    """The most recent slow statements, newest last."""
+    return list(_slow_queries)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that times each statement from execute() until its rows are
+    used up, the cursor is reused or closed, or it is garbage collected.
+    """
+    __slots__ = ("_sql", "_elapsed")
+
+    def __init__(self, connection: sqlite3.Connection):
+        super().__init__(connection)
+        self._sql = None
+        self._elapsed = 0.0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            _record(sql, self._elapsed)
+
+    def execute(self, sql: str, parameters=()) -> "TimedCursor":
+        self._finish()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            _record(sql, time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            # Nothing to fetch
+            _record(sql, elapsed)
+        else:
+            self._sql, self._elapsed = sql, elapsed
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters) -> "TimedCursor":
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size: int = None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - started
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+def _trace(sql: str):
+    # sqlite3 reports each trigger invocation as another run of the
+    # statement that fired it
+    STATEMENTS.inc()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+def _progress() -> int:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.vm_steps += PROGRESS_STEPS
+    # Returning 0 lets the statement carry on
+    return 0
+
+
+def _instrument(raw: sqlite3.Connection):
+    CONNECTIONS_OPENED.inc()
+    raw.set_trace_callback(_trace)
+    raw.set_progress_handler(_progress, PROGRESS_STEPS)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+if METRICS_ENABLED:
+    add_connection_hook(_instrument)
+    add_checkout_hook(POOL_WAIT.observe)
+    set_cursor_factory(TimedCursor)
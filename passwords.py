@@ -0,0 +1,173 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+
+"""Password hashing with scrypt, run in a bounded process pool"""
+# scrypt costs tens of milliseconds of CPU per call by design. Running it in
+# worker processes keeps it off the event loop, the DB threads and the GIL,
+# and HASH_WORKERS caps how many cores sign-in bursts can take. At most
+# HASH_MAX_PENDING hashes may be queued; past that, async callers get
+# HashingBusy straight away instead of piling up behind the burst. Bulk
+# hashing (imports) has its own, smaller HASH_BULK_MAX_PENDING, so a large
+# import waits for its own slots and never takes the ones sign-ins need.
+#
+# Stored format: scrypt$<n>$<r>$<p>$<salt>$<hash>, base64 without padding.
+# Anything else in Users.password is a legacy plaintext password.
+SCRYPT_N = int(os.environ.get("SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.environ.get("SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", 1))
+SALT_BYTES = 16
+KEY_BYTES = 32
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS",
+                                  max(1, (os.cpu_count() or 2) // 2)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 64))
+HASH_BULK_MAX_PENDING = int(os.environ.get("HASH_BULK_MAX_PENDING", 8))
+# How long blocking callers wait for a free slot before giving up
+HASH_WAIT_TIMEOUT = 30
+
+PREFIX = "scrypt$"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(HASH_MAX_PENDING)
+_bulk_pending = threading.BoundedSemaphore(HASH_BULK_MAX_PENDING)
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued."""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n, dklen=KEY_BYTES)
+
+
+def hash_password(password: str, n: int = SCRYPT_N, r: int = SCRYPT_R,
+                  p: int = SCRYPT_P) -> str:
+    """Hashes a password in the calling process. Prefer the pooled calls."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return f"{PREFIX}{n}${r}${p}${_b64(salt)}${_b64(key)}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PREFIX)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True for plaintext passwords and hashes made with other parameters."""
+    if not is_hashed(stored):
+        return True
+    _, n, r, p, _, _ = stored.split("$")
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """Checks a password against a stored hash or legacy plaintext value."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        expected = _unb64(key)
+        actual = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def _hash_many(passwords: List[str], n: int, r: int, p: int) -> List[str]:
+    return [hash_password(password, n, r, p) for password in passwords]
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a process that runs DB threads is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    """Stops the worker processes. Called from the app lifespan."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _submit(wait: bool, func, *args,
+            slots: threading.BoundedSemaphore = None) -> Future:
+    """
+    Queues func in the pool, holding one of slots (the sign-in slots by
+    default) until it is done.
+    """
+    slots = slots or _pending
+    if not slots.acquire(blocking=wait,
+                         timeout=HASH_WAIT_TIMEOUT if wait else None):
+        raise HashingBusy("Too many sign-in requests, try again shortly")
+    try:
+        future = get_pool().submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def hash_in_pool(password: str) -> str:
+    """Hashes a password in the pool, blocking the calling thread."""
+    return _submit(True, hash_password, password, SCRYPT_N, SCRYPT_R,
+                   SCRYPT_P).result()
+
+
+def hash_many_in_pool(passwords: List[str], batch_size: int = 50)\
+        -> List[str]:
+    """
+    Hashes many passwords, batch_size per task, e.g. for imports. Uses the
+    bulk slots, so sign-ins are never turned away because of it.
+    """
+    futures = [_submit(True, _hash_many, passwords[i:i + batch_size],
+                       SCRYPT_N, SCRYPT_R, SCRYPT_P, slots=_bulk_pending)
+               for i in range(0, len(passwords), batch_size)]
+    return [hashed for future in futures for hashed in future.result()]
+
+
+async def hash_password_async(password: str) -> str:
+    """Hashes a password in the pool. Raises HashingBusy when saturated."""
+    return await asyncio.wrap_future(_submit(False, hash_password, password,
+                                             SCRYPT_N, SCRYPT_R, SCRYPT_P))
+
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        # Legacy plaintext: nothing expensive to offload
+        return verify_password(password, stored)
+    return await asyncio.wrap_future(_submit(False, verify_password,
+                                             password, stored))
+
+
+def fingerprint(secret: bytes, *parts: str) -> str:
+    """Cheap keyed digest, e.g. to remember a password was already verified."""
+    return hmac.new(secret, "\0".join(parts).encode(),
+                    hashlib.sha256).hexdigest()
+
@@ -0,0 +1,78 @@
+import sqlite3
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Optional, Tuple
+
+from connection import add_connection_hook
+
+"""Static verse tables for turning (chapter, verse) into global positions"""
+# Number of ayahs in each surah (Hafs numbering), surah 1 first
+SURAH_LENGTHS = (
+    7, 286, 200, 176, 120, 165, 206, 75, 129, 109, 123, 111, 43, 52, 99, 128,
+    111, 110, 98, 135, 112, 78, 118, 64, 77, 227, 93, 88, 69, 60, 34, 30, 73,
+    54, 45, 83, 182, 88, 75, 85, 54, 53, 89, 59, 37, 35, 38, 29, 18, 45, 60,
+    49, 62, 55, 78, 96, 29, 22, 24, 13, 14, 11, 11, 18, 12, 12, 30, 52, 52,
+    44, 28, 28, 20, 56, 40, 31, 50, 40, 46, 42, 29, 19, 36, 25, 22, 17, 19,
+    26, 30, 20, 15, 21, 11, 8, 8, 19, 5, 8, 8, 11, 11, 8, 3, 9, 5, 4, 7, 3,
+    6, 3, 5, 4, 5, 6,
+)
+SURAH_COUNT = len(SURAH_LENGTHS)
+TOTAL_AYAHS = sum(SURAH_LENGTHS)
+
+# SURAH_OFFSETS[c - 1] is the number of ayahs before surah c, so the global
+# ordinal of c:v is SURAH_OFFSETS[c - 1] + v, running from 1 to TOTAL_AYAHS
+SURAH_OFFSETS = (0,) + tuple(accumulate(SURAH_LENGTHS))[:-1]
+
+
+def ayah_ordinal(chapter: int, verse: int) -> Optional[int]:
+    """
+    Maps chapter:verse to its global ayah ordinal (1 for 1:1, 6236 for
+    114:6). Returns None if the reference does not exist.
+    """
+    if not isinstance(chapter, int) or not isinstance(verse, int):
+        return None
+    if not 1 <= chapter <= SURAH_COUNT:
+        return None
+    if not 1 <= verse <= SURAH_LENGTHS[chapter - 1]:
+        return None
+    return SURAH_OFFSETS[chapter - 1] + verse
+
+
+def ordinal_to_ayah(ordinal: int) -> Optional[Tuple[int, int]]:
+    """Inverse of ayah_ordinal(): returns (chapter, verse) or None."""
+    if not 1 <= ordinal <= TOTAL_AYAHS:
+        return None
+    chapter = bisect_right(SURAH_OFFSETS, ordinal - 1)
+    return chapter, ordinal - SURAH_OFFSETS[chapter - 1]
+
+
+def validate_range(chapter_start: int, verse_start: int, chapter_end: int,
+                   verse_end: int) -> Optional[str]:
+    """Returns an error message for an invalid verse range, else None."""
+    start = ayah_ordinal(chapter_start, verse_start)
+    if start is None:
+        return f"Invalid start verse {chapter_start}:{verse_start}"
+    end = ayah_ordinal(chapter_end, verse_end)
+    if end is None:
+        return f"Invalid end verse {chapter_end}:{verse_end}"
+    if start > end:
+        return "The start verse must come before the end verse"
+    return None
+
+
+def range_length(chapter_start: int, verse_start: int, chapter_end: int,
+                 verse_end: int) -> Optional[int]:
+    """Number of ayahs in an inclusive range, or None if it is invalid."""
+    if validate_range(chapter_start, verse_start, chapter_end, verse_end):
+        return None
+    return (ayah_ordinal(chapter_end, verse_end)
+            - ayah_ordinal(chapter_start, verse_start) + 1)
+
+
+def register_sql_functions(connection: sqlite3.Connection):
+    """Makes ayah_ordinal(chapter, verse) callable from SQL."""
+    connection.create_function("ayah_ordinal", 2, ayah_ordinal,
+                               deterministic=True)
+
+
+add_connection_hook(register_sql_functions)
@@ -0,0 +1,200 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+"""Table metadata: column projections for reads, generated SQL for writes"""
+# Each table is read through a Projection. It names the columns to select,
+# so no query pulls columns it drops (Users.password) or depends on the
+# column order of older databases, and it turns rows into dicts with one
+# set of snake_case keys. Rows are fetched as plain tuples and zipped with
+# a shared key tuple, which costs one dict per row and nothing else.
+#
+# Writes go through Table, which adds the writable columns, allowed values
+# and id references. INSERT/UPDATE/DELETE statements are generated from the
+# set of columns being written and compiled once per column set; values
+# are always bound in the table's column order, so a value can never land
+# in the wrong column.
+
+
+class Projection:
+    """The columns read from one table and the keys they are returned as."""
+    __slots__ = ("table", "columns", "keys", "column_list", "_sql")
+
+    def __init__(self, table: str, columns: Sequence[str],
+                 keys: Sequence[str] = None):
+        self.table = table
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.keys: Tuple[str, ...] = tuple(keys or columns)
+        self.column_list = ", ".join(self.columns)
+        self._sql: Dict[Tuple[str, str], str] = {}
+
+    def select(self, where: str = "", tail: str = "") -> str:
+        """SELECT statement for these columns; built once per shape."""
+        sql = self._sql.get((where, tail))
+        if sql is None:
+            sql = f"SELECT {self.column_list} FROM {self.table}"
+            if where:
+                sql += f" WHERE {where}"
+            if tail:
+                sql += f" {tail}"
+            self._sql[(where, tail)] = sql
+        return sql
+
+    def row(self, row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        return None if row is None else dict(zip(self.keys, row))
+
+    def rows(self, rows: Iterable[tuple]) -> List[Dict[str, Any]]:
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class Table(Projection):
+    """
+    Projection plus what may be written to the table.
+    Args:
+        table (str): Table name.
+        columns (Sequence[str]): Columns returned by reads.
+        writable (Sequence[str]): Columns callers may set.
+        derived (Sequence[str]): Columns crud.py computes itself (e.g. ayah
+            ordinals); writable through the statements but never accepted
+            from callers by validate().
+        choices (Dict[str, Sequence]): Allowed values per column.
+        references (Dict[str, str]): Column -> crud.validate_ids keyword
+            that checks it, e.g. {"parent_id": "parent_id"}.
+    """
+    __slots__ = ("writable", "derived", "choices", "references", "_order",
+                 "_insert", "_update", "_delete")
+
+    def __init__(self, table: str, columns: Sequence[str],
+                 writable: Sequence[str], derived: Sequence[str] = (),
+                 choices: Dict[str, Sequence] = None,
+                 references: Dict[str, str] = None):
+        super().__init__(table, columns)
+        self.writable = tuple(writable)
+        self.derived = tuple(derived)
+        self.choices = choices or {}
+        self.references = references or {}
+        self._order = {column: i for i, column in
+                       enumerate(self.writable + self.derived)}
+        self._insert: Dict[Tuple[str, ...], str] = {}
+        self._update: Dict[tuple, str] = {}
+        self._delete: Dict[str, str] = {}
+
+    def validate(self, values: Dict[str, Any]) -> Optional[str]:
+        """Error message for unknown columns or values not allowed."""
+        for column, value in values.items():
+            if column not in self.writable:
+                return f"Unknown field for {self.table}: {column}"
+            allowed = self.choices.get(column)
+            if allowed is not None and value not in allowed:
+                return (f"Invalid {column}. Must be one of: "
+                        f"{', '.join(allowed)}")
+        return None
+
+    def signature(self, values: Dict[str, Any]) -> Tuple[str, ...]:
+        """The columns of values in table order; the statement cache key."""
+        return tuple(sorted(values, key=self._order.__getitem__))
+
+    def insert_sql(self, columns: Tuple[str, ...]) -> str:
+        sql = self._insert.get(columns)
+        if sql is None:
+            sql = self._insert[columns] = (
+                f"INSERT INTO {self.table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})")
+        return sql
+
+    def update_sql(self, columns: Tuple[str, ...],
+                   expressions: Tuple[str, ...] = (), where: str = "") -> str:
+        """
+        UPDATE ... SET column = ? for each column, then column = expression
+        for each "column = expression" given, for the row with id = ? and
+        any extra condition in where.
+        """
+        key = (columns, expressions, where)
+        sql = self._update.get(key)
+        if sql is None:
+            sets = [f"{column} = ?" for column in columns] + list(expressions)
+            sql = self._update[key] = (
+                f"UPDATE {self.table} SET {', '.join(sets)} WHERE id = ?"
+                + (f" AND {where}" if where else ""))
+        return sql
+
+    def delete_sql(self, returning: str = "") -> str:
+        sql = self._delete.get(returning)
+        if sql is None:
+            sql = self._delete[returning] = (
+                f"DELETE FROM {self.table} WHERE id = ?"
+                + (f" RETURNING {returning}" if returning else ""))
+        return sql
+
+    def insert(self, cursor, values: Dict[str, Any]) -> int:
+        """Inserts one row and returns its id."""
+        columns = self.signature(values)
+        cursor.execute(self.insert_sql(columns),
+                       [values[column] for column in columns])
+        return cursor.lastrowid
+
+    def insert_many(self, cursor, rows: Iterable[Dict[str, Any]]) -> int:
+        """Inserts rows with one executemany per distinct column set."""
+        count = 0
+        for columns, params in _grouped(self, rows):
+            cursor.executemany(self.insert_sql(columns), params)
+            count += len(params)
+        return count
+
+    def update(self, cursor, row_id: int, values: Dict[str, Any],
+               expressions: Tuple[str, ...] = (), expression_params=(),
+               where: str = "", where_params=()) -> int:
+        """Updates one row and returns the number of rows changed."""
+        columns = self.signature(values)
+        cursor.execute(self.update_sql(columns, expressions, where),
+                       [values[column] for column in columns]
+                       + list(expression_params) + [row_id]
+                       + list(where_params))
+        return cursor.rowcount
+
+    def delete(self, cursor, row_id: int) -> int:
+        cursor.execute(self.delete_sql(), (row_id,))
+        return cursor.rowcount
+
+
+def _grouped(table: Table, rows: Iterable[Dict[str, Any]])\
+        -> Iterable[Tuple[Tuple[str, ...], List[list]]]:
+    groups: Dict[Tuple[str, ...], List[list]] = {}
+    for values in rows:
+        columns = table.signature(values)
+        groups.setdefault(columns, []).append([values[column]
+                                               for column in columns])
+    return groups.items()
+
+
+USERS = Table("Users", ("id", "name", "email", "role", "row_version"),
+              writable=("name", "email", "password", "role"),
+              choices={"role": ("admin", "teacher", "parent")})
+STUDENTS = Table("Students", ("id", "name", "email", "parent_id",
+                              "teacher_id", "classroom", "row_version"),
+                 writable=("name", "email", "parent_id", "teacher_id",
+                           "classroom"),
+                 references={"parent_id": "parent_id",
+                             "teacher_id": "teacher_id"})
+HOMEWORK = Table("Homework", ("id", "title", "description", "chapter_start",
+                              "chapter_end", "verse_start", "verse_end",
+                              "due_date", "status", "row_version"),
+                 writable=("title", "description", "chapter_start",
+                           "chapter_end", "verse_start", "verse_end",
+                           "due_date", "status"),
+                 derived=("ordinal_start", "ordinal_end"),
+                 choices={"status": ("completed", "pending")})
+TASKS = Table("Tasks", ("id", "title", "description", "start_date",
+                        "end_date", "status", "row_version"),
+              writable=("title", "description", "start_date", "end_date",
+                        "status"),
+              choices={"status": ("completed", "incomplete")})
+ASSIGNMENTS = Table("Assignments", ("id", "student_id", "homework_id",
+                                    "task_id", "row_version"),
+                    writable=("student_id", "homework_id", "task_id"),
+                    references={"student_id": "student_id",
+                                "homework_id": "homework_id",
+                                "task_id": "task_id"})
+
+# Registry by table name
+TABLES: Dict[str, Table] = {table.table: table for table in
+                            (USERS, STUDENTS, HOMEWORK, TASKS, ASSIGNMENTS)}
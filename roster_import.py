@@ -0,0 +1,76 @@
+import codecs
+import csv
+import json
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+ROSTER_FORMATS = ("csv", "ndjson")
+
+
+def detect_format(filename: Optional[str], fmt: Optional[str] = None) -> str:
+    """
+    Picks the roster format from an explicit value or the file extension.
+    Raises ValueError if neither gives a supported format.
+    """
+    if fmt is None and filename:
+        extension = filename.rsplit(".", 1)[-1].lower()
+        fmt = {"csv": "csv", "ndjson": "ndjson", "jsonl": "ndjson"}.get(
+            extension)
+    if fmt not in ROSTER_FORMATS:
+        raise ValueError("Roster format must be 'csv' or 'ndjson'")
+    return fmt
+
+
+def _decode(line: bytes, first: bool) -> str:
+    if first and line.startswith(codecs.BOM_UTF8):
+        line = line[len(codecs.BOM_UTF8):]
+    return line.decode("utf-8")
+
+
+def _read_rows(stream: BinaryIO, fmt: str)\
+        -> Iterator[Union[Dict[str, Any], ValueError]]:
+    # Lines are decoded one at a time: a decoding reader works ahead in
+    # blocks, and a bad byte would also lose the good rows in its block
+    if fmt == "csv":
+        lines = (_decode(line, i == 0) for i, line in enumerate(stream))
+        for row in csv.DictReader(lines):
+            yield {key.strip(): value.strip() if isinstance(value, str)
+                   else value for key, value in row.items() if key}
+        return
+    for i, line in enumerate(stream):
+        try:
+            line = _decode(line, i == 0).strip()
+        except UnicodeDecodeError as e:
+            yield ValueError(f"Line is not UTF-8: {e}")
+            continue
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+            continue
+        if isinstance(row, dict):
+            yield row
+        else:
+            yield ValueError("Each NDJSON line must be a JSON object")
+
+
+def iter_roster_rows(stream: BinaryIO, fmt: str)\
+        -> Iterator[Union[Dict[str, Any], ValueError]]:
+    """
+    Streams rows out of an uploaded roster file one at a time, so the file
+    never has to fit in memory.
+    Args:
+        stream (BinaryIO): The uploaded file.
+        fmt (str): 'csv' (with a header row) or 'ndjson'.
+    Yields:
+        Dict[str, Any] per row, or a ValueError for a row that could not be
+        read, so the caller can report it and carry on. In a CSV file,
+        malformed quoting or text that is not UTF-8 ends the file with one
+        last ValueError, since the reader cannot tell where the next row
+        starts; the rows before it are still imported.
+    """
+    try:
+        yield from _read_rows(stream, fmt)
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield ValueError(f"Unreadable file, import stopped here: {e}")
@@ -0,0 +1,255 @@
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+import crud
+from connection import BUSY_TIMEOUT_MS, PooledConnection, get_pool
+from tenants import list_schools, school_path
+
+logger = logging.getLogger(__name__)
+
+"""Due-date reminders and overdue transitions for Homework and Tasks"""
+# Only deadlines inside the look-ahead window are held in memory, loaded with
+# an indexed range query on Homework.due_date / Tasks.end_date. crud.py
+# reports date and status changes as they happen, so the work done tracks
+# the number of deadlines coming up, not the size of the tables. Dates are
+# Unix timestamps, like the rest of the crud layer.
+#
+# One scheduler covers the default database and every school's database
+# (tenants.py). Items are keyed by (school, kind, id), with school None for
+# the default database, and batches passed to the callbacks say which
+# school each item belongs to. Schools are read through short-lived
+# read-only connections rather than their pools: opening every school's
+# pool would migrate it and push the schools requests are using out of the
+# tenant LRU.
+
+# kind -> (table, due date column, status that means nothing is due)
+DEADLINE_SOURCES = {
+    "homework": ("Homework", "due_date", "completed"),
+    "task": ("Tasks", "end_date", "completed"),
+}
+
+REMINDER = "reminder"
+OVERDUE = "overdue"
+
+Batch = List[Dict[str, object]]
+# (school, kind, id)
+Key = Tuple[Optional[str], str, int]
+
+
+def _log_batch(event: str) -> Callable[[Batch], None]:
+    def callback(batch: Batch):
+        for item in batch:
+            logger.info("%s: %s %s%s due at %s", event, item["kind"],
+                        item["id"], f" ({item['school']})"
+                        if item["school"] else "", item["due"])
+    return callback
+
+
+def _connect(school: Optional[str]) \
+        -> Union[PooledConnection, sqlite3.Connection]:
+    """
+    A read-only connection to the school's database, or a pooled one to
+    the default database. Raises sqlite3.OperationalError for a school
+    without a database.
+    """
+    if school is None:
+        return get_pool().acquire()
+    path = quote(os.path.abspath(school_path(school)))
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+
+
+class DeadlineScheduler:
+    """
+    Fires on_reminder(batch) lead_time seconds before each deadline and
+    on_overdue(batch) when a deadline passes without the item being
+    completed. Items are re-checked in one query per batch right before
+    firing, so deleted, completed or rescheduled items are skipped.
+    """
+
+    def __init__(self, on_reminder: Callable[[Batch], None] = None,
+                 on_overdue: Callable[[Batch], None] = None,
+                 lead_time: int = 24 * 3600, window: int = 3600,
+                 batch_size: int = 500):
+        self.on_reminder = on_reminder or _log_batch(REMINDER)
+        self.on_overdue = on_overdue or _log_batch(OVERDUE)
+        self.lead_time = lead_time
+        self.window = window
+        self.batch_size = batch_size
+        # (fire_at, sequence, event, key, due); stale entries are skipped
+        # lazily. The sequence keeps keys (whose school may be None) from
+        # ever being compared.
+        self._heap: List[Tuple[int, int, str, Key, int]] = []
+        self._sequence = itertools.count()
+        # Latest known due date of every item that has entries in the heap
+        self._due: Dict[Key, int] = {}
+        # Deadlines up to this time have been loaded from the database
+        self._loaded_until = 0
+        self._started = 0
+        self._wakeup = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._started = int(time.time())
+        # The first load covers everything not yet overdue
+        self._loaded_until = self._started - self.lead_time
+        crud.add_deadline_listener(self.notify)
+        self._thread = threading.Thread(target=self._run, name="deadlines",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        crud.remove_deadline_listener(self.notify)
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self, kind: str, item_id: int, due: Optional[int],
+               school: Optional[str] = None):
+        """
+        Called by crud.py when an item's due date or status changes, with
+        the school whose database changed (None for the default one). due
+        is None when it is not known to the caller; the row is then re-read.
+        """
+        key = (school, kind, item_id)
+        if due is None:
+            due = self._read_due(key)
+        with self._wakeup:
+            if not isinstance(due, int) or due - self.lead_time > \
+                    self._loaded_until:
+                # Outside the window: the next load will pick it up
+                self._due.pop(key, None)
+                return
+            self._push(key, due, remind=due > time.time())
+            self._wakeup.notify()
+
+    def _push(self, key: Key, due: int, remind: bool):
+        self._due[key] = due
+        if remind:
+            heapq.heappush(self._heap, (due - self.lead_time,
+                                        next(self._sequence), REMINDER, key,
+                                        due))
+        heapq.heappush(self._heap, (due, next(self._sequence), OVERDUE, key,
+                                    due))
+
+    def _read_due(self, key: Key) -> Optional[int]:
+        school, kind, item_id = key
+        table, column, _ = DEADLINE_SOURCES[kind]
+        connection = _connect(school)
+        try:
+            row = connection.execute(f"SELECT {column} FROM {table} "
+                                     f"WHERE id = ?", (item_id,)).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+
+    def _load(self, until: int):
+        """Loads deadlines whose reminder falls before until, everywhere."""
+        rows = []
+        for school in [None] + list_schools():
+            try:
+                connection = _connect(school)
+            except Exception:
+                # e.g. a school removed since it was listed
+                logger.exception("Cannot load deadlines of %s", school)
+                continue
+            try:
+                for kind, (table, column, done) in DEADLINE_SOURCES.items():
+                    cursor = connection.execute(
+                        f"SELECT id, {column} FROM {table} WHERE {column} > ? "
+                        f"AND {column} <= ? AND status != ?",
+                        (self._loaded_until + self.lead_time,
+                         until + self.lead_time, done))
+                    rows += [((school, kind, item_id), due)
+                             for item_id, due in cursor]
+            finally:
+                connection.close()
+        with self._wakeup:
+            for key, due in rows:
+                if key not in self._due:
+                    # Reminders that were due before startup are not sent
+                    self._push(key, due, remind=due -
+                               self.lead_time >= self._started)
+            self._loaded_until = until
+
+    def _take_due(self, now: int) -> List[Tuple[str, Key, int]]:
+        batch = []
+        while self._heap and self._heap[0][0] <= now and \
+                len(batch) < self.batch_size:
+            _, _, event, key, due = heapq.heappop(self._heap)
+            if self._due.get(key) != due:
+                continue
+            if event == OVERDUE:
+                del self._due[key]
+            batch.append((event, key, due))
+        return batch
+
+    def _still_due(self, batch) -> List[Tuple[str, Key, int]]:
+        """Drops items that were completed, deleted or moved meanwhile."""
+        current = {}
+        for school in {key[0] for _, key, _ in batch}:
+            connection = _connect(school)
+            try:
+                for kind, (table, column, done) in DEADLINE_SOURCES.items():
+                    ids = list({key[2] for _, key, _ in batch
+                                if key[:2] == (school, kind)})
+                    if not ids:
+                        continue
+                    marks = ", ".join("?" * len(ids))
+                    cursor = connection.execute(
+                        f"SELECT id, {column} FROM {table} "
+                        f"WHERE id IN ({marks}) AND status != ?",
+                        ids + [done])
+                    current.update({(school, kind, item_id): due
+                                    for item_id, due in cursor})
+            finally:
+                connection.close()
+        return [item for item in batch if current.get(item[1]) == item[2]]
+
+    def _fire(self, batch):
+        for event, callback in ((REMINDER, self.on_reminder),
+                                (OVERDUE, self.on_overdue)):
+            items = [{"kind": key[1], "id": key[2], "due": due,
+                      "school": key[0]}
+                     for e, key, due in batch if e == event]
+            if not items:
+                continue
+            try:
+                callback(items)
+            except Exception:
+                logger.exception("Deadline %s callback failed", event)
+
+    def _run(self):
+        while True:
+            now = int(time.time())
+            try:
+                if now + self.window // 2 >= self._loaded_until:
+                    self._load(now + self.window)
+                with self._wakeup:
+                    batch = self._take_due(now)
+                if batch:
+                    self._fire(self._still_due(batch))
+                    continue
+            except Exception:
+                logger.exception("Deadline scheduler iteration failed")
+            with self._wakeup:
+                if self._stopping:
+                    return
+                next_fire = self._heap[0][0] if self._heap else None
+                refill = self._loaded_until - self.window // 2
+                wake = refill if next_fire is None else min(next_fire, refill)
+                self._wakeup.wait(max(0, wake - time.time()) + 0.01)
+                if self._stopping:
+                    return
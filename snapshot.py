@@ -0,0 +1,227 @@
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+import connection
+from connection import BUSY_TIMEOUT_MS, ConnectionPool, routed_pool, \
+    use_pool
+from metrics import SNAPSHOT_AGE, SNAPSHOT_GENERATION, \
+    SNAPSHOT_REFRESH_DURATION, SNAPSHOT_REFRESH_FAILURES, SNAPSHOT_READS
+
+logger = logging.getLogger(__name__)
+
+"""Read-only reporting snapshot of the database"""
+# With REPORT_SNAPSHOT=on, a background thread copies the database with the
+# SQLite backup API every SNAPSHOT_REFRESH_INTERVAL seconds into a new file
+# next to it, opens a small read-only pool on the copy and swaps it in.
+# The generation before the previous one is then closed and deleted;
+# connections still checked out of it are closed when they are returned.
+# Report queries routed through reporting() read the copy and never hold
+# the primary file's locks.
+#
+# Reports accept data up to SNAPSHOT_MAX_AGE seconds old. If the snapshot
+# is older than that (a refresh failed or is slow), or there is none yet,
+# they read the primary database instead, so staleness stays bounded.
+REPORT_SNAPSHOT = os.environ.get("REPORT_SNAPSHOT", "off") == "on"
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", 60))
+SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get(
+    "SNAPSHOT_REFRESH_INTERVAL", SNAPSHOT_MAX_AGE / 2))
+# Pages copied per backup step; -1 copies everything in one step. In WAL
+# mode one step reads a single consistent view without blocking writers,
+# whereas a stepwise copy starts over whenever another connection writes.
+SNAPSHOT_BACKUP_PAGES = int(os.environ.get("SNAPSHOT_BACKUP_PAGES", -1))
+SNAPSHOT_POOL_SIZE = 4
+SNAPSHOT_PRAGMAS = (
+    ("query_only", 1),
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000),
+)
+
+
+class Snapshot:
+    """One generation of the snapshot: its file, pool and when it was taken."""
+    __slots__ = ("generation", "path", "pool", "taken_at")
+
+    def __init__(self, generation: int, path: str, pool: ConnectionPool,
+                 taken_at: float):
+        self.generation = generation
+        self.path = path
+        self.pool = pool
+        self.taken_at = taken_at
+
+    def age(self) -> float:
+        return time.time() - self.taken_at
+
+
+def _remove(path: str):
+    for name in (path, path + "-wal", path + "-shm", path + "-journal"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+class SnapshotManager:
+    """
+    Keeps a periodically refreshed copy of the database at db_path for
+    read-only reporting.
+    """
+
+    def __init__(self, db_path: str, max_age: float = SNAPSHOT_MAX_AGE,
+                 interval: float = SNAPSHOT_REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.interval = interval
+        self._current: Optional[Snapshot] = None
+        # Kept open for one more interval for reports that just picked it
+        self._retired: Optional[Snapshot] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def current(self) -> Optional[Snapshot]:
+        return self._current
+
+    def fresh(self, max_age: float = None) -> Optional[Snapshot]:
+        """The current snapshot if it is within max_age seconds, else None."""
+        snapshot = self._current
+        limit = self.max_age if max_age is None else max_age
+        if snapshot is None or snapshot.age() > limit:
+            return None
+        return snapshot
+
+    def refresh(self) -> Snapshot:
+        """Copies the database into a new generation and swaps it in."""
+        with self._refresh_lock:
+            generation = self._generation + 1
+            path = f"{self.db_path}.snapshot-{generation}"
+            _remove(path)
+            started = time.perf_counter()
+            taken_at = time.time()
+            source = sqlite3.connect(self.db_path,
+                                     timeout=BUSY_TIMEOUT_MS / 1000)
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target, pages=SNAPSHOT_BACKUP_PAGES)
+                # Readers of the copy never write, so no WAL files needed
+                target.execute("PRAGMA journal_mode = DELETE")
+            except Exception:
+                target.close()
+                _remove(path)
+                raise
+            finally:
+                source.close()
+            target.close()
+            SNAPSHOT_REFRESH_DURATION.observe(time.perf_counter() - started)
+
+            snapshot = Snapshot(generation, path, ConnectionPool(
+                path, SNAPSHOT_POOL_SIZE, pragmas=SNAPSHOT_PRAGMAS), taken_at)
+            with self._lock:
+                expired = self._retired
+                self._retired, self._current = self._current, snapshot
+                self._generation = generation
+            SNAPSHOT_GENERATION.set(generation)
+            if expired is not None:
+                expired.pool.close()
+                _remove(expired.path)
+            return snapshot
+
+    def start(self):
+        # Generations left behind by an earlier run
+        for path in glob.glob(glob.escape(self.db_path) + ".snapshot-*"):
+            _remove(path)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshots",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            snapshots = (self._current, self._retired)
+            self._current = self._retired = None
+        for snapshot in snapshots:
+            if snapshot is not None:
+                snapshot.pool.close()
+                _remove(snapshot.path)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                SNAPSHOT_REFRESH_FAILURES.inc()
+                logger.exception("Reporting snapshot refresh failed")
+            self._stopping.wait(self.interval)
+
+
+_manager: Optional[SnapshotManager] = None
+
+
+def start_snapshots() -> SnapshotManager:
+    """Starts refreshing snapshots of the current database. Lifespan hook."""
+    global _manager
+    stop_snapshots()
+    _manager = SnapshotManager(connection.DB_PATH)
+    _manager.start()
+    return _manager
+
+
+def stop_snapshots():
+    global _manager
+    if _manager is not None:
+        _manager.stop()
+        _manager = None
+
+
+def _age() -> float:
+    snapshot = _manager.current() if _manager is not None else None
+    return -1 if snapshot is None else snapshot.age()
+
+
+def reporting_pool(max_age: float = None) -> Optional[ConnectionPool]:
+    """
+    The snapshot's pool if snapshots are running and the current one is
+    fresh enough, else None, meaning read the primary database. Requests
+    already routed elsewhere (a school's database) never use the snapshot,
+    which copies DB_PATH only.
+    """
+    snapshot = None
+    if _manager is not None and routed_pool() is None:
+        snapshot = _manager.fresh(max_age)
+    SNAPSHOT_READS.inc(1, "primary" if snapshot is None else "snapshot")
+    return None if snapshot is None else snapshot.pool
+
+
+@contextmanager
+def reporting(max_age: float = None) -> Iterator[None]:
+    """Runs the block's queries on the snapshot when it is fresh enough."""
+    pool = reporting_pool(max_age)
+    if pool is None:
+        yield
+        return
+    with use_pool(pool):
+        yield
+
+
+def on_snapshot(func: Callable) -> Callable:
+    """Decorator for read-only crud functions that may run on the snapshot."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with reporting():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+SNAPSHOT_AGE.set_function(_age)
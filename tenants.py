@@ -0,0 +1,245 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+
+from connection import BUSY_TIMEOUT_MS, ConnectionPool, use_pool
+from dataBase import migrate
+
+"""Per-school databases"""
+# Every school has its own database file, TENANTS_DIR/<school>.db, with the
+# full schema. A request names its school in the TENANT_HEADER header;
+# main.py resolves it to that school's pool and runs the request inside
+# tenant_scope(), which routes every get_db_connection() call below it to
+# the school's file. crud.py is unchanged apart from keying its caches by
+# school. Requests without the header use DB_PATH as before.
+#
+# Pools are opened on a school's first request (migrating its file if
+# needed) and kept for the MAX_TENANT_POOLS most recently used schools. An
+# evicted pool is retired: requests still routed to it carry on, and its
+# connections are closed as soon as they are returned.
+#
+# The few admin queries that span schools go through fan_out(), which
+# ATTACHes the school files read-only to an in-memory connection in
+# batches and reads them with one UNION ALL per batch.
+TENANT_HEADER = "X-School"
+TENANTS_DIR = os.environ.get("TENANTS_DIR", "schools")
+TENANT_POOL_SIZE = int(os.environ.get("TENANT_POOL_SIZE", 4))
+MAX_TENANT_POOLS = int(os.environ.get("MAX_TENANT_POOLS", 64))
+# SQLite attaches at most 10 databases to one connection by default
+ATTACH_BATCH_SIZE = 10
+
+# Lowercase letters, digits, "-" and "_": always a plain file name
+_SCHOOL_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+_pools: "OrderedDict[str, ConnectionPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+_tenant: ContextVar[Optional[str]] = ContextVar("tenant", default=None)
+
+
+class UnknownSchool(LookupError):
+    """Raised for a well-formed school id that has no database."""
+
+
+def validate_school(school: str) -> str:
+    """Returns school if it is a valid id, else raises ValueError."""
+    if not isinstance(school, str) or not _SCHOOL_ID.match(school):
+        raise ValueError("School ids are 1-64 lowercase letters, digits, "
+                         "'-' or '_'")
+    return school
+
+
+def school_path(school: str) -> str:
+    return os.path.join(TENANTS_DIR, f"{validate_school(school)}.db")
+
+
+def list_schools() -> List[str]:
+    """Ids of every school with a database, sorted."""
+    if not os.path.isdir(TENANTS_DIR):
+        return []
+    return sorted(name[:-3] for name in os.listdir(TENANTS_DIR)
+                  if name.endswith(".db") and _SCHOOL_ID.match(name[:-3]))
+
+
+def current_tenant() -> Optional[str]:
+    """The school the current request runs for, None for the default DB."""
+    return _tenant.get()
+
+
+def open_pool(school: str) -> Optional[ConnectionPool]:
+    """The school's pool if it is already open; never blocks on I/O."""
+    with _pools_lock:
+        pool = _pools.get(school)
+        if pool is not None:
+            _pools.move_to_end(school)
+        return pool
+
+
+def get_tenant_pool(school: str) -> ConnectionPool:
+    """
+    The school's connection pool, opened and migrated on first use.
+    Raises ValueError for a malformed id and UnknownSchool if the school
+    has no database.
+    """
+    pool = open_pool(validate_school(school))
+    if pool is not None:
+        return pool
+    path = school_path(school)
+    if not os.path.exists(path):
+        raise UnknownSchool(f"Unknown school: {school}")
+    pool = ConnectionPool(path, TENANT_POOL_SIZE)
+    connection = pool.acquire()
+    try:
+        # Concurrent first requests both get here; migrate() re-checks the
+        # version under the write lock, so only one applies each step
+        migrate(connection)
+    finally:
+        connection.close()
+    with _pools_lock:
+        existing = _pools.get(school)
+        if existing is not None:
+            pool.close()
+            return existing
+        _pools[school] = pool
+        evicted = []
+        while len(_pools) > MAX_TENANT_POOLS:
+            evicted.append(_pools.popitem(last=False)[1])
+    for old in evicted:
+        old.retire()
+    return pool
+
+
+def create_school(school: str) -> Dict[str, Any]:
+    """
+    Creates and migrates the database for a new school.
+    Args:
+        school (str): School id, e.g. "al-noor".
+    Returns:
+        Dict[str, Any]: Success message or error message.
+    """
+    try:
+        path = school_path(school)
+    except ValueError as e:
+        return {"error": str(e)}
+    os.makedirs(TENANTS_DIR, exist_ok=True)
+    try:
+        # "x" fails if another caller created the school first
+        open(path, "x").close()
+    except FileExistsError:
+        return {"error": f"School already exists: {school}"}
+    try:
+        get_tenant_pool(school)
+    except Exception:
+        os.remove(path)
+        raise
+    return {"message": "School created successfully", "school": school}
+
+
+def close_tenant_pools():
+    """Closes every open school pool. Called from the app lifespan."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@contextmanager
+def tenant_scope(school: str, pool: ConnectionPool = None) -> Iterator[str]:
+    """
+    Runs the block (and DB calls it hands to worker threads) against the
+    school's database.
+    """
+    pool = pool or get_tenant_pool(school)
+    token = _tenant.set(school)
+    try:
+        with use_pool(pool):
+            yield school
+    finally:
+        _tenant.reset(token)
+
+
+def fan_out(sql: str, params: Sequence[Any] = (),
+            schools: Sequence[str] = None) -> List[tuple]:
+    """
+    Runs one SELECT against every school's database and returns the rows
+    of all of them, each prefixed with the school id.
+    Args:
+        sql (str): SELECT whose tables are written as {db}.Table.
+        params (Sequence[Any]): Parameters of one copy of sql.
+        schools (Sequence[str], optional): Defaults to every school.
+    """
+    schools = list_schools() if schools is None else \
+        [validate_school(school) for school in schools]
+    rows: List[tuple] = []
+    for start in range(0, len(schools), ATTACH_BATCH_SIZE):
+        batch = schools[start:start + ATTACH_BATCH_SIZE]
+        connection = sqlite3.connect("file::memory:", uri=True,
+                                     timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            for i, school in enumerate(batch):
+                path = quote(os.path.abspath(school_path(school)))
+                connection.execute(f"ATTACH DATABASE ? AS s{i}",
+                                   (f"file:{path}?mode=ro",))
+            union = " UNION ALL ".join(
+                f"SELECT ? AS school, * FROM ({sql.format(db=f's{i}')})"
+                for i in range(len(batch)))
+            batch_params: List[Any] = []
+            for school in batch:
+                batch_params.append(school)
+                batch_params.extend(params)
+            rows.extend(connection.execute(union, batch_params).fetchall())
+        finally:
+            connection.close()
+    return rows
+
+
+def get_school_totals(schools: Sequence[str] = None) -> List[Dict[str, Any]]:
+    """
+    Users, students, homework and tasks per school, for the admin overview.
+    Homework and task counts come from the StatusSummary rows.
+    """
+    rows = fan_out(
+        "SELECT (SELECT COUNT(*) FROM {db}.Users),"
+        " (SELECT COUNT(*) FROM {db}.Students),"
+        " (SELECT COALESCE(SUM(total), 0) FROM {db}.StatusSummary"
+        "  WHERE entity = 'Homework'),"
+        " (SELECT COALESCE(SUM(total), 0) FROM {db}.StatusSummary"
+        "  WHERE entity = 'Tasks')", (), schools)
+    keys = ("school", "users", "students", "homework", "tasks")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def find_users_by_email(email: str) -> List[Dict[str, Any]]:
+    """Every account registered with email, in any school."""
+    rows = fan_out("SELECT id, name, email, role FROM {db}.Users"
+                   " WHERE email = ?", (email,))
+    keys = ("school", "id", "name", "email", "role")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="School databases")
+    parser.add_argument("command", choices=["create", "migrate", "list"])
+    parser.add_argument("schools", nargs="*",
+                        help="School ids; migrate defaults to all")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        for school in args.schools:
+            result = create_school(school)
+            print(result.get("error") or f"Created {school}")
+    elif args.command == "migrate":
+        for school in args.schools or list_schools():
+            with tenant_scope(school):
+                print(f"{school} is at schema version {migrate()}")
+    elif args.command == "list":
+        for row in get_school_totals():
+            print("{school}: {users} users, {students} students, "
+                  "{homework} homework, {tasks} tasks".format(**row))
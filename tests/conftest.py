@@ -0,0 +1,69 @@
+import os
+
+# Cheap scrypt parameters and a single hashing process keep the tests that
+# hash passwords fast; set before passwords.py reads them
+os.environ.setdefault("SCRYPT_N", str(2 ** 4))
+os.environ.setdefault("HASH_WORKERS", "1")
+
+import pytest
+
+import connection
+import crud
+import dataBase
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A migrated, empty database behind the shared pool."""
+    path = str(tmp_path / "test.db")
+    connection.set_db_path(path)
+    dataBase.migrate()
+    for cache in crud.ENTITY_CACHES.values():
+        cache.clear()
+    yield path
+    connection.close_pool()
+
+
+@pytest.fixture
+def roster(db):
+    """
+    Teacher 1, parent 2 and students 1-3; students 1 and 2 are in
+    classroom A, student 3 in B.
+    """
+    crud.create_user("Teacher", "teacher@example.com", None, "teacher",
+                     "hash")
+    crud.create_user("Parent", "parent@example.com", None, "parent", "hash")
+    for student_id, classroom in ((1, "A"), (2, "A"), (3, "B")):
+        crud.create_student(f"Student {student_id}",
+                            f"student{student_id}@example.com", None, 2, 1,
+                            classroom)
+    return {"teacher": 1, "parent": 2, "students": [1, 2, 3]}
+
+
+def query(sql: str, params=()) -> list:
+    """Rows of one statement on a connection of the shared pool."""
+    conn = connection.get_db_connection()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def client(db):
+    """TestClient for the app, with its lifespan run against db."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def schools(db, tmp_path, monkeypatch):
+    """An empty TENANTS_DIR; school pools are closed afterwards."""
+    import tenants
+
+    monkeypatch.setattr(tenants, "TENANTS_DIR", str(tmp_path / "schools"))
+    yield tenants
+    tenants.close_tenant_pools()
@@ -0,0 +1,53 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+import async_crud
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+@pytest.fixture
+def db_mode():
+    mode = async_crud.DB_MODE
+    yield async_crud.set_db_mode
+    async_crud.set_db_mode(mode)
+    async_crud.shutdown_executor()
+
+
+def _where() -> tuple:
+    return threading.current_thread().name, _request_id.get()
+
+
+async def _call_in_request() -> tuple:
+    _request_id.set("r1")
+    return await async_crud.run_db(_where)
+
+
+def test_async_mode_runs_on_the_db_executor_with_the_context(db_mode):
+    db_mode("async")
+    thread, request_id = asyncio.run(_call_in_request())
+    assert thread.startswith("db")
+    assert request_id == "r1"
+
+
+def test_sync_mode_runs_on_the_request_threadpool(db_mode):
+    db_mode("sync")
+    thread, request_id = asyncio.run(_call_in_request())
+    assert not thread.startswith("db")
+    assert request_id == "r1"
+
+
+def test_unknown_mode_is_rejected(db_mode):
+    with pytest.raises(ValueError):
+        db_mode("threads")
+
+
+def test_wrapped_crud_functions(roster, db_mode):
+    db_mode("async")
+    student = asyncio.run(async_crud.get_student_by_id(3))
+    assert student["classroom"] == "B"
+    async_crud.shutdown_executor()
+    assert async_crud._executor is None
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import async_crud
+import crud
+import passwords
+from conftest import query
+from passwords import hash_password, needs_rehash, verify_password
+
+
+def test_hashes_verify_and_record_their_parameters():
+    stored = hash_password("secret", n=2 ** 4, r=8, p=1)
+    assert stored.startswith("scrypt$16$8$1$")
+    assert verify_password("secret", stored)
+    assert not verify_password("Secret", stored)
+    assert not verify_password("secret", "scrypt$16$8$1$bad")
+    assert hash_password("secret") != hash_password("secret")
+
+
+def test_plaintext_and_outdated_hashes_need_a_rehash():
+    assert verify_password("legacy", "legacy")
+    assert needs_rehash("legacy")
+    assert needs_rehash(hash_password("secret", n=2 ** 5))
+    assert not needs_rehash(hash_password("secret"))
+
+
+def test_pooled_hashing():
+    stored = passwords.hash_in_pool("secret")
+    assert verify_password("secret", stored)
+    assert [verify_password(password, stored) for password, stored in zip(
+        ("a", "b", "c"), passwords.hash_many_in_pool(["a", "b", "c"],
+                                                     batch_size=2))] == \
+        [True, True, True]
+
+
+def test_sign_in_session_and_sign_out(client):
+    client.post("/users/", params={"name": "Ann", "email": "ann@example.com",
+                                   "password": "secret", "role": "teacher"})
+    assert client.post("/login", data={"email": "ann@example.com",
+                                       "password": "wrong"}
+                       ).status_code == 401
+    assert client.post("/login", data={"email": "nobody@example.com",
+                                       "password": "secret"}
+                       ).status_code == 401
+    session = client.post("/login", data={"email": "ann@example.com",
+                                          "password": "secret"}).json()
+    assert "password" not in session["user"]
+    headers = {"Authorization": f"Bearer {session['token']}"}
+    assert client.get("/session", headers=headers).json()["name"] == "Ann"
+    client.post("/logout", headers=headers)
+    assert client.get("/session", headers=headers).status_code == 401
+    assert client.get("/session").status_code == 401
+
+
+def test_plaintext_password_is_upgraded_on_sign_in(client):
+    crud.create_user("Old", "old@example.com", None, "parent", "legacy")
+    response = client.post("/login", data={"email": "old@example.com",
+                                           "password": "legacy"})
+    assert response.status_code == 200
+    stored = query("SELECT password FROM Users WHERE email = ?",
+                   ("old@example.com",))[0][0]
+    assert stored.startswith("scrypt$") and verify_password("legacy", stored)
+    # And the new hash is accepted
+    assert client.post("/login", data={"email": "old@example.com",
+                                       "password": "legacy"}
+                       ).status_code == 200
+
+
+def test_imports_do_not_take_the_sign_in_slots(monkeypatch):
+    bulk = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(passwords, "_bulk_pending", bulk)
+    bulk.acquire()
+    try:
+        stored = asyncio.run(passwords.hash_password_async("secret"))
+    finally:
+        bulk.release()
+    assert verify_password("secret", stored)
+
+
+def test_bad_input_is_rejected_before_hashing(roster, monkeypatch):
+    async def no_hashing(password):
+        raise AssertionError("hashed")
+    monkeypatch.setattr(async_crud, "hash_password_async", no_hashing)
+    assert "error" in asyncio.run(async_crud.create_user(
+        "Ann", "ann@example.com", "secret", "pupil"))
+    assert "error" in asyncio.run(async_crud.update_user(
+        1, role="pupil", password="secret"))
+    assert "error" in asyncio.run(async_crud.update_user(1))
+
+
+def test_replacing_a_hash_invalidates_the_cached_user(roster):
+    crud.get_user_by_id(1)
+    assert crud.replace_password_hash(1, "hash", hash_password("secret"))
+    assert crud.ENTITY_CACHES["Users"].get((None, 1)) is None
@@ -0,0 +1,53 @@
+import ayah_coverage
+import crud
+from quran import TOTAL_AYAHS
+
+
+def test_bitmaps_round_trip_and_describe_ranges():
+    mask = ayah_coverage.range_mask(1, 7) | ayah_coverage.range_mask(8, 10)
+    assert ayah_coverage.from_blob(ayah_coverage.to_blob(mask)) == mask
+    assert len(ayah_coverage.to_blob(mask)) == ayah_coverage.BITMAP_BYTES
+    assert ayah_coverage.to_ranges(mask) == [
+        {"chapter_start": 1, "verse_start": 1, "chapter_end": 2,
+         "verse_end": 3}]
+    assert ayah_coverage.popcount(ayah_coverage.remaining(mask)) == \
+        TOTAL_AYAHS - 10
+
+
+def test_union_and_intersection():
+    a = ayah_coverage.range_mask(1, 10)
+    b = ayah_coverage.range_mask(5, 20)
+    assert ayah_coverage.popcount(ayah_coverage.union([a, b])) == 20
+    assert ayah_coverage.intersection([a, b]) == \
+        ayah_coverage.range_mask(5, 10)
+    assert ayah_coverage.intersection([]) == ayah_coverage.FULL_MASK
+
+
+def test_student_coverage_follows_homework_status(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 1)
+    crud.create_assignment(1, homework_id=1)
+    assert crud.get_student_coverage(1)["ayahs_completed"] == 0
+    crud.update_homework(1, status="completed")
+    coverage = crud.get_student_coverage(1)
+    assert coverage["ayahs_completed"] == 7
+    assert coverage["completed"] == [{"chapter_start": 1, "verse_start": 1,
+                                      "chapter_end": 1, "verse_end": 7}]
+    crud.update_homework(1, status="pending")
+    assert crud.get_student_coverage(1)["ayahs_completed"] == 0
+    assert "error" in crud.get_student_coverage(99)
+
+
+def test_classroom_coverage(roster):
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1, "completed")
+    crud.create_homework("Al-Baqarah", "", 2, 2, 1, 5, 1, "completed")
+    crud.create_assignment(1, homework_id=1)
+    crud.create_assignment(1, homework_id=2)
+    crud.create_assignment(2, homework_id=1)
+    coverage = crud.get_classroom_coverage("A")
+    assert coverage["students"] == 2
+    assert coverage["ayahs_completed_by_anyone"] == 12
+    assert coverage["ayahs_completed_by_everyone"] == 7
+    assert coverage["not_started"][0] == {"chapter_start": 2,
+                                          "verse_start": 6,
+                                          "chapter_end": 114, "verse_end": 6}
+    assert "error" in crud.get_classroom_coverage("Z")
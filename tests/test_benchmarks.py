@@ -0,0 +1,72 @@
+import json
+
+import connection
+import crud
+from benchmarks.datagen import generate, table_sizes
+from benchmarks.micro import run_micro
+from benchmarks.report import build_report, compare, percentile, summarize
+from conftest import query
+
+
+def _dump() -> list:
+    return [query(f"SELECT * FROM {table} ORDER BY id")
+            for table in ("Users", "Students", "Homework", "Tasks",
+                          "Assignments")]
+
+
+def test_generated_data_is_deterministic(tmp_path):
+    try:
+        sizes = generate(str(tmp_path / "a.db"), scale=60, now=0)
+        first = _dump()
+        generate(str(tmp_path / "b.db"), scale=60, now=0)
+        assert _dump() == first
+    finally:
+        connection.close_pool()
+    assert sizes == table_sizes(60)
+    assert [len(rows) for rows in first] == \
+        [1 + sizes["teachers"] + sizes["parents"], 60, sizes["homework"],
+         sizes["tasks"], sizes["assignments"]]
+
+
+def test_micro_benchmarks_run_cleanly(tmp_path):
+    try:
+        generate(str(tmp_path / "bench.db"), scale=60)
+        before = [len(rows) for rows in _dump()]
+        results = run_micro(iterations=3)
+        after = [len(rows) for rows in _dump()]
+    finally:
+        connection.close_pool()
+    assert results and all(result["errors"] == 0
+                           for result in results.values())
+    # Rows created by the benchmarks are deleted again
+    assert after == before
+
+
+def test_cached_getters_are_timed_without_the_cache(tmp_path):
+    caches = [crud.ENTITY_CACHES[table] for table in ("Users", "Students")]
+    lookups = [(cache.stats()["hits"], cache.stats()["misses"])
+               for cache in caches]
+    try:
+        generate(str(tmp_path / "bench.db"), scale=60)
+        run_micro(iterations=20, only=["get_user_by_id",
+                                       "get_student_by_id"])
+    finally:
+        connection.close_pool()
+    # Neither read nor filled
+    assert [(cache.stats()["hits"], cache.stats()["misses"])
+            for cache in caches] == lookups
+
+
+def test_percentiles_and_regressions(tmp_path):
+    assert percentile([1, 2, 3, 4], 0.5) == 2
+    assert percentile([], 0.99) == 0.0
+    summary = summarize([0.001, 0.002], 2.0)
+    assert summary["p95_ms"] == 2.0 and summary["ops_per_sec"] == 1.0
+
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(build_report(
+        "micro", {"fast": {"p95_ms": 1.0}, "slow": {"p95_ms": 1.0}})))
+    report = build_report("micro", {"fast": {"p95_ms": 1.1},
+                                     "slow": {"p95_ms": 2.0}})
+    assert compare(report, str(baseline)) == \
+        ["slow: p95 1.000ms -> 2.000ms (+100%)"]
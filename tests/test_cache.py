@@ -0,0 +1,70 @@
+import time
+
+import crud
+from cache import LRUCache, read_through
+from connection import transaction
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3,
+                             "misses": 1, "evictions": 1}
+
+
+def test_entries_expire_after_the_ttl():
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_stale_load_is_not_stored_after_an_invalidation():
+    cache = LRUCache()
+    version = cache.version
+    cache.invalidate("a")
+    cache.set_if_unchanged("a", {"old": True}, version)
+    assert cache.get("a") is None
+
+
+def test_read_through_copies_scopes_and_skips_errors():
+    cache = LRUCache()
+    scope = ["north"]
+    calls = []
+
+    @read_through(cache, scope=lambda: scope[0])
+    def load(key):
+        calls.append((scope[0], key))
+        return {"error": "missing"} if key < 0 else {"id": key}
+
+    load(1)["id"] = 99
+    assert load(1) == {"id": 1}
+    scope[0] = "south"
+    load(1)
+    load(-1)
+    load(-1)
+    assert calls == [("north", 1), ("south", 1), ("south", -1),
+                     ("south", -1)]
+
+
+def test_updates_invalidate_the_entity_cache(roster):
+    assert crud.get_student_by_id(1)["name"] == "Student 1"
+    crud.update_student(1, name="Renamed")
+    assert crud.get_student_by_id(1)["name"] == "Renamed"
+
+
+def test_transactions_bypass_the_cache(roster):
+    crud.get_student_by_id(1)
+    with transaction():
+        crud.update_student(1, name="Pending")
+        # Not cached yet: the change is only visible inside the transaction
+        assert crud.get_student_by_id(1)["name"] == "Pending"
+        assert crud.ENTITY_CACHES["Students"].get((None, 1))["name"] == \
+            "Student 1"
+    assert crud.get_student_by_id(1)["name"] == "Pending"
@@ -0,0 +1,67 @@
+import crud
+import dataBase
+from connection import get_db_connection
+
+
+def _age_change_log(seconds: int):
+    connection = get_db_connection()
+    try:
+        connection.execute("UPDATE ChangeLog SET changed_at = changed_at - ?",
+                           (seconds,))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def test_changes_are_paged_by_version(roster):
+    sync = crud.get_changes(0, limit=4)
+    assert [(c["entity"], c["id"]) for c in sync["changes"]] == \
+        [("Users", 1), ("Users", 2), ("Students", 1), ("Students", 2)]
+    assert sync["has_more"]
+    rest = crud.get_changes(sync["cursor"])
+    assert [(c["entity"], c["id"]) for c in rest["changes"]] == \
+        [("Students", 3)]
+    assert not rest["has_more"]
+
+    crud.update_student(1, name="Renamed")
+    crud.delete_student(2)
+    delta = crud.get_changes(rest["cursor"], entities=["Students"])
+    assert [(c["id"], c["deleted"]) for c in delta["changes"]] == \
+        [(1, False), (2, True)]
+    assert delta["changes"][0]["row"]["name"] == "Renamed"
+    assert delta["changes"][0]["row"]["row_version"] == \
+        delta["changes"][0]["version"]
+    assert delta["changes"][1]["row"] is None
+    assert "error" in crud.get_changes(entities=["Secrets"])
+
+
+def test_pruned_cursor_must_resync(roster):
+    cursor = crud.get_changes()["cursor"]
+    crud.delete_student(2)
+    crud.delete_student(3)
+    _age_change_log(2 * 86400)
+    # The newest Students change is kept for its ETag
+    assert dataBase.prune_changes(max_age_days=1) == 1
+    assert crud.get_changes(cursor)["resync"]
+    full = crud.get_changes(0)
+    assert "error" not in full
+    assert ("Students", 2) not in [(c["entity"], c["id"])
+                                   for c in full["changes"]]
+    assert crud.get_changes(full["cursor"])["changes"] == []
+
+
+def test_list_etags_and_410(roster, client):
+    response = client.get("/students/", params={"limit": 10})
+    etag = response.headers["etag"]
+    assert client.get("/students/", params={"limit": 10},
+                      headers={"If-None-Match": etag}).status_code == 304
+    crud.update_student(1, name="Renamed")
+    assert client.get("/students/", params={"limit": 10},
+                      headers={"If-None-Match": etag}).status_code == 200
+
+    cursor = client.get("/changes").json()["cursor"]
+    crud.delete_student(2)
+    crud.delete_student(3)
+    _age_change_log(2 * 86400)
+    dataBase.prune_changes(max_age_days=1)
+    assert client.get("/changes", params={"since": cursor}).status_code == 410
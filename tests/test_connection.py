@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+import pytest
+
+from connection import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    yield pool
+    pool.close()
+
+
+def test_pragmas_are_applied(pool):
+    conn = pool.acquire()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    finally:
+        conn.close()
+
+
+def test_nested_acquires_share_one_connection(pool):
+    outer = pool.acquire()
+    inner = pool.acquire()
+    assert inner.raw is outer.raw
+    inner.close()
+    # Still checked out by the outer handle
+    assert outer.execute("SELECT 1").fetchone() == (1,)
+    outer.close()
+
+
+def test_connections_are_reused(pool):
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.close()
+    conn = pool.acquire()
+    assert conn.raw is raw
+    conn.close()
+
+
+def test_threads_get_their_own_connection(pool):
+    conn = pool.acquire()
+    seen = []
+
+    def worker():
+        other = pool.acquire()
+        seen.append(other.raw)
+        other.close()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert seen and seen[0] is not conn.raw
+    conn.close()
+
+
+def test_close_is_idempotent_and_returned_handles_are_dead(pool):
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_half_finished_transactions_are_rolled_back(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    conn = pool.acquire()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+    finally:
+        conn.close()
+
+
+def test_closed_pool_refuses_checkouts(pool):
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
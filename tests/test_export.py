@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+
+import pytest
+
+import crud
+from export import export_assignment_history, iter_assignment_history, \
+    parse_cursor
+
+
+@pytest.fixture
+def history(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 1)
+    crud.create_task("Tajweed", "Practice", 1, 2)
+    crud.assign_to_roster(teacher_id=1, homework_id=1)
+    crud.assign_to_roster(classroom="A", task_id=1)
+    return roster
+
+
+def _keys(chunks) -> list:
+    return [row[:2] for rows in chunks for row in rows]
+
+
+def test_parse_cursor():
+    assert parse_cursor(None) == (0, 0)
+    assert parse_cursor("3:12") == (3, 12)
+    for bad in ("3", "a:1", "1:2:3"):
+        with pytest.raises(ValueError):
+            parse_cursor(bad)
+
+
+def test_rows_come_in_keyset_order_and_chunks(history):
+    chunks = list(iter_assignment_history(chunk_size=2))
+    assert [len(rows) for rows in chunks] == [2, 2, 1]
+    assert _keys(chunks) == [(1, 1), (1, 4), (2, 2), (2, 5), (3, 3)]
+    assert _keys(iter_assignment_history(classroom="B")) == [(3, 3)]
+
+
+def test_an_interrupted_export_resumes_after_the_last_row(history):
+    rows = [json.loads(line) for line in b"".join(
+        export_assignment_history("ndjson")).splitlines()]
+    received = rows[:2]
+    last = received[-1]
+    resumed = [json.loads(line) for line in b"".join(
+        export_assignment_history(
+            "ndjson", after=f"{last['student_id']}:{last['assignment_id']}")
+    ).splitlines()]
+    assert received + resumed == rows
+    assert resumed[0]["type"] == "homework"
+
+
+def test_csv_export(history):
+    lines = list(csv.reader(io.StringIO("".join(
+        export_assignment_history("csv", teacher_id=1)))))
+    assert lines[0][:2] == ["student_id", "assignment_id"]
+    assert len(lines) == 6
+    with pytest.raises(ValueError):
+        export_assignment_history("xml")
+
+
+def test_export_endpoint(history, client):
+    response = client.get("/exports/assignments",
+                          params={"format": "ndjson", "after": "2:5"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["assignment_id"]
+            for line in response.text.splitlines()] == [3]
+    assert client.get("/exports/assignments",
+                      params={"after": "x"}).status_code == 400
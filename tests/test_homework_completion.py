@@ -0,0 +1,31 @@
+import crud
+
+
+def _assign(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 100)
+    crud.create_homework("Al-Ikhlas", "Memorize", 112, 112, 1, 4, 300,
+                         "completed")
+    crud.assign_to_roster(teacher_id=1, homework_id=1)
+    crud.assign_to_roster(classroom="A", homework_id=2)
+
+
+def test_assigned_students_are_listed_by_classroom(roster):
+    _assign(roster)
+    students = crud.get_assigned_students(1)
+    assert [(s["student_id"], s["classroom"]) for s in students] == \
+        [(1, "A"), (2, "A"), (3, "B")]
+    assert crud.get_assigned_students(2)[0]["name"] == "Student 1"
+    assert "error" in crud.get_assigned_students(99)
+
+
+def test_completion_is_counted_per_classroom(roster):
+    _assign(roster)
+    completion = crud.get_homework_completion(teacher_id=1, now=200)
+    assert [(entry["homework_id"], entry["assigned"], entry["completed"],
+             entry["overdue"]) for entry in completion] == \
+        [(1, 3, 0, 3), (2, 2, 2, 0)]
+    assert completion[0]["classrooms"] == [
+        {"classroom": "A", "assigned": 2, "completed": 0, "overdue": 2},
+        {"classroom": "B", "assigned": 1, "completed": 0, "overdue": 1}]
+    assert [entry["assigned"] for entry in crud.get_homework_completion(
+        classroom="B", now=50)] == [1]
@@ -0,0 +1,54 @@
+import metrics
+from metrics import Counter, Gauge, Histogram, request_scope, \
+    statement_label
+from conftest import query
+
+
+def test_statement_labels():
+    assert statement_label("SELECT * FROM Users WHERE id = ?") == \
+        "SELECT Users"
+    assert statement_label('INSERT INTO "Tasks" (title) VALUES (?)') == \
+        "INSERT Tasks"
+    assert statement_label("  ") == "EMPTY"
+    assert statement_label("BEGIN IMMEDIATE") == "BEGIN"
+
+
+def test_metric_rendering():
+    counter = Counter("c_total", "Things", ("kind",))
+    counter.inc(2, 'a"b')
+    assert counter.render()[2] == 'c_total{kind="a\\"b"} 2'
+
+    histogram = Histogram("h_seconds", "Latency", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert histogram.render()[2:] == [
+        'h_seconds_bucket{le="0.1"} 1', 'h_seconds_bucket{le="1.0"} 2',
+        'h_seconds_bucket{le="+Inf"} 3', "h_seconds_sum 5.55",
+        "h_seconds_count 3"]
+
+    gauge = Gauge("g", "Depth")
+    gauge.set_function(lambda: 7)
+    assert gauge.render()[2] == "g 7"
+
+
+def test_request_scope_counts_queries(db):
+    with request_scope() as stats:
+        query("SELECT COUNT(*) FROM Users")
+        query("SELECT COUNT(*) FROM Students")
+    assert stats.queries >= 2
+    assert stats.db_time > 0
+
+
+def test_slow_queries_are_logged(db, monkeypatch):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0)
+    query("SELECT COUNT(*) FROM Homework")
+    assert metrics.get_slow_queries()[-1]["statement"] == "SELECT Homework"
+
+
+def test_metrics_endpoint(client):
+    client.get("/students/")
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",' \
+           'route="/students/",status="200"}' in body
+    assert "# TYPE sqlite_statements_total counter" in body
@@ -0,0 +1,55 @@
+import sqlite3
+
+import dataBase
+from conftest import query
+
+
+def test_migrate_is_idempotent(db):
+    assert dataBase.migrate() == dataBase.SCHEMA_VERSION
+    assert dataBase.migrate() == dataBase.SCHEMA_VERSION
+    assert query("PRAGMA user_version") == [(dataBase.SCHEMA_VERSION,)]
+
+
+def test_legacy_homeworks_table_is_migrated(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.execute("CREATE TABLE Homeworks (id INTEGER PRIMARY KEY "
+                 "AUTOINCREMENT, description TEXT NOT NULL, "
+                 "chapter_start INTEGER, chapter_end INTEGER, "
+                 "verse_start INTEGER, verse_end INTEGER, due_date DATE, "
+                 "status TEXT NOT NULL)")
+    conn.execute("INSERT INTO Homeworks (description, chapter_start, "
+                 "chapter_end, verse_start, verse_end, status) "
+                 "VALUES ('Memorize', 1, 1, 1, 7, 'pending')")
+    conn.commit()
+    try:
+        assert dataBase.migrate(conn) == dataBase.SCHEMA_VERSION
+        tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "Homework" in tables and "Homeworks" not in tables
+        # Backfilled by the later migrations
+        assert conn.execute("SELECT description, ordinal_start, ordinal_end "
+                            "FROM Homework").fetchall() == \
+            [("Memorize", 1, 7)]
+        assert conn.execute("SELECT total FROM StatusSummary WHERE "
+                            "entity = 'Homework' AND status = 'pending'"
+                            ).fetchall() == [(1,)]
+        assert conn.execute("SELECT rowid FROM HomeworkSearch WHERE "
+                            "HomeworkSearch MATCH 'memorize'"
+                            ).fetchall() == [(1,)]
+    finally:
+        conn.close()
+
+
+def test_hot_queries_use_indexes(db):
+    assert dataBase.check_query_plans() == []
+
+
+def test_a_full_scan_is_reported(db):
+    conn = sqlite3.connect(db)
+    try:
+        conn.execute("DROP INDEX idx_students_teacher_id")
+        problems = dataBase.check_query_plans(conn)
+    finally:
+        conn.close()
+    assert any(problem.startswith("students by teacher:")
+               for problem in problems)
@@ -0,0 +1,31 @@
+import json
+
+import crud
+
+
+def test_keyset_pages_cover_every_user_once(roster):
+    first = crud.get_all_users(limit=1)
+    second = crud.get_all_users(limit=1, after=first[-1]["id"])
+    assert [user["id"] for user in first + second] == [1, 2]
+    assert crud.get_all_users(limit=5, after=2) == []
+
+
+def test_users_never_expose_passwords(roster):
+    assert all("password" not in user for user in crud.get_all_users())
+
+
+def test_iter_students_walks_all_batches(roster):
+    students = list(crud.iter_students(batch_size=2))
+    assert [student["id"] for student in students] == [1, 2, 3]
+    assert [student["id"] for student in crud.iter_students(after=2)] == [3]
+
+
+def test_listing_endpoint_pages_and_streams(roster, client):
+    page = client.get("/users/", params={"limit": 1, "after": 1}).json()
+    assert [user["id"] for user in page] == [2]
+    assert client.get("/users/", params={"limit": 0}).status_code == 422
+
+    response = client.get("/students/", params={"stream": True})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [student["id"] for student in lines] == [1, 2, 3]
@@ -0,0 +1,43 @@
+import crud
+from conftest import query
+from quran import TOTAL_AYAHS, ayah_ordinal, ordinal_to_ayah, \
+    range_length, validate_range
+
+
+def test_ordinals_round_trip():
+    assert ayah_ordinal(1, 1) == 1
+    assert ayah_ordinal(2, 1) == 8
+    assert ayah_ordinal(114, 6) == TOTAL_AYAHS == 6236
+    for ordinal in (1, 7, 8, 262, 6236):
+        assert ayah_ordinal(*ordinal_to_ayah(ordinal)) == ordinal
+    assert ordinal_to_ayah(0) is None
+
+
+def test_invalid_references():
+    assert ayah_ordinal(1, 8) is None
+    assert ayah_ordinal(115, 1) is None
+    assert ayah_ordinal("1", 1) is None
+    assert validate_range(2, 5, 2, 1) == \
+        "The start verse must come before the end verse"
+    assert range_length(1, 1, 2, 3) == 10
+
+
+def test_ordinals_are_callable_from_sql(db):
+    assert query("SELECT ayah_ordinal(2, 255)") == [(262,)]
+
+
+def _titles(result) -> list:
+    return sorted(homework["title"] for homework in result)
+
+
+def test_range_queries(db):
+    crud.create_homework("Fatiha", "", 1, 1, 1, 7, 1)
+    crud.create_homework("Kursi", "", 2, 2, 255, 257, 1)
+    crud.create_homework("Baqarah", "", 2, 2, 1, 286, 1)
+    assert _titles(crud.get_homework_covering(2, 255)) == \
+        ["Baqarah", "Kursi"]
+    assert _titles(crud.get_homework_overlapping(1, 7, 2, 1)) == \
+        ["Baqarah", "Fatiha"]
+    assert _titles(crud.get_homework_within(2, 200, 3, 1)) == ["Kursi"]
+    assert "error" in crud.get_homework_covering(1, 8)
+    assert "error" in crud.create_homework("Bad", "", 2, 1, 5, 1, 1)
@@ -0,0 +1,80 @@
+import sqlite3
+
+import crud
+from conftest import query
+from records import HOMEWORK, STUDENTS, TASKS, USERS, Projection
+
+
+def test_projection_select_and_rows():
+    projection = Projection("Things", ("id", "label"), ("id", "name"))
+    assert projection.select("id = ?", "LIMIT 1") == \
+        "SELECT id, label FROM Things WHERE id = ? LIMIT 1"
+    assert projection.select("id = ?", "LIMIT 1") is \
+        projection.select("id = ?", "LIMIT 1")
+    assert projection.row((1, "a")) == {"id": 1, "name": "a"}
+    assert projection.row(None) is None
+    assert projection.rows([(1, "a"), (2, "b")])[1] == {"id": 2, "name": "b"}
+
+
+def test_reads_use_the_projected_keys(roster):
+    user = crud.get_user_by_id(1)
+    assert set(user) == set(USERS.keys)
+    assert "password" not in user
+    student = crud.get_student_by_id(1)
+    assert set(student) == set(STUDENTS.keys)
+    assert student["parent_id"] == 2 and student["teacher_id"] == 1
+
+
+def test_responses_are_rendered_by_the_default_class(roster, client):
+    response = client.get("/users/1")
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["email"] == "teacher@example.com"
+    assert [student["id"] for student in
+            client.get("/students/").json()] == [1, 2, 3]
+
+
+def test_table_sql_binds_values_in_column_order():
+    assert TASKS.signature({"status": "x", "title": "y"}) == \
+        ("title", "status")
+    assert TASKS.insert_sql(("title", "status")) == \
+        "INSERT INTO Tasks (title, status) VALUES (?, ?)"
+    assert HOMEWORK.update_sql(("status",), ("title = title || ?",),
+                               "status != ?") == \
+        "UPDATE Homework SET status = ?, title = title || ? " \
+        "WHERE id = ? AND status != ?"
+    assert USERS.delete_sql("email") == \
+        "DELETE FROM Users WHERE id = ? RETURNING email"
+    assert TASKS.validate({"state": 1}) == "Unknown field for Tasks: state"
+    assert TASKS.validate({"status": "done"}) == \
+        "Invalid status. Must be one of: completed, incomplete"
+    assert HOMEWORK.validate({"ordinal_start": 1}) is not None
+
+
+def test_bulk_inserts_group_by_column_set():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE Tasks (id INTEGER PRIMARY KEY, title, "
+                 "description, start_date, end_date, status)")
+    cursor = conn.cursor()
+    assert TASKS.insert_many(cursor, [
+        {"status": "incomplete", "title": "a"},
+        {"title": "b", "status": "completed", "end_date": 5},
+        {"title": "c", "status": "incomplete"}]) == 3
+    # One executemany per column set: a and c first, then b
+    assert conn.execute("SELECT id, title FROM Tasks").fetchall() == \
+        [(1, "a"), (2, "c"), (3, "b")]
+
+
+def test_updates_write_the_right_columns(roster):
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1)
+    crud.create_task("Tajweed", "", 1, 2)
+    crud.create_assignment(1, homework_id=1)
+    assert crud.update_task(1, start_date=0, status="completed") == \
+        {"message": "Updated tasks successfully!"}
+    assert crud.get_task_by_id(1)["start_date"] == 0
+    assert crud.get_task_by_id(1)["status"] == "completed"
+    assert "message" in crud.update_assignment(1, task_id=1)
+    assert query("SELECT student_id, homework_id, task_id FROM Assignments") \
+        == [(1, 1, 1)]
+    assert "error" in crud.update_assignment(1, task_id=99)
+    assert "error" in crud.update_homework(99, title="Missing")
+    assert "error" in crud.update_student(1, parent_id=1)
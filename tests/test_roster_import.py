@@ -0,0 +1,117 @@
+import io
+
+import pytest
+
+import crud
+from conftest import query
+from connection import MAX_SQL_PARAMS
+from roster_import import detect_format, iter_roster_rows
+
+
+def test_detect_format():
+    assert detect_format("roster.CSV") == "csv"
+    assert detect_format("roster.jsonl") == "ndjson"
+    assert detect_format("roster.txt", "ndjson") == "ndjson"
+    with pytest.raises(ValueError):
+        detect_format("roster.xlsx")
+
+
+def test_csv_rows_are_stripped():
+    data = b"\xef\xbb\xbfname, email\n Ann , ann@example.com\n"
+    assert list(iter_roster_rows(io.BytesIO(data), "csv")) == \
+        [{"name": "Ann", "email": "ann@example.com"}]
+
+
+def test_bad_ndjson_lines_become_errors():
+    data = b'{"name": "Ann"}\n\nnot json\n[1, 2]\n'
+    rows = list(iter_roster_rows(io.BytesIO(data), "ndjson"))
+    assert rows[0] == {"name": "Ann"}
+    assert [type(row) for row in rows[1:]] == [ValueError, ValueError]
+
+
+def test_bulk_create_users_reports_bad_rows(roster):
+    rows = [
+        {"name": "A", "email": "a@example.com", "password": "pw",
+         "role": "parent"},
+        {"name": "B", "email": "a@example.com", "password": "pw",
+         "role": "parent"},
+        {"name": "C", "email": "teacher@example.com", "password": "pw",
+         "role": "teacher"},
+        {"name": "D", "email": "d@example.com", "password": "pw",
+         "role": "janitor"},
+        {"name": "E", "email": "e@example.com"},
+        ValueError("Invalid JSON"),
+    ]
+    result = crud.bulk_create_users(rows, chunk_size=4)
+    assert result["created"] == 1
+    assert [error["row"] for error in result["errors"]] == [2, 3, 4, 5, 6]
+    stored = query("SELECT password FROM Users WHERE email = ?",
+                   ("a@example.com",))[0][0]
+    assert stored.startswith("scrypt$")
+
+
+def test_bulk_create_users_chunks_above_the_parameter_limit(db):
+    count = MAX_SQL_PARAMS + 100
+    rows = [{"name": f"User {i}", "email": f"user{i}@example.com",
+             "password": "pw", "role": "parent"} for i in range(count)]
+    result = crud.bulk_create_users(rows, chunk_size=count)
+    assert result == {"created": count, "failed": 0, "errors": []}
+    # Every email is now taken
+    assert crud.bulk_create_users(rows, chunk_size=count)["failed"] == count
+
+
+def test_bulk_create_students_validates_references(roster):
+    rows = [
+        {"name": "S", "email": "s@example.com", "parent_id": "2",
+         "teacher_id": "1", "classroom": "C"},
+        {"name": "T", "email": "t@example.com", "parent_id": 1,
+         "teacher_id": 1},
+        {"name": "U", "email": "u@example.com", "parent_id": 2,
+         "teacher_id": 2},
+        {"name": "V", "email": "v@example.com", "parent_id": "x",
+         "teacher_id": 1},
+    ]
+    result = crud.bulk_create_students(rows)
+    assert result["created"] == 1
+    assert {error["row"]: error["error"] for error in result["errors"]} == {
+        2: "Invalid parent ID: 1", 3: "Invalid teacher ID: 2",
+        4: "parent_id and teacher_id must be integers"}
+    assert query("SELECT classroom FROM Students WHERE email = ?",
+                 ("s@example.com",)) == [("C",)]
+
+
+def test_import_endpoints_bound_chunk_size(db):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        for path in ("/users/import", "/students/import"):
+            for chunk_size in (0, main.MAX_IMPORT_CHUNK + 1):
+                response = client.post(
+                    path, params={"chunk_size": chunk_size},
+                    files={"file": ("roster.csv", b"name\n")})
+                assert response.status_code == 422
+
+
+@pytest.mark.parametrize("fmt, tail", [
+    ("csv", b'"' + b"x" * 200000 + b'",y@example.com,pw,parent\n'),
+    ("csv", b"\xff,y@example.com,pw,parent\n"),
+    ("ndjson", b'{"name": "\xff"}\n')],
+    ids=["csv-field-too-large", "csv-not-utf8", "ndjson-not-utf8"])
+def test_unreadable_tail_is_reported_after_earlier_rows(db, fmt, tail):
+    rows = [{"name": f"User {i}", "email": f"user{i}@example.com",
+             "password": "pw", "role": "parent"} for i in range(200)]
+    if fmt == "csv":
+        data = "name,email,password,role\n" + "".join(
+            ",".join(row.values()) + "\n" for row in rows)
+    else:
+        data = "".join(f'{{"name": "{row["name"]}", "email": '
+                       f'"{row["email"]}", "password": "pw", '
+                       f'"role": "parent"}}\n' for row in rows)
+    result = crud.bulk_create_users(
+        iter_roster_rows(io.BytesIO(data.encode() + tail), fmt),
+        chunk_size=50)
+    assert result["created"] == 200
+    assert [error["row"] for error in result["errors"]] == [201]
+    assert "UTF-8" in result["errors"][0]["error"] or \
+        "Unreadable file" in result["errors"][0]["error"]
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import crud
+from scheduler import DeadlineScheduler
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_reminders_and_overdue_events_for_every_school(db, schools):
+    events = []
+    lock = threading.Lock()
+
+    def record(event):
+        def callback(batch):
+            with lock:
+                events.extend((event, item["school"], item["kind"],
+                               item["id"]) for item in batch)
+        return callback
+
+    schools.create_school("north")
+    scheduler = DeadlineScheduler(record("reminder"), record("overdue"),
+                                  lead_time=1, window=60)
+    scheduler.start()
+    try:
+        due = int(time.time()) + 2
+        crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, due)
+        crud.create_task("Tajweed", "", None, due)
+        with schools.tenant_scope("north"):
+            crud.create_homework("Al-Ikhlas", "", 112, 112, 1, 4, due)
+        # Completed before it is due: neither event is sent
+        crud.update_task(1, status="completed")
+        expected = {(event, school, "homework", 1)
+                    for event in ("reminder", "overdue")
+                    for school in (None, "north")}
+        assert _wait_for(lambda: len(events) >= len(expected))
+        time.sleep(0.2)
+    finally:
+        scheduler.stop()
+    assert set(events) == expected and len(events) == len(expected)
+
+
+def test_deadlines_already_in_the_database_are_loaded(db):
+    overdue = []
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, int(time.time()) + 1)
+    crud.create_homework("Done", "", 1, 1, 1, 7, int(time.time()) + 1,
+                         "completed")
+    scheduler = DeadlineScheduler(on_overdue=overdue.extend, lead_time=0)
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: overdue)
+    finally:
+        scheduler.stop()
+    assert [(item["kind"], item["id"]) for item in overdue] == \
+        [("homework", 1)]
+
+
+def test_loading_leaves_the_tenant_pools_alone(db, schools):
+    for school in ("north", "south"):
+        schools.create_school(school)
+        with schools.tenant_scope(school):
+            crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7,
+                                 int(time.time()) + 30)
+    schools.close_tenant_pools()
+    scheduler = DeadlineScheduler(lead_time=0, window=60)
+    scheduler._load(int(time.time()) + 60)
+    assert sorted(key[0] for key in scheduler._due) == ["north", "south"]
+    assert scheduler._read_due(("north", "homework", 1)) > 0
+    assert list(schools._pools) == []
@@ -0,0 +1,56 @@
+import crud
+import dataBase
+from conftest import query
+
+
+def _found(*args, **kwargs) -> list:
+    return [(item["type"], item["id"]) for item in crud.search(*args,
+                                                               **kwargs)]
+
+
+def test_match_expression():
+    assert crud._match_expression("surah al-ba") == '"surah" "al" "ba"*'
+    assert crud._match_expression("tajweed ") == '"tajweed"'
+    assert crud._match_expression('OR "NEAR(') == '"OR" "NEAR"'
+    assert crud._match_expression("  ...") is None
+
+
+def test_search_follows_writes(roster):
+    crud.create_homework("Surah Al-Baqarah", "Memorize the first page",
+                         2, 2, 1, 5, 1)
+    crud.create_task("Tajweed revision", "Revise the rules of madd", 1, 2)
+    assert _found("baq") == [("homework", 1)]
+    assert _found("revis") == [("task", 1)]
+    assert _found("madd", kind="homework") == []
+    crud.update_task(1, description="Practice makharij")
+    assert _found("madd") == []
+    assert _found("makharij") == [("task", 1)]
+    crud.delete_homework(1)
+    assert _found("baqarah") == []
+    assert "error" in crud.search("madd", kind="lesson")
+    assert "error" in crud.search("!!")
+
+
+def test_search_by_teacher_and_classroom(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 1)
+    crud.create_homework("Al-Ikhlas", "Memorize", 112, 112, 1, 4, 1)
+    crud.create_assignment(1, homework_id=1)
+    crud.create_assignment(3, homework_id=2)
+    assert sorted(_found("memorize", teacher_id=1)) == \
+        [("homework", 1), ("homework", 2)]
+    assert _found("memorize", classroom="B") == [("homework", 2)]
+    assert _found("memorize", teacher_id=2) == []
+    result = crud.search("fatiha")[0]
+    assert result["snippet"] == "Al-[Fatiha]"
+
+
+def test_rebuilt_index_matches_the_triggers(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 1)
+    crud.update_homework(1, title="Al-Kawthar")
+    before = query("SELECT rowid FROM HomeworkSearch "
+                   "WHERE HomeworkSearch MATCH 'kawthar'")
+    dataBase.rebuild_search()
+    assert query("SELECT rowid FROM HomeworkSearch "
+                 "WHERE HomeworkSearch MATCH 'kawthar'") == before == [(1,)]
+    assert query("INSERT INTO HomeworkSearch (HomeworkSearch, rank) "
+                 "VALUES ('integrity-check', 1)") == []
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import crud
+import snapshot
+from connection import ConnectionPool, use_pool
+from snapshot import SnapshotManager, on_snapshot
+
+
+@pytest.fixture
+def manager(db, monkeypatch):
+    manager = SnapshotManager(db, max_age=60)
+    monkeypatch.setattr(snapshot, "_manager", manager)
+    yield manager
+    manager.stop()
+
+
+@on_snapshot
+def _student_count() -> int:
+    connection = crud.get_db_connection()
+    try:
+        return connection.execute("SELECT COUNT(*) FROM Students"
+                                  ).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_reports_read_the_snapshot_until_it_is_refreshed(roster, manager):
+    # No snapshot yet: the primary database
+    assert _student_count() == 3
+    manager.refresh()
+    crud.delete_student(3)
+    assert _student_count() == 3
+    manager.refresh()
+    assert _student_count() == 2
+
+
+def test_stale_snapshots_fall_back_to_the_primary(roster, manager):
+    manager.refresh()
+    crud.delete_student(3)
+    manager.max_age = 0
+    assert _student_count() == 2
+
+
+def test_routed_requests_never_use_the_snapshot(roster, manager, tmp_path):
+    manager.refresh()
+    other = ConnectionPool(str(tmp_path / "other.db"))
+    try:
+        with use_pool(other):
+            assert snapshot.reporting_pool() is None
+    finally:
+        other.close()
+
+
+def test_old_generations_are_deleted(db, manager):
+    first = manager.refresh()
+    second = manager.refresh()
+    assert os.path.exists(first.path)
+    third = manager.refresh()
+    assert not os.path.exists(first.path)
+    assert os.path.exists(second.path) and os.path.exists(third.path)
+    manager.stop()
+    assert not os.path.exists(third.path)
@@ -0,0 +1,38 @@
+import crud
+
+
+def _feed(roster):
+    crud.create_homework("Al-Fatiha", "Memorize", 1, 1, 1, 7, 300)
+    crud.create_homework("Al-Baqarah", "Revise", 2, 2, 1, 5, 100,
+                         "completed")
+    crud.create_task("Tajweed", "Practice", 50, 200)
+    crud.create_assignment(1, homework_id=1)
+    crud.create_assignment(1, homework_id=2)
+    crud.create_assignment(1, task_id=1)
+    crud.create_assignment(2, homework_id=1)
+
+
+def test_feed_joins_homework_and_tasks_by_due_date(roster):
+    _feed(roster)
+    feed = crud.get_student_homework(1)
+    assert [(item["type"], item["title"], item["due_date"])
+            for item in feed] == [("homework", "Al-Baqarah", 100),
+                                  ("task", "Tajweed", 200),
+                                  ("homework", "Al-Fatiha", 300)]
+    assert feed[1]["start_date"] == 50
+    assert feed[2]["verse_end"] == 7
+
+
+def test_feed_filters_and_pages(roster):
+    _feed(roster)
+    assert [item["title"] for item in crud.get_student_homework(
+        1, status="pending")] == ["Al-Fatiha"]
+    assert [item["title"] for item in crud.get_student_homework(
+        1, due_after=150, due_before=250)] == ["Tajweed"]
+    assert [item["title"] for item in crud.get_student_homework(
+        1, descending=True, limit=1, offset=1)] == ["Tajweed"]
+
+
+def test_empty_feed_and_unknown_student(roster):
+    assert crud.get_student_homework(3) == []
+    assert "error" in crud.get_student_homework(99)
@@ -0,0 +1,48 @@
+import crud
+import dataBase
+from conftest import query
+
+
+def _summaries() -> tuple:
+    return (query("SELECT * FROM TeacherSummary WHERE students != 0 "
+                  "OR homework_pending != 0 OR homework_completed != 0 "
+                  "OR tasks_incomplete != 0 OR tasks_completed != 0 "
+                  "ORDER BY teacher_id"),
+            query("SELECT * FROM StatusSummary WHERE total != 0 "
+                  "ORDER BY entity, status"))
+
+
+def test_triggers_match_a_rebuild(roster):
+    crud.create_user("Second", "second@example.com", None, "teacher", "hash")
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1)
+    crud.create_homework("Al-Ikhlas", "", 112, 112, 1, 4, 1, "completed")
+    crud.create_task("Tajweed", "", 1, 2)
+    crud.assign_to_roster(teacher_id=1, homework_id=1)
+    crud.create_assignment(1, homework_id=2)
+    crud.create_assignment(3, task_id=1)
+    crud.update_homework(1, status="completed")
+    crud.update_task(1, status="completed")
+    crud.update_student(3, teacher_id=3)
+    crud.update_assignment(1, homework_id=2)
+    crud.delete_assignment(2)
+    crud.delete_homework(2)
+    crud.create_student("Late", "late@example.com", None, 2, 3, "B")
+
+    incremental = _summaries()
+    assert incremental[0]
+    dataBase.rebuild_summaries()
+    assert _summaries() == incremental
+
+
+def test_dashboard_reads(roster):
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1)
+    crud.create_task("Tajweed", "", 1, 2, "completed")
+    crud.assign_to_roster(classroom="A", homework_id=1, task_id=1)
+    assert crud.get_teacher_summary(1) == {
+        "teacher_id": 1, "students": 3, "homework_pending": 2,
+        "homework_completed": 0, "tasks_incomplete": 0,
+        "tasks_completed": 2}
+    assert crud.get_status_summary() == {
+        "Homework": {"pending": 1, "completed": 0},
+        "Tasks": {"incomplete": 0, "completed": 1}}
+    assert "error" in crud.get_teacher_summary(2)
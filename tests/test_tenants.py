@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+
+import crud
+from passwords import hash_password
+
+
+def _add_user(name: str, email: str, role: str):
+    crud.create_user(name, email, None, role, hash_password("pw"))
+
+
+def _login(client, email: str, school: str = None) -> dict:
+    headers = {"X-School": school} if school else {}
+    token = client.post("/login", data={"email": email, "password": "pw"},
+                        headers=headers).json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_create_school_validates_ids(schools):
+    assert schools.create_school("north")["school"] == "north"
+    assert "error" in schools.create_school("north")
+    assert "error" in schools.create_school("../etc")
+    assert "error" in schools.create_school("North")
+    assert schools.list_schools() == ["north"]
+    with pytest.raises(schools.UnknownSchool):
+        schools.get_tenant_pool("south")
+
+
+def test_each_school_has_its_own_rows_and_cache_entries(roster, schools):
+    schools.create_school("north")
+    with schools.tenant_scope("north") as school:
+        assert schools.current_tenant() == school
+        assert "error" in crud.get_user_by_id(1)
+        _add_user("North teacher", "t@north.example", "teacher")
+        assert crud.get_user_by_id(1)["name"] == "North teacher"
+    assert schools.current_tenant() is None
+    assert crud.get_user_by_id(1)["name"] == "Teacher"
+
+
+def test_requests_are_routed_by_header(roster, schools, client):
+    schools.create_school("north")
+    with schools.tenant_scope("north"):
+        _add_user("North teacher", "t@north.example", "teacher")
+    assert client.get("/users/1").json()["name"] == "Teacher"
+    north = client.get("/users/1", headers={"X-School": "north"})
+    assert north.json()["name"] == "North teacher"
+    # Same URL and version, different school: different ETag
+    assert north.headers["etag"] != client.get("/users/1").headers["etag"]
+    assert client.get("/users/1", headers={"X-School": "south"}
+                      ).status_code == 404
+    assert client.get("/users/1", headers={"X-School": "../x"}
+                      ).status_code == 400
+
+
+def test_fan_out_reads_every_school_in_batches(db, schools):
+    count = schools.ATTACH_BATCH_SIZE + 2
+    for i in range(count):
+        schools.create_school(f"school-{i:02d}")
+        with schools.tenant_scope(f"school-{i:02d}"):
+            _add_user("Admin", "admin@example.com", "admin")
+            if i % 2:
+                _add_user("Other", f"other{i}@example.com", "parent")
+    totals = schools.get_school_totals()
+    assert [row["school"] for row in totals] == schools.list_schools()
+    assert [row["users"] for row in totals] == [1 + i % 2
+                                                for i in range(count)]
+    assert len(schools.find_users_by_email("admin@example.com")) == count
+    assert schools.fan_out("SELECT id FROM {db}.Users WHERE id = ?", (2,),
+                           ["school-01", "school-03"]) == \
+        [("school-01", 2), ("school-03", 2)]
+
+
+def test_admin_endpoints_need_a_default_admin_session(db, schools, client):
+    _add_user("Admin", "admin@example.com", "admin")
+    _add_user("Teacher", "teacher@example.com", "teacher")
+    schools.create_school("north")
+    with schools.tenant_scope("north"):
+        _add_user("North admin", "admin@example.com", "admin")
+
+    assert client.get("/admin/schools").status_code == 401
+    teacher = _login(client, "teacher@example.com")
+    assert client.get("/admin/schools", headers=teacher).status_code == 403
+    north_admin = _login(client, "admin@example.com", "north")
+    assert client.get("/admin/schools", headers=dict(
+        north_admin, **{"X-School": "north"})).status_code == 403
+    # A session only counts for the school it was opened in
+    assert client.get("/admin/schools",
+                      headers=north_admin).status_code == 401
+
+    admin = _login(client, "admin@example.com")
+    assert client.post("/admin/schools", params={"school": "south"},
+                       headers=admin).json()["school"] == "south"
+    assert [row["school"] for row in client.get(
+        "/admin/schools", headers=admin).json()] == ["north", "south"]
+    assert [row["school"] for row in client.get(
+        "/admin/users", params={"email": "admin@example.com"},
+        headers=admin).json()] == ["north"]
+
+
+def test_evicted_pools_close_once_returned(db, schools, monkeypatch):
+    monkeypatch.setattr(schools, "MAX_TENANT_POOLS", 1)
+    schools.create_school("north")
+    north = schools.get_tenant_pool("north")
+    held = north.acquire()
+    schools.create_school("south")
+    assert schools.open_pool("north") is None
+    # Still usable by whoever holds it
+    assert held.execute("SELECT COUNT(*) FROM Users").fetchone() == (0,)
+    raw = held.raw
+    held.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        raw.execute("SELECT 1")
+    conn = north.acquire()
+    assert conn.execute("SELECT 1").fetchone() == (1,)
+    conn.close()
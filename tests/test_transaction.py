@@ -0,0 +1,123 @@
+import pytest
+
+import crud
+from conftest import query
+from connection import current_transaction, get_db_connection, transaction
+
+
+def _insert_task(title: str):
+    connection = get_db_connection()
+    try:
+        connection.execute("INSERT INTO Tasks (title, description, status) "
+                           "VALUES (?, '', 'incomplete')", (title,))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _titles() -> list:
+    return [row[0] for row in query("SELECT title FROM Tasks ORDER BY id")]
+
+
+def test_commits_once_at_the_end(db):
+    with transaction():
+        _insert_task("a")
+        _insert_task("b")
+        # Both writes share one connection and one open transaction
+        connection = get_db_connection()
+        assert connection.in_transaction
+        connection.close()
+    assert _titles() == ["a", "b"]
+    assert current_transaction() is None
+
+
+def test_an_exception_rolls_everything_back(db):
+    with pytest.raises(RuntimeError):
+        with transaction():
+            _insert_task("a")
+            raise RuntimeError
+    assert _titles() == []
+
+
+def test_nested_transaction_is_a_savepoint(db):
+    with transaction() as outer:
+        _insert_task("a")
+        with pytest.raises(RuntimeError):
+            with transaction() as inner:
+                assert inner is outer
+                _insert_task("b")
+                raise RuntimeError
+        _insert_task("c")
+    assert _titles() == ["a", "c"]
+
+
+def test_handle_rollback_only_undoes_its_own_writes(db):
+    with transaction():
+        _insert_task("a")
+        connection = get_db_connection()
+        connection.execute("INSERT INTO Tasks (title, description, status) "
+                           "VALUES ('b', '', 'incomplete')")
+        connection.rollback()
+        connection.close()
+    assert _titles() == ["a"]
+
+
+def test_callbacks_run_after_commit_only(db):
+    calls = []
+    with transaction() as unit:
+        unit.after_commit(calls.append, "committed")
+        assert calls == []
+    assert calls == ["committed"]
+
+    with pytest.raises(RuntimeError):
+        with transaction() as unit:
+            unit.after_commit(calls.append, "rolled back")
+            raise RuntimeError
+    assert calls == ["committed"]
+
+
+def test_rolled_back_savepoint_drops_its_callbacks(db):
+    calls = []
+    with transaction() as unit:
+        unit.after_commit(calls.append, "outer")
+        with pytest.raises(RuntimeError):
+            with transaction():
+                unit.after_commit(calls.append, "inner")
+                raise RuntimeError
+        with transaction():
+            unit.after_commit(calls.append, "kept")
+    assert calls == ["outer", "kept"]
+
+
+def test_rolled_back_update_keeps_the_cache_entry(roster):
+    crud.get_student_by_id(1)
+    with transaction():
+        with pytest.raises(RuntimeError):
+            with transaction():
+                crud.update_student(1, name="Discarded")
+                raise RuntimeError
+    assert crud.ENTITY_CACHES["Students"].get((None, 1))["name"] == \
+        "Student 1"
+
+
+def test_assign_to_roster_skips_existing_assignments(roster):
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1)
+    assert crud.assign_to_roster(classroom="A", homework_id=1) == \
+        {"message": "Assigned to 2 students", "assigned": 2}
+    assert crud.assign_to_roster(teacher_id=1, homework_id=1) == \
+        {"message": "Assigned to 1 students", "assigned": 1}
+    assert "error" in crud.assign_to_roster(homework_id=1)
+    assert "error" in crud.assign_to_roster(teacher_id=2, homework_id=1)
+
+
+def test_set_status_updates_many_rows(roster):
+    for i in range(3):
+        crud.create_homework(f"H{i}", "", 1, 1, 1, 7, 1)
+    crud.assign_to_roster(teacher_id=1, homework_id=1)
+    assert crud.set_status("homework", [1, 2, 99], "completed")["updated"] \
+        == 2
+    assert crud.set_status("homework", [1, 2], "completed")["updated"] == 0
+    assert crud.get_homework_by_id(2)["status"] == "completed"
+    assert crud.get_student_coverage(3)["ayahs_completed"] == 7
+    assert "error" in crud.set_status("homework", ["x"], "completed")
+    assert "error" in crud.set_status("lesson", [1], "completed")
@@ -0,0 +1,34 @@
+import crud
+from connection import MAX_SQL_PARAMS
+from conftest import query
+
+
+def test_roles_are_checked(roster):
+    assert crud.validate_ids(teacher_id=1, parent_id=2) == [True, True]
+    assert crud.validate_ids(teacher_id=2, parent_id=1) == [False, False]
+    assert crud.validate_ids(user_id=2, student_id=99) == [True, False]
+
+
+def test_lists_are_valid_only_if_every_id_is(roster):
+    assert crud.validate_ids(student_id=[1, 2, 3]) == [True]
+    assert crud.validate_ids(student_id=[1, 99]) == [False]
+    assert crud.validate_ids(student_id=None) == [False]
+
+
+def test_batches_report_the_valid_ids(roster):
+    ids = list(range(1, MAX_SQL_PARAMS + 10))
+    assert crud.validate_id_batches(student_id=ids) == \
+        {"student_id": {1, 2, 3}}
+
+
+def test_validation_scope_memoizes_lookups(roster):
+    with crud.validation_scope():
+        assert crud.validate_ids(student_id=3) == [True]
+        conn = crud.get_db_connection()
+        conn.execute("DELETE FROM Students WHERE id = 3")
+        conn.commit()
+        conn.close()
+        # Answered from the request cache
+        assert crud.validate_ids(student_id=3) == [True]
+    assert crud.validate_ids(student_id=3) == [False]
+    assert query("SELECT COUNT(*) FROM Students") == [(2,)]
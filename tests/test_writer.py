@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+
+import pytest
+
+import crud
+from conftest import query
+from connection import PRAGMAS, ConnectionPool, current_transaction, \
+    get_db_connection, use_pool
+from writer import WriteLane, WriteQueueFull
+
+
+@pytest.fixture
+def lanes(db):
+    """Builds WriteLanes and shuts them down after the test."""
+    made = []
+
+    def make(**kwargs) -> WriteLane:
+        made.append(WriteLane(**kwargs))
+        return made[-1]
+    yield make
+    for lane in made:
+        lane.shutdown()
+
+
+def _insert_task(title: str, fail: bool = False) -> str:
+    connection = get_db_connection()
+    try:
+        connection.execute("INSERT INTO Tasks (title, description, status) "
+                           "VALUES (?, '', 'incomplete')", (title,))
+        connection.commit()
+    finally:
+        connection.close()
+    if fail:
+        raise RuntimeError(f"{title} failed")
+    return title
+
+
+def _titles() -> list:
+    return [row[0] for row in query("SELECT title FROM Tasks ORDER BY id")]
+
+
+def test_a_failing_write_only_undoes_itself(lanes):
+    lane = lanes(latency=0.2)
+    futures = [lane.submit(_insert_task, "a"),
+               lane.submit(_insert_task, "b", fail=True),
+               lane.submit(_insert_task, "c")]
+    assert futures[0].result(5) == "a"
+    with pytest.raises(RuntimeError, match="b failed"):
+        futures[1].result(5)
+    assert futures[2].result(5) == "c"
+    assert _titles() == ["a", "c"]
+
+
+def test_futures_resolve_after_the_batch_commits(lanes):
+    lane = lanes(latency=0.2)
+    first = lane.submit(_insert_task, "a")
+
+    def check():
+        # Runs in the same batch, before anything is committed
+        return first.done(), current_transaction() is not None
+    second = lane.submit(check)
+    assert second.result(5) == (False, True)
+    first.result(5)
+    # Visible to every other connection once the caller hears back
+    assert _titles() == ["a"]
+
+
+def test_a_failed_commit_fails_every_write_of_the_batch(db, lanes):
+    pool = ConnectionPool(db, pragmas=PRAGMAS + (("foreign_keys", 1),))
+    connection = pool.acquire()
+    connection.execute("CREATE TABLE Notes (task_id INTEGER REFERENCES "
+                       "Tasks(id) DEFERRABLE INITIALLY DEFERRED)")
+    connection.commit()
+    connection.close()
+
+    def orphan_note():
+        note = get_db_connection()
+        try:
+            note.execute("INSERT INTO Notes VALUES (99)")
+        finally:
+            note.close()
+
+    lane = lanes(latency=0.2)
+    try:
+        with use_pool(pool):
+            futures = [lane.submit(_insert_task, "a"),
+                       lane.submit(orphan_note)]
+        # The deferred foreign key is only checked by COMMIT
+        for future in futures:
+            with pytest.raises(sqlite3.IntegrityError):
+                future.result(5)
+    finally:
+        pool.close()
+    assert _titles() == []
+
+
+def test_a_full_queue_rejects_writes(lanes):
+    lane = lanes(latency=0, batch_size=1, queue_size=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+
+    first = lane.submit(blocking)
+    assert started.wait(5)
+    queued = lane.submit(_insert_task, "a")
+    with pytest.raises(WriteQueueFull):
+        lane.submit(_insert_task, "b")
+    release.set()
+    first.result(5)
+    assert queued.result(5) == "a"
+    assert _titles() == ["a"]
+
+
+def test_a_rolled_back_write_does_not_invalidate_caches(roster, lanes):
+    crud.get_student_by_id(1)
+    lane = lanes(latency=0.2)
+
+    def rename_then_fail():
+        crud.update_student(1, name="Discarded")
+        raise RuntimeError
+
+    failed = lane.submit(rename_then_fail)
+    renamed = lane.submit(crud.update_student, 2, name="Renamed")
+    with pytest.raises(RuntimeError):
+        failed.result(5)
+    assert "message" in renamed.result(5)
+    cache = crud.ENTITY_CACHES["Students"]
+    assert cache.get((None, 1))["name"] == "Student 1"
+    assert crud.get_student_by_id(2)["name"] == "Renamed"
+
+
+def test_writes_go_to_their_callers_school(roster, schools, lanes):
+    schools.create_school("north")
+    lane = lanes(latency=0.2)
+    with schools.tenant_scope("north"):
+        north = lane.submit(_insert_task, "north")
+    default = lane.submit(_insert_task, "default")
+    north.result(5)
+    default.result(5)
+    assert _titles() == ["default"]
+    with schools.tenant_scope("north"):
+        assert _titles() == ["north"]
+
+
+def test_shutdown_applies_queued_writes(lanes):
+    lane = lanes(latency=0.5)
+    future = lane.submit(_insert_task, "a")
+    lane.shutdown()
+    assert future.result(0) == "a"
+    with pytest.raises(RuntimeError):
+        lane.submit(_insert_task, "b")
+
+
+def test_a_failing_callback_does_not_fail_a_committed_write(lanes, caplog):
+    lane = lanes(latency=0.2)
+
+    def broken():
+        raise RuntimeError("notification failed")
+
+    def write():
+        current_transaction().after_commit(broken)
+        return _insert_task("a")
+
+    assert lane.submit(write).result(5) == "a"
+    assert _titles() == ["a"]
+    lane.shutdown()
+    assert "After-commit callback" in caplog.text
+
+
+def test_update_endpoints_go_through_the_lane(roster, client):
+    crud.create_homework("Al-Fatiha", "", 1, 1, 1, 7, 1)
+    crud.create_task("Tajweed", "", 1, 2)
+    crud.create_assignment(1, homework_id=1)
+    # Cached before the edits, so the endpoints must invalidate it
+    assert crud.get_homework_by_id(1)["status"] == "pending"
+    for path, params in (("/students/1", {"classroom": "C"}),
+                         ("/homework/1", {"status": "completed"}),
+                         ("/tasks/1", {"end_date": 3}),
+                         ("/assignments/1", {"task_id": 1})):
+        assert "message" in client.put(path, params=params).json()
+    assert crud.get_student_by_id(1)["classroom"] == "C"
+    assert crud.get_homework_by_id(1)["status"] == "completed"
+    assert crud.get_task_by_id(1)["end_date"] == 3
+    assert query("SELECT task_id FROM Assignments") == [(1,)]
+    assert "error" in client.put("/tasks/1", params={"status": "x"}).json()
@@ -0,0 +1,212 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from connection import ConnectionPool, get_pool, routed_pool, transaction, \
+    use_pool
+from metrics import WRITE_BATCH_SIZE, WRITE_COMMIT_DURATION, \
+    WRITE_QUEUE_DEPTH, WRITE_QUEUE_WAIT, WRITES_REJECTED
+
+logger = logging.getLogger(__name__)
+
+"""Single writer lane with group commit"""
+# Frequent small writes (status marks during class) go to one writer thread
+# instead of each DB worker taking the SQLite write lock and committing on
+# its own. The writer takes everything queued, waits up to WRITE_LATENCY_MS
+# after the oldest write for more (at most WRITE_BATCH_SIZE in all), and
+# applies the batch in one BEGIN IMMEDIATE ... COMMIT per database: one lock
+# acquisition and one WAL sync for the lot, and no "database is locked"
+# between the writes of a batch.
+#
+# Each write runs in its own savepoint and in its caller's context (school,
+# request caches, metrics), so a write that fails or raises only undoes
+# itself. Its caller gets the result or exception through a Future that is
+# set once the batch has committed; if the commit fails, every write in the
+# batch gets that error. The writes' after-commit work (cache invalidation,
+# deadline notifications) runs after the futures are set, and a failure
+# there is logged rather than reported to a caller whose write committed.
+# At most WRITE_QUEUE_SIZE writes may wait. Beyond that submit() raises
+# WriteQueueFull straight away, so a burst is shed instead of growing
+# everyone's latency.
+WRITE_LANE = os.environ.get("WRITE_LANE", "on") == "on"
+WRITE_LATENCY_MS = float(os.environ.get("WRITE_LATENCY_MS", 2))
+WRITE_BATCH_SIZE_LIMIT = int(os.environ.get("WRITE_BATCH_SIZE", 64))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", 1000))
+
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """Raised when too many writes are already waiting for the writer."""
+
+
+class _Write:
+    """One queued call and where its outcome goes."""
+    __slots__ = ("func", "args", "kwargs", "context", "pool", "future",
+                 "queued")
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        # The database the caller would have written to
+        self.pool = routed_pool() or get_pool()
+        self.future: Future = Future()
+        self.queued = time.perf_counter()
+
+    def run(self) -> Any:
+        return self.context.run(self.func, *self.args, **self.kwargs)
+
+
+class WriteLane:
+    """
+    Runs submitted write functions on a single thread, committing the
+    writes that queue up together in one transaction.
+    Args:
+        latency (float): Seconds a write may wait for others to join its
+            batch.
+        batch_size (int): Most writes per batch.
+        queue_size (int): Most writes waiting at once.
+    """
+
+    def __init__(self, latency: float = WRITE_LATENCY_MS / 1000,
+                 batch_size: int = WRITE_BATCH_SIZE_LIMIT,
+                 queue_size: int = WRITE_QUEUE_SIZE):
+        self.latency = latency
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Queues func(*args, **kwargs) and returns a Future for its result.
+        Never blocks; raises WriteQueueFull when the queue is full.
+        """
+        if self._closed:
+            raise RuntimeError("Write lane is shut down")
+        write = _Write(func, args, kwargs)
+        try:
+            self._queue.put_nowait(write)
+        except queue.Full:
+            WRITES_REJECTED.inc()
+            raise WriteQueueFull("Too many pending writes, try again shortly")
+        return write.future
+
+    def shutdown(self):
+        """Applies the writes already queued, then stops the thread."""
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self) -> List[_Write]:
+        """Blocks for the next write, then gathers a batch around it."""
+        first = self._queue.get()
+        if first is _STOP:
+            return []
+        batch = [first]
+        deadline = first.queued + self.latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                write = self._queue.get(timeout=remaining) \
+                    if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if write is _STOP:
+                # Finish this batch; the loop stops on the next _collect()
+                self._queue.put(_STOP)
+                break
+            batch.append(write)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            WRITE_BATCH_SIZE.observe(len(batch))
+            groups: Dict[ConnectionPool, List[_Write]] = {}
+            for write in batch:
+                groups.setdefault(write.pool, []).append(write)
+            for pool, writes in groups.items():
+                try:
+                    self._commit(pool, writes)
+                except Exception:
+                    logger.exception("Write batch failed")
+
+    def _commit(self, pool: ConnectionPool, writes: List[_Write]):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            with use_pool(pool), transaction() as unit:
+                for write in writes:
+                    if not write.future.set_running_or_notify_cancel():
+                        continue
+                    WRITE_QUEUE_WAIT.observe(started - write.queued)
+                    try:
+                        # Savepoint: an exception undoes this write only
+                        with transaction():
+                            outcomes.append((write.future, write.run(),
+                                             None))
+                    except Exception as e:
+                        outcomes.append((write.future, None, e))
+                # Run below, once the callers know their writes committed
+                callbacks = unit.take_callbacks()
+        except Exception as e:
+            for write in writes:
+                if not write.future.done():
+                    write.future.set_exception(e)
+            raise
+        finally:
+            WRITE_COMMIT_DURATION.observe(time.perf_counter() - started)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        # A failing cache invalidation or notification must not turn a
+        # committed write into an error its caller would retry
+        for func, args in callbacks:
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("After-commit callback %r failed", func)
+
+_lane: Optional[WriteLane] = None
+_lane_lock = threading.Lock()
+
+
+def get_write_lane() -> WriteLane:
+    global _lane
+    if _lane is None:
+        with _lane_lock:
+            if _lane is None:
+                _lane = WriteLane()
+    return _lane
+
+
+def shutdown_write_lane():
+    """
+    Commits the queued writes and stops the writer. Blocks; the app
+    lifespan runs it in a worker thread.
+    """
+    global _lane
+    with _lane_lock:
+        lane, _lane = _lane, None
+    if lane is not None:
+        lane.shutdown()
+
+
+WRITE_QUEUE_DEPTH.set_function(lambda: _lane.depth() if _lane else 0)